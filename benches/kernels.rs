@@ -0,0 +1,250 @@
+//! Criterion benches of the kernels behind the plugins, without python and the
+//! plugin call.
+//!
+//!     cargo bench --features bench
+//!     cargo bench --features bench -- --save-baseline main
+//!     cargo bench --features bench -- --baseline main
+//!
+//! Sizes default to 1e4 and 1e6 rows, `POLARS_QT_BENCH_SIZES=10000,100000000`
+//! changes them. Criterion writes every result as JSON under
+//! `target/criterion`, the throughput is reported in rows per second. The
+//! same cases are benched through polars by `benchmarks/bench_plugins.py`.
+use criterion::{criterion_group, criterion_main, BenchmarkId, Criterion, Throughput};
+use polars::prelude::*;
+use polars_qt::bench::*;
+use tea_strategy::equity::{self, FutureRetKwargs, TickFutureRetKwargs};
+use tea_strategy::tevec::prelude::*;
+use tea_strategy::{BollKwargs, StrategyFilter};
+
+fn sizes() -> Vec<usize> {
+    match std::env::var("POLARS_QT_BENCH_SIZES") {
+        Ok(sizes) => sizes
+            .split(',')
+            .map(|n| n.trim().parse().expect("invalid POLARS_QT_BENCH_SIZES"))
+            .collect(),
+        Err(_) => vec![10_000, 1_000_000],
+    }
+}
+
+/// xorshift64, so that every run benches the same data without a rand dependency
+struct Rng(u64);
+
+impl Rng {
+    fn next_f64(&mut self) -> f64 {
+        self.0 ^= self.0 << 13;
+        self.0 ^= self.0 >> 7;
+        self.0 ^= self.0 << 17;
+        (self.0 >> 11) as f64 / (1u64 << 53) as f64
+    }
+}
+
+struct Data {
+    fac: Float64Chunked,
+    flag: BooleanChunked,
+    signal: Float64Chunked,
+    open: Float64Chunked,
+    close: Float64Chunked,
+    time: Series,
+    n_ask: Int32Chunked,
+    n_bid: Int32Chunked,
+}
+
+impl Data {
+    fn new(n: usize) -> Self {
+        let mut rng = Rng(0x2545_f491_4f6c_dd1d);
+        let mut last = 0.;
+        let fac: Vec<f64> = (0..n)
+            .map(|_| {
+                last += rng.next_f64() - 0.5;
+                last
+            })
+            .collect();
+        let signal: Vec<f64> = (0..n).map(|_| (rng.next_f64() * 3.).floor() - 1.).collect();
+        let open: Vec<f64> = fac.iter().map(|v| 100. + v * 0.01).collect();
+        let close: Vec<f64> = open.iter().map(|v| v + 0.01).collect();
+        let time: Vec<i64> = (0..n as i64).map(|i| i * 500_000_000).collect();
+        let n_ask: Vec<i32> = (0..n).map(|_| 1 + (rng.next_f64() * 49.) as i32).collect();
+        let n_bid: Vec<i32> = (0..n).map(|_| 1 + (rng.next_f64() * 49.) as i32).collect();
+        Data {
+            flag: BooleanChunked::from_iter_values(
+                "flag".into(),
+                fac.windows(2).map(|w| w[1] > w[0]).chain([false]),
+            ),
+            fac: Float64Chunked::from_vec("fac".into(), fac),
+            signal: Float64Chunked::from_vec("signal".into(), signal),
+            open: Float64Chunked::from_vec("open".into(), open),
+            close: Float64Chunked::from_vec("close".into(), close),
+            time: Int64Chunked::from_vec("time".into(), time)
+                .into_datetime(TimeUnit::Nanoseconds, None)
+                .into_series(),
+            n_ask: Int32Chunked::from_vec("n_ask".into(), n_ask),
+            n_bid: Int32Chunked::from_vec("n_bid".into(), n_bid),
+        }
+    }
+}
+
+fn bench_rolling(c: &mut Criterion) {
+    let mut group = c.benchmark_group("rolling");
+    for n in sizes() {
+        let data = Data::new(n);
+        let fac = &data.fac;
+        group.throughput(Throughput::Elements(n as u64));
+        group.bench_with_input(BenchmarkId::new("zscore", n), fac, |b, fac| {
+            b.iter(|| -> Float64Chunked { fac.ts_vzscore(100, None) })
+        });
+        group.bench_with_input(BenchmarkId::new("zscore_multi_window", n), fac, |b, fac| {
+            b.iter(|| {
+                rolling_moments(
+                    fac,
+                    &[20, 60, 120, 240],
+                    None,
+                    &[Stat::Zscore],
+                    &DataType::Float64,
+                )
+            })
+        });
+        group.bench_with_input(BenchmarkId::new("skew", n), fac, |b, fac| {
+            b.iter(|| -> Float64Chunked { fac.ts_vskew(100, None) })
+        });
+        group.bench_with_input(BenchmarkId::new("kurt", n), fac, |b, fac| {
+            b.iter(|| -> Float64Chunked { fac.ts_vkurt(100, None) })
+        });
+        group.bench_with_input(BenchmarkId::new("ewm", n), fac, |b, fac| {
+            b.iter(|| -> Float64Chunked { fac.ts_vewm(100, None) })
+        });
+        // the kernels behind rolling_zscore / skew / kurt / ewm, next to the
+        // tevec kernels above: a single statistic only updates its own
+        // accumulators and should run at the same throughput
+        for (name, stat) in [
+            ("zscore_moments", Stat::Zscore),
+            ("skew_moments", Stat::Skew),
+            ("kurt_moments", Stat::Kurt),
+            ("ewm_moments", Stat::Ewm),
+        ] {
+            group.bench_with_input(BenchmarkId::new(name, n), fac, |b, fac| {
+                b.iter(|| rolling_moments(fac, &[100], None, &[stat], &DataType::Float64))
+            });
+        }
+        group.bench_with_input(BenchmarkId::new("rank_naive", n), fac, |b, fac| {
+            b.iter(|| -> Float64Chunked { fac.ts_vrank(100, None, false, false) })
+        });
+        group.bench_with_input(BenchmarkId::new("rank_tree", n), fac, |b, fac| {
+            b.iter(|| impl_rolling_rank_tree::<_, Float64Type>(fac, 1000, None, false, false))
+        });
+        group.bench_with_input(BenchmarkId::new("fdiff", n), fac, |b, fac| {
+            b.iter(|| -> Float64Chunked { fac.ts_vfdiff(0.5, 100, None) })
+        });
+    }
+    group.finish();
+}
+
+fn bench_funcs(c: &mut Criterion) {
+    let mut group = c.benchmark_group("funcs");
+    let bins = Float64Chunked::from_vec("bins".into(), vec![-10., 0., 10.]);
+    let labels = Float64Chunked::from_vec("labels".into(), vec![1., 2., 3., 4.]);
+    for n in sizes() {
+        let data = Data::new(n);
+        group.throughput(Throughput::Elements(n as u64));
+        group.bench_with_input(BenchmarkId::new("cut", n), &data.fac, |b, fac| {
+            b.iter(|| -> Float64Chunked {
+                fac.titer()
+                    .vcut(&bins, &labels, true, true)
+                    .unwrap()
+                    .try_collect_trusted_vec1()
+                    .unwrap()
+            })
+        });
+        group.bench_with_input(
+            BenchmarkId::new("binary_pattern_vote", n),
+            &data.flag,
+            |b, flag| b.iter(|| impl_binary_pattern_vote(flag, 60, 10, 0.9, 0.5, None).unwrap()),
+        );
+        group.bench_with_input(BenchmarkId::new("tick_up_prob", n), &data, |b, data| {
+            b.iter(|| tick_up_prob_rs(&data.n_ask, &data.n_bid, None, None).unwrap())
+        });
+        let inputs = [
+            data.signal.clone().into_series(),
+            data.time.clone(),
+            data.close.clone().into_series(),
+        ];
+        group.bench_with_input(BenchmarkId::new("to_trades", n), &inputs, |b, inputs| {
+            b.iter(|| to_trades(inputs).unwrap())
+        });
+    }
+    group.finish();
+}
+
+fn bench_strategy(c: &mut Criterion) {
+    let mut group = c.benchmark_group("strategy");
+    // same kwargs as `boll((100, 1.5, 0.2))` in python
+    let kwargs: BollKwargs = serde_json::from_str(
+        r#"{"params": [100, 1.5, 0.2, null], "min_periods": null, "zscore": true,
+            "delay_open": true, "long_signal": 1.0, "short_signal": -1.0, "close_signal": 0.0}"#,
+    )
+    .unwrap();
+    for n in sizes() {
+        let data = Data::new(n);
+        group.throughput(Throughput::Elements(n as u64));
+        group.bench_with_input(BenchmarkId::new("boll", n), &data.fac, |b, fac| {
+            b.iter(|| -> Float64Chunked {
+                tea_strategy::boll(fac, None::<&StrategyFilter<&BooleanChunked>>, &kwargs)
+            })
+        });
+    }
+    group.finish();
+}
+
+fn bench_equity(c: &mut Criterion) {
+    let mut group = c.benchmark_group("equity");
+    // the defaults of `calc_future_ret` / `calc_tick_future_ret` in python
+    let kwargs: FutureRetKwargs = serde_json::from_str(
+        r#"{"init_cash": 10000000, "multiplier": 1, "leverage": 1, "slippage": 0,
+            "c_rate": 0.0003, "blowup": false, "commission_type": "Percent"}"#,
+    )
+    .unwrap();
+    let tick_kwargs: TickFutureRetKwargs = serde_json::from_str(
+        r#"{"init_cash": 10000000, "multiplier": 1, "c_rate": 0.0003, "blowup": false,
+            "commission_type": "Percent", "signal_type": "Percent"}"#,
+    )
+    .unwrap();
+    for n in sizes() {
+        let data = Data::new(n);
+        group.throughput(Throughput::Elements(n as u64));
+        group.bench_with_input(BenchmarkId::new("calc_future_ret", n), &data, |b, data| {
+            b.iter(|| -> Float64Chunked {
+                equity::calc_future_ret(
+                    &data.signal,
+                    &data.open,
+                    &data.close,
+                    None::<&BooleanChunked>,
+                    &kwargs,
+                )
+            })
+        });
+        group.bench_with_input(
+            BenchmarkId::new("calc_tick_future_ret", n),
+            &data,
+            |b, data| {
+                b.iter(|| -> Float64Chunked {
+                    equity::calc_tick_future_ret(
+                        &data.signal,
+                        &data.open,
+                        &data.close,
+                        None::<&BooleanChunked>,
+                        &tick_kwargs,
+                    )
+                })
+            },
+        );
+    }
+    group.finish();
+}
+
+criterion_group!(
+    benches,
+    bench_rolling,
+    bench_funcs,
+    bench_strategy,
+    bench_equity
+);
+criterion_main!(benches);
@@ -0,0 +1,119 @@
+"""
+pytest-benchmark of the plugin expressions on synthetic data.
+
+    pytest benchmarks/bench_plugins.py --benchmark-json=bench.json
+    pytest benchmarks/bench_plugins.py --benchmark-autosave
+    pytest-benchmark compare 0001 0002
+
+Sizes default to 1e4 and 1e6 rows, `POLARS_QT_BENCH_SIZES=10000,100000000`
+changes them. Besides the timings, the JSON stores for every case the rows per
+second and the growth of the peak RSS in MB (linux only) in `extra_info`.
+
+The kernels themselves are benched by criterion (`cargo bench --features
+bench`, see benches/kernels.rs) on the same data, the difference at the same
+size is the cost of the plugin call: expression, FFI and input casts.
+"""
+
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+import pytest
+from zero_copy_memory import peak_rss_mb
+
+import polars_qt as pq
+
+SIZES = [
+    int(n) for n in os.environ.get("POLARS_QT_BENCH_SIZES", "10000,1000000").split(",")
+]
+MEASURE_RSS = Path("/proc/self/clear_refs").exists()
+
+
+@lru_cache(maxsize=1)
+def make_frame(n: int) -> pl.DataFrame:
+    rng = np.random.default_rng(0)
+    walk = rng.standard_normal(n).cumsum()
+    price = 100 + walk * 0.01
+    return pl.DataFrame(
+        {
+            "time": pl.datetime_range(
+                pl.datetime(2024, 1, 1),
+                pl.datetime(2024, 1, 1) + pl.duration(milliseconds=500 * (n - 1)),
+                "500ms",
+                eager=True,
+            ),
+            "fac": walk,
+            "flag": rng.standard_normal(n) > 0,
+            "signal": rng.integers(-1, 2, n).astype(np.float64),
+            "open": price,
+            "close": price + 0.01,
+            "bid": price,
+            "ask": price + 0.01,
+            "n_ask": rng.integers(1, 50, n),
+            "n_bid": rng.integers(1, 50, n),
+        }
+    )
+
+
+CASES = {
+    # rolling
+    "rolling_zscore": lambda: pl.col("fac").qt.rolling_zscore(100),
+    "rolling_zscore_multi": lambda: pl.col("fac").qt.rolling_zscore([20, 60, 120, 240]),
+    "rolling_zscore_by_time": lambda: pl.col("fac").qt.rolling_zscore("5m", by="time"),
+    "rolling_skew": lambda: pl.col("fac").qt.rolling_skew(100),
+    "rolling_kurt": lambda: pl.col("fac").qt.rolling_kurt(100),
+    "rolling_ewm": lambda: pl.col("fac").qt.rolling_ewm(100),
+    "rolling_rank_naive": lambda: pl.col("fac").qt.rolling_rank(100, method="naive"),
+    "rolling_rank_tree": lambda: pl.col("fac").qt.rolling_rank(1000, method="tree"),
+    "rolling_stats": lambda: pl.col("fac").qt.rolling_stats(100),
+    "zscore": lambda: pl.col("fac").qt.zscore(),
+    "fdiff": lambda: pl.col("fac").qt.fdiff(0.5, 100),
+    "cut": lambda: pq.cut(pl.col("fac"), [-10.0, 0.0, 10.0], [1, 2, 3, 4]),
+    "compose_by": lambda: pl.col("fac").diff().qt.compose_by(3),
+    "half_life": lambda: pl.col("fac").qt.half_life(),
+    "binary_pattern_vote": lambda: pl.col("flag").qt.binary_pattern_vote(60, 10),
+    "binary_consecutive_prop": lambda: pl.col("flag").qt.binary_consecutive_prop(10),
+    "tick_up_prob": lambda: pl.col("n_ask").qt.tick_up_prob("n_bid"),
+    # strategies
+    "boll": lambda: pl.col("fac").qt.boll((100, 1.5, 0.2)),
+    "boll_grid": lambda: pl.col("fac").qt.boll_grid([50, 100, 200], [1.0, 1.5, 2.0]),
+    "auto_boll": lambda: pl.col("fac").qt.auto_boll((100, 1.5, 0.2)),
+    "delay_boll": lambda: pl.col("fac").qt.delay_boll((100, 1.5, 0.2, 0.5)),
+    "auto_tangqian": lambda: pl.col("fac").qt.auto_tangqian((100, 1.5, 0.2)),
+    "prob_threshold": lambda: (
+        (pl.col("fac").diff() > 0)
+        .cast(pl.Float64)
+        .qt.prob_threshold((0.6, 0.5, 0.4, 0.5))
+    ),
+    # equity
+    "calc_future_ret": lambda: pl.col("signal").qt.calc_future_ret("open", "close"),
+    "calc_tick_future_ret": lambda: pl.col("signal").qt.calc_tick_future_ret(
+        "bid", "ask"
+    ),
+    "calc_tick_future_ret_full": lambda: pl.col("signal").qt.calc_tick_future_ret_full(
+        "bid", "ask"
+    ),
+    "to_trades": lambda: pl.col("signal").qt.to_trades(time="time", price="close"),
+    "backtest": lambda: pl.col("fac").qt.backtest(
+        "open", "close", strategy_kwargs={"params": (100, 1.5, 0.2)}
+    ),
+}
+
+
+@pytest.mark.parametrize("n", SIZES)
+@pytest.mark.parametrize("case", list(CASES))
+def test_plugin(benchmark, case, n):
+    df = make_frame(n)
+    expr = CASES[case]()
+    benchmark.group = case
+    benchmark.extra_info["rows"] = n
+    if MEASURE_RSS:
+        before = peak_rss_mb(reset=True)
+        df.select(expr)
+        benchmark.extra_info["peak_rss_mb"] = peak_rss_mb() - before
+    benchmark(df.select, expr)
+    # stats is None with --benchmark-disable
+    if benchmark.stats is not None:
+        benchmark.extra_info["rows_per_s"] = n / benchmark.stats.stats.mean
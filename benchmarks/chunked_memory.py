@@ -0,0 +1,63 @@
+"""
+Peak memory of the rolling kernels on inputs with many chunks.
+
+    python benchmarks/chunked_memory.py [n] [chunk_len]
+
+The same column is evaluated once contiguous and once as `n / chunk_len`
+chunks, like a frame concatenated from daily files. Every case runs in a fresh
+process and reports the growth of the peak RSS while evaluating the
+expression. Multi-chunk inputs are read in place (zscore, skew, the tree rank
+of rolling_rank(1000)) or copied one block at a time (fdiff, pattern vote), so
+they should not need more memory than the contiguous column.
+"""
+
+import multiprocessing as mp
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+from zero_copy_memory import peak_rss_mb
+
+import polars_qt
+
+CASES = {
+    "rolling_zscore": lambda: pl.col("a").qt.rolling_zscore(100),
+    "rolling_skew": lambda: pl.col("a").qt.rolling_skew(100),
+    "rolling_rank": lambda: pl.col("a").qt.rolling_rank(1000),
+    "fdiff": lambda: pl.col("a").qt.fdiff(0.5, 100),
+    "binary_pattern_vote": lambda: (pl.col("a") > 0).qt.binary_pattern_vote(60, 10),
+}
+
+
+def run(case: str, path: Path, chunk_len: int) -> float:
+    df = pl.read_ipc(path, memory_map=False)
+    if chunk_len:
+        df = pl.concat(
+            [df.slice(i, chunk_len) for i in range(0, df.height, chunk_len)],
+            rechunk=False,
+        )
+    before = peak_rss_mb(reset=True)
+    df.select(CASES[case]())
+    return peak_rss_mb() - before
+
+
+def main(n: int = 20_000_000, chunk_len: int = 50_000):
+    ctx = mp.get_context("spawn")
+    print(f"n = {n}, {-(-n // chunk_len)} chunks")
+    print(f"{'case':>22} {'contiguous (MB)':>16} {'chunked (MB)':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "data.ipc"
+        rng = np.random.default_rng(0)
+        pl.DataFrame({"a": rng.standard_normal(n).cumsum()}).write_ipc(path)
+        for case in CASES:
+            res = []
+            for chunks in [0, chunk_len]:
+                with ctx.Pool(1) as pool:
+                    res.append(pool.apply(run, (case, path, chunks)))
+            print(f"{case:>22} {res[0]:>16.1f} {res[1]:>14.1f}")
+
+
+if __name__ == "__main__":
+    main(*(int(v) for v in sys.argv[1:]))
@@ -0,0 +1,79 @@
+"""
+Time building plugin expressions with and without the expression cache of
+`register_plugin`.
+
+    python benchmarks/expr_cache.py
+
+For every case the cached column is a cache hit and the uncached column clears
+the cache before each build. The last case passes an arg which is not keyed,
+it shows what the cache costs the expressions that are never cached. The cost
+of the cache key of a boll with filters is printed at the end, next to
+serializing the same args.
+"""
+
+from __future__ import annotations
+
+import time
+
+import polars as pl
+
+import polars_qt
+from polars_qt.utils import _BOOL_LIT, _freeze, _freeze_arg, clear_expr_cache
+
+CASES = {
+    "rolling_zscore": lambda: polars_qt.rolling_zscore("fac", 100),
+    "boll": lambda: polars_qt.boll("fac", (100, 1.5, 0.2)),
+    "boll filters": lambda: polars_qt.boll(
+        "fac", (100, 1.5, 0.2), filters=["flag", True, "flag", False]
+    ),
+    "boll_grid 10x10x10": lambda: polars_qt.boll_grid(
+        "fac", list(range(10, 110, 10)), [1.0 + i / 10 for i in range(10)], [0.1] * 10
+    ),
+    "boll (not keyed)": lambda: polars_qt.boll(pl.col("fac") * 2, (100, 1.5, 0.2)),
+}
+
+
+def timeit(build, *, clear: bool, repeat: int = 2000) -> float:
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            if clear:
+                clear_expr_cache()
+            build()
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best
+
+
+def key_cost(repeat: int = 2000) -> tuple[float, float]:
+    # the args of `boll("fac", filters=["flag", True, "flag", False])`
+    args = [pl.col("fac"), pl.col("flag"), _BOOL_LIT[True], pl.col("flag")]
+    args.append(_BOOL_LIT[False])
+    kwargs = {"params": (100, 1.5, 0.2, None), "min_periods": None, "zscore": True}
+    start = time.perf_counter()
+    for _ in range(repeat):
+        hash((tuple([_freeze_arg(arg) for arg in args]), _freeze(kwargs)))
+    key = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        tuple([arg.meta.serialize(format="binary") for arg in args])
+    serialize = (time.perf_counter() - start) / repeat
+    return key, serialize
+
+
+def main():
+    print(f"{'case':>20} {'cached(us)':>11} {'uncached(us)':>13} {'speedup':>8}")
+    for case, build in CASES.items():
+        cached = timeit(build, clear=False)
+        uncached = timeit(build, clear=True)
+        print(
+            f"{case:>20} {cached * 1e6:>11.1f} {uncached * 1e6:>13.1f}"
+            f" {uncached / cached:>8.1f}"
+        )
+    key, serialize = key_cost()
+    print(f"key of the 5 args of boll: {key * 1e6:.1f}us")
+    print(f"serializing the same args: {serialize * 1e6:.1f}us")
+
+
+if __name__ == "__main__":
+    main()
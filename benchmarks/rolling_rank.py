@@ -0,0 +1,38 @@
+"""
+Compare the naive and tree implementations of `rolling_rank`.
+
+    python benchmarks/rolling_rank.py
+
+The window where the tree gets faster is the crossover used by
+`method="auto"`.
+"""
+
+import time
+
+import numpy as np
+import polars as pl
+
+import polars_qt
+
+
+def timeit(df: pl.DataFrame, window: int, method: str, repeat: int = 3) -> float:
+    expr = pl.col("a").qt.rolling_rank(window, method=method)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df.select(expr)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(n: int = 1_000_000):
+    df = pl.DataFrame({"a": np.random.default_rng(0).standard_normal(n).cumsum()})
+    print(f"{'window':>8} {'naive(s)':>10} {'tree(s)':>10} {'speedup':>8}")
+    for window in [16, 32, 64, 128, 256, 512, 1000, 5000, 20000]:
+        naive = timeit(df, window, "naive")
+        tree = timeit(df, window, "tree")
+        print(f"{window:>8} {naive:>10.4f} {tree:>10.4f} {naive / tree:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Peak memory of the equity kernels for Float32 / integer inputs.
+
+    python benchmarks/zero_copy_memory.py [n]
+
+Every case runs in a fresh process on a frame read back from an IPC file and
+reports the growth of the peak RSS while evaluating the expression. Float32
+prices and an Int32 signal are read in place, so the growth is about the
+Float64 output only; before, the three inputs were first copied to Float64.
+"""
+
+import multiprocessing as mp
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+import polars_qt
+
+CASES = {
+    "calc_future_ret": lambda: pl.col("signal").qt.calc_future_ret("open", "close"),
+    "calc_tick_future_ret": lambda: pl.col("signal").qt.calc_tick_future_ret(
+        "open", "close"
+    ),
+    "backtest": lambda: pl.col("fac").qt.backtest(
+        "open", "close", strategy_kwargs={"params": (20, 1.5)}
+    ),
+}
+
+
+def peak_rss_mb(*, reset: bool = False) -> float:
+    # linux only, writing 5 to clear_refs resets the peak RSS (VmHWM)
+    if reset:
+        Path("/proc/self/clear_refs").write_text("5")
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1]) / 1024
+    raise RuntimeError("VmHWM not found in /proc/self/status")
+
+
+def make_frame(n: int, dtype: str, path: Path):
+    rng = np.random.default_rng(0)
+    price = 100 + rng.standard_normal(n).cumsum() * 0.01
+    if dtype == "float32":
+        price_dtype, signal_dtype = pl.Float32, pl.Int32
+    else:
+        price_dtype, signal_dtype = pl.Float64, pl.Float64
+    pl.DataFrame(
+        {
+            "signal": rng.integers(-1, 2, n),
+            "fac": rng.standard_normal(n),
+            "open": price,
+            "close": price + 0.01,
+        }
+    ).with_columns(
+        pl.col("open", "close").cast(price_dtype), pl.col("signal").cast(signal_dtype)
+    ).write_ipc(path)
+
+
+def run(case: str, path: Path) -> float:
+    df = pl.read_ipc(path, memory_map=False)
+    before = peak_rss_mb(reset=True)
+    df.select(CASES[case]())
+    return peak_rss_mb() - before
+
+
+def main(n: int = 20_000_000):
+    ctx = mp.get_context("spawn")
+    print(f"n = {n}")
+    print(f"{'case':>22} {'float64 (MB)':>14} {'float32 (MB)':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {}
+        for dtype in ["float64", "float32"]:
+            paths[dtype] = Path(tmp) / f"{dtype}.ipc"
+            make_frame(n, dtype, paths[dtype])
+        for case in CASES:
+            res = []
+            for dtype in ["float64", "float32"]:
+                # a new process for each case so that the peak RSS is not shared
+                with ctx.Pool(1) as pool:
+                    res.append(pool.apply(run, (case, paths[dtype])))
+            print(f"{case:>22} {res[0]:>14.1f} {res[1]:>14.1f}")
+
+
+if __name__ == "__main__":
+    main(*(int(v) for v in sys.argv[1:]))
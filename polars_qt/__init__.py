@@ -1,4 +1,108 @@
-from . import qt
-from .equity import *
-from .funcs import *
-from .strategy import *
+"""
+Quant expressions for polars implemented as polars plugins.
+
+The submodules are imported on first use, e.g. `pq.rolling_rank` imports
+`polars_qt.funcs` and `pl.col("a").qt` imports `polars_qt.qt`, so that
+`import polars_qt` costs little more than `import polars`.
+"""
+
+from __future__ import annotations
+
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+import polars as pl
+
+if TYPE_CHECKING:
+    from . import profiling, qt, stream
+    from ._backtest import *
+    from .equity import *
+    from .funcs import *
+    from .strategy import *
+
+_SUBMODULES = {
+    "equity",
+    "funcs",
+    "profiling",
+    "qt",
+    "strategy",
+    "stream",
+    "utils",
+}
+
+_FUNCTIONS = {
+    **dict.fromkeys(["backtest", "expand_param_grid", "walk_forward"], "_backtest"),
+    **dict.fromkeys(
+        [
+            "to_trades",
+            "calc_future_ret",
+            "calc_tick_future_ret",
+            "calc_tick_future_ret_full",
+            "calc_tick_future_ret_book",
+            "calc_tick_future_ret_batched",
+            "calc_tick_future_ret_full_batched",
+        ],
+        "equity",
+    ),
+    **dict.fromkeys(
+        [
+            "rolling_rank",
+            "rolling_skew",
+            "rolling_kurt",
+            "rolling_zscore",
+            "rolling_stats",
+            "zscore",
+            "tick_up_prob",
+            "rolling_ewm",
+            "fdiff",
+            "linspace",
+            "cut",
+            "if_then",
+            "half_life",
+            "compose_by",
+            "to_datetime",
+            "binary_pattern_vote",
+            "binary_consecutive_prop",
+        ],
+        "funcs",
+    ),
+    **dict.fromkeys(
+        [
+            "boll",
+            "boll_grid",
+            "auto_boll",
+            "delay_boll",
+            "martingale",
+            "fix_time",
+            "auto_tangqian",
+            "prob_threshold",
+        ],
+        "strategy",
+    ),
+}
+
+__all__ = sorted(_FUNCTIONS)
+
+
+def __getattr__(name: str):
+    if name in _FUNCTIONS:
+        func = getattr(import_module(f"{__name__}.{_FUNCTIONS[name]}"), name)
+        # cache it, the next lookup does not come back here
+        globals()[name] = func
+        return func
+    if name in _SUBMODULES:
+        return import_module(f"{__name__}.{name}")
+    msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(msg)
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *_SUBMODULES, *_FUNCTIONS])
+
+
+@pl.api.register_expr_namespace("qt")
+def _qt_namespace(expr: pl.Expr):
+    # polars builds the namespace on the first `.qt` of an expression
+    from .qt import ExprQuantExtend
+
+    return ExprQuantExtend(expr)
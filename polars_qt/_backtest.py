@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+from itertools import product
+from typing import TYPE_CHECKING, Any
+
+from polars_qt import strategy as _strategy
+from polars_qt.utils import parse_into_expr, register_plugin
+
+if TYPE_CHECKING:
+    import polars as pl
+    from polars.type_aliases import IntoExpr
+
+
+_STRATEGIES = (
+    "boll",
+    "auto_boll",
+    "delay_boll",
+    "martingale",
+    "fix_time",
+    "auto_tangqian",
+    "prob_threshold",
+)
+
+
+def _equity_config(equity_kwargs: dict[str, Any] | None) -> dict[str, Any]:
+    # kwargs of calc_future_ret with its defaults
+    equity_config = {
+        "init_cash": 10_000_000,
+        "multiplier": 1,
+        "leverage": 1,
+        "slippage": 0,
+        "c_rate": 3e-4,
+        "blowup": False,
+        "commission_type": "Percent",
+    }
+    unknown = set(equity_kwargs or {}) - set(equity_config)
+    if unknown:
+        msg = f"unknown equity_kwargs: {', '.join(sorted(unknown))}"
+        raise ValueError(msg)
+    equity_config.update(equity_kwargs or {})
+    equity_config["init_cash"] = int(equity_config["init_cash"])
+    return equity_config
+
+
+def backtest(
+    fac: IntoExpr,
+    open: IntoExpr,
+    close: IntoExpr,
+    strategy: str = "boll",
+    strategy_kwargs: dict[str, Any] | None = None,
+    equity_kwargs: dict[str, Any] | None = None,
+    *,
+    output: str = "equity",
+    contract_chg_signal: IntoExpr | None = None,
+) -> pl.Expr:
+    """
+    Run a strategy and calculate the future return of its signal in one plugin call.
+    The signal is still computed as a whole Float64 column inside the plugin, as the
+    strategies of tea_strategy only run over a whole series, but it never leaves the
+    plugin and is not returned to polars as a separate expression.
+    fac: factor of the strategy
+    open: open price series, see calc_future_ret
+    close: close price series, see calc_future_ret
+    strategy: boll | auto_boll | delay_boll | martingale | fix_time | auto_tangqian | prob_threshold
+    strategy_kwargs: keyword arguments of the strategy function, e.g. {"params": (20, 1)}
+    equity_kwargs: keyword arguments of calc_future_ret, slippage should be a float
+    output:
+        equity: equity curve
+        ret: return of each bar
+        final: final equity only
+        both: struct of equity and ret
+        stats: single row struct of summary statistics, see calc_future_ret(summary=True)
+    contract_chg_signal: signal to change contract, series of boolean dtype
+    """
+    if strategy not in _STRATEGIES:
+        msg = f"strategy {strategy} is not supported"
+        raise ValueError(msg)
+    equity_config = _equity_config(equity_kwargs)
+    strategy_args, strategy_kwargs = getattr(_strategy, strategy).inputs(
+        fac, **(strategy_kwargs or {})
+    )
+    args = [*strategy_args, parse_into_expr(open), parse_into_expr(close)]
+    if contract_chg_signal is not None:
+        args.append(parse_into_expr(contract_chg_signal))
+    return register_plugin(
+        args=args,
+        kwargs={
+            "strategy_kwargs": strategy_kwargs,
+            "equity_kwargs": equity_config,
+            "has_filters": len(strategy_args) == 5,
+            "has_contract_chg_signal": contract_chg_signal is not None,
+            "output": output,
+        },
+        symbol=f"backtest_{strategy}",
+        is_elementwise=False,
+        returns_scalar=output in ("final", "stats"),
+    )
+
+
+def expand_param_grid(
+    param_grid: dict[str, list] | list[dict[str, Any]],
+) -> list[dict[str, Any]]:
+    """
+    The combos of a param grid in the order used by `walk_forward`.
+    A dict of lists is expanded to their product, in the order of the keys,
+    a list of dicts is returned as it is.
+    """
+    if isinstance(param_grid, dict):
+        keys = list(param_grid)
+        return [dict(zip(keys, values)) for values in product(*param_grid.values())]
+    return list(param_grid)
+
+
+def walk_forward(
+    fac: IntoExpr,
+    open: IntoExpr,
+    close: IntoExpr,
+    strategy: str = "boll",
+    param_grid: dict[str, list] | list[dict[str, Any]] | None = None,
+    train_len: int = 2000,
+    test_len: int = 500,
+    metric: str = "sharpe",
+    *,
+    strategy_kwargs: dict[str, Any] | None = None,
+    equity_kwargs: dict[str, Any] | None = None,
+    expanding: bool = False,
+) -> pl.Expr:
+    """
+    Walk forward optimization of a strategy in one plugin call.
+    Each fold searches the param grid on `train_len` rows, by the metric of
+    calc_future_ret on these rows, and keeps the signal of the best params on
+    the next `test_len` rows, then the folds move forward by `test_len` rows.
+    Every combo runs once over the whole input, so its state carries over
+    from one fold to the next, and the combos run in parallel. The folds are
+    scored as the equity is computed and only the test windows of the best
+    combos are kept.
+    fac: factor of the strategy
+    open: open price series, see calc_future_ret
+    close: close price series, see calc_future_ret
+    strategy: boll | auto_boll | delay_boll | martingale | fix_time | auto_tangqian | prob_threshold
+    param_grid: strategy kwargs to search, a dict of lists whose product is
+        searched, e.g. {"params": [(20, 1.0), (40, 1.5)]}, or a list of dicts
+    train_len: rows of a train window
+    test_len: rows of a test window
+    metric: sharpe | total_ret | max_drawdown (the lowest is the best)
+    strategy_kwargs: strategy kwargs shared by all the combos, e.g. filters
+    equity_kwargs: keyword arguments of calc_future_ret, slippage should be a float
+    expanding: the train windows all start at the first row
+
+    return a struct of
+        signal: the stitched out of sample signal, null before the first test
+            window and in the folds where no params has a metric
+        combo: index of the params selected for the fold in
+            `expand_param_grid(param_grid)`
+    """
+    if strategy not in _STRATEGIES:
+        msg = f"strategy {strategy} is not supported"
+        raise ValueError(msg)
+    combos = expand_param_grid(param_grid or {})
+    assert combos, "param_grid should not be empty"
+    func = getattr(_strategy, strategy).inputs
+    strategy_args = None
+    combo_kwargs = []
+    for combo in combos:
+        args, kwargs = func(fac, **(strategy_kwargs or {}), **combo)
+        strategy_args = strategy_args or args
+        # the inputs of the plugin are shared by all the combos
+        if len(args) != len(strategy_args) or not all(
+            a.meta.eq(b) for a, b in zip(args, strategy_args)
+        ):
+            msg = "filters and time_col can not be searched by walk_forward"
+            raise ValueError(msg)
+        combo_kwargs.append(kwargs)
+    return register_plugin(
+        args=[*strategy_args, parse_into_expr(open), parse_into_expr(close)],
+        kwargs={
+            "combos": combo_kwargs,
+            "equity_kwargs": _equity_config(equity_kwargs),
+            "has_filters": len(strategy_args) == 5,
+            "train_len": train_len,
+            "test_len": test_len,
+            "expanding": expanding,
+            "metric": metric,
+        },
+        symbol=f"walk_forward_{strategy}",
+        is_elementwise=False,
+    )
@@ -2,10 +2,14 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-from polars_qt.utils import parse_into_expr, register_plugin
+import polars as pl
+
+from polars_qt.utils import _register_plugin, parse_into_expr, register_plugin
 
 if TYPE_CHECKING:
-    import polars as pl
+    from collections.abc import Iterator
+    from pathlib import Path
+
     from polars.type_aliases import IntoExpr
 
 
@@ -41,6 +45,9 @@ def calc_future_ret(
     blowup: bool = False,
     commission_type: str = "Percent",
     contract_chg_signal: IntoExpr | None = None,
+    summary: bool = False,
+    by: IntoExpr | None = None,
+    portfolio: bool = False,
 ) -> pl.Expr:
     """
     Calculate future return.
@@ -62,10 +69,36 @@ def calc_future_ret(
         percent: percent | pct
         absolute: absolute | fixed | fix
     contract_chg_signal: signal to change contract, series of boolean dtype
+    summary: only return a single row struct of final_equity, total_ret, sharpe,
+        max_drawdown, turnover and trade_count instead of the equity series
+    by: symbol column of a panel, all the symbols are calculated in one parallel
+        call. multiplier and c_rate can then also be a dict of symbol to value or
+        a column, which must be constant within each symbol
+    portfolio: only used with by, return a struct of equity and portfolio, the sum
+        of the latest equity of all the symbols in row order (rows should be
+        sorted by time)
     """
     open = parse_into_expr(open)
     close = parse_into_expr(close)
     signal = parse_into_expr(signal)
+    if by is not None:
+        assert not summary, "summary is not supported with by"
+        return _calc_future_ret_panel(
+            signal,
+            open,
+            close,
+            by,
+            is_signal=is_signal,
+            init_cash=init_cash,
+            multiplier=multiplier,
+            leverage=leverage,
+            slippage=slippage,
+            c_rate=c_rate,
+            blowup=blowup,
+            commission_type=commission_type,
+            contract_chg_signal=contract_chg_signal,
+            portfolio=portfolio,
+        )
     pos = signal.shift(fill_value=0) if is_signal else signal
     base_config = {
         "init_cash": int(init_cash),
@@ -84,9 +117,10 @@ def calc_future_ret(
             args.append(parse_into_expr(contract_chg_signal))
         return register_plugin(
             args=args,
-            symbol="calc_future_ret",
+            symbol="calc_future_ret_stats" if summary else "calc_future_ret",
             is_elementwise=False,
             kwargs=base_config,
+            returns_scalar=summary,
         )
     else:
         slippage = parse_into_expr(slippage)
@@ -95,12 +129,66 @@ def calc_future_ret(
             args.append(parse_into_expr(contract_chg_signal))
         return register_plugin(
             args=args,
-            symbol="calc_future_ret_with_spread",
+            symbol="calc_future_ret_with_spread_stats"
+            if summary
+            else "calc_future_ret_with_spread",
             is_elementwise=False,
             kwargs=base_config,
+            returns_scalar=summary,
         )
 
 
+def _calc_future_ret_panel(
+    signal: pl.Expr,
+    open: pl.Expr,
+    close: pl.Expr,
+    by: IntoExpr,
+    *,
+    is_signal: bool,
+    init_cash: int,
+    multiplier: float | IntoExpr | dict,
+    leverage: float,
+    slippage: float,
+    c_rate: float | IntoExpr | dict,
+    blowup: bool,
+    commission_type: str,
+    contract_chg_signal: IntoExpr | None,
+    portfolio: bool,
+) -> pl.Expr:
+    from numbers import Number
+
+    assert isinstance(slippage, Number), "slippage should be a number with by"
+    by = parse_into_expr(by)
+    pos = signal.shift(fill_value=0).over(by) if is_signal else signal
+
+    def symbol_config(value):
+        if isinstance(value, dict):
+            return by.replace_strict(value, return_dtype=pl.Float64)
+        if isinstance(value, Number):
+            return pl.lit(float(value))
+        return parse_into_expr(value)
+
+    args = [by, pos, open, close, symbol_config(multiplier), symbol_config(c_rate)]
+    if contract_chg_signal is not None:
+        args.append(parse_into_expr(contract_chg_signal))
+    equity_kwargs = {
+        "init_cash": int(init_cash),
+        # placeholders, the values of each symbol are taken from the inputs
+        "multiplier": 1.0,
+        "c_rate": 0.0,
+        "leverage": leverage,
+        "slippage": slippage,
+        "blowup": blowup,
+        "commission_type": commission_type,
+    }
+    return register_plugin(
+        args=args,
+        symbol="calc_future_ret_panel",
+        is_elementwise=False,
+        kwargs={"equity_kwargs": equity_kwargs, "portfolio": portfolio},
+    )
+
+
 def calc_tick_future_ret(
     signal: IntoExpr,
     bid: IntoExpr,
@@ -114,6 +202,7 @@ def calc_tick_future_ret(
     commission_type: str = "Percent",
     signal_type: str = "Percent",
     contract_chg_signal: IntoExpr | None = None,
+    summary: bool = False,
 ) -> pl.Expr:
     """
     Calculate future return with tick data.
@@ -136,6 +225,8 @@ def calc_tick_future_ret(
         percent: percent | pct
         absolute: absolute | fixed | fix
     contract_chg_signal: signal to change contract, series of boolean dtype
+    summary: only return a single row struct of final_equity, total_ret, sharpe,
+        max_drawdown, turnover and trade_count instead of the equity series
     """
     bid = parse_into_expr(bid)
     ask = parse_into_expr(ask)
@@ -156,9 +247,10 @@ def calc_tick_future_ret(
         args.append(parse_into_expr(contract_chg_signal))
     return register_plugin(
         args=args,
-        symbol="calc_tick_future_ret",
+        symbol="calc_tick_future_ret_stats" if summary else "calc_tick_future_ret",
         is_elementwise=False,
         kwargs=kwargs,
+        returns_scalar=summary,
     )
 
 
@@ -221,3 +313,218 @@ def calc_tick_future_ret_full(
         is_elementwise=False,
         kwargs=kwargs,
     )
+
+
+def calc_tick_future_ret_batched(
+    source: str | Path | pl.DataFrame,
+    signal: str,
+    bid: str,
+    ask: str,
+    *,
+    batch_size: int = 1_000_000,
+    is_signal: bool = True,
+    init_cash: int = 10_000_000,
+    multiplier: int = 1,
+    c_rate: float = 3e-4,
+    blowup: bool = False,
+    commission_type: str = "Percent",
+    signal_type: str = "Percent",
+    contract_chg_signal: str | None = None,
+) -> Iterator[pl.DataFrame]:
+    """
+    calc_tick_future_ret over an Arrow IPC (Feather) file or a DataFrame,
+    batch by batch.
+
+    The file is memory mapped once and sliced `batch_size` rows at a time,
+    a slice does not copy the data. The cash and position left by a batch
+    are carried to the next one, so the memory of the output depends on the
+    batch size rather than the length of the history.
+    Every batch yields a frame of one column named `signal`, the batches
+    concatenated are the same as calc_tick_future_ret over the whole data.
+
+        batches = calc_tick_future_ret_batched("ticks.feather", "signal", "bid1", "ask1")
+        for out in batches:
+            ...
+
+    source: path of an uncompressed IPC file, or a DataFrame
+    signal: column name of the signal
+    bid: column name of the bid1 price
+    ask: column name of the ask1 price
+    batch_size: rows of a batch
+    contract_chg_signal: column name of the contract change signal
+    the other arguments are the same as calc_tick_future_ret
+    """
+    kwargs = {
+        "init_cash": int(init_cash),
+        "multiplier": multiplier,
+        "c_rate": c_rate,
+        "blowup": blowup,
+        "commission_type": commission_type,
+        "signal_type": signal_type,
+    }
+    yield from _tick_batches(
+        source,
+        [signal, bid, ask, contract_chg_signal],
+        symbol="calc_tick_future_ret_batch",
+        kwargs=kwargs,
+        batch_size=batch_size,
+        is_signal=is_signal,
+    )
+
+
+def calc_tick_future_ret_full_batched(
+    source: str | Path | pl.DataFrame,
+    signal: str,
+    bid: str,
+    ask: str,
+    *,
+    batch_size: int = 1_000_000,
+    is_signal: bool = True,
+    init_cash: int = 0,
+    multiplier: int = 1,
+    c_rate: float = 3e-4,
+    blowup: bool = False,
+    commission_type: str = "Percent",
+    open_price_method: str = "average",
+    contract_chg_signal: str | None = None,
+) -> Iterator[pl.DataFrame]:
+    """
+    calc_tick_future_ret_full over an Arrow IPC (Feather) file or a DataFrame,
+    batch by batch, see calc_tick_future_ret_batched. Every batch yields a
+    frame of one struct column named `signal`.
+    """
+    kwargs = {
+        "init_cash": int(init_cash),
+        "multiplier": multiplier,
+        "c_rate": c_rate,
+        "blowup": blowup,
+        "commission_type": commission_type,
+        "signal_type": "absolute",
+        "open_price_method": open_price_method,
+    }
+    yield from _tick_batches(
+        source,
+        [signal, bid, ask, contract_chg_signal],
+        symbol="calc_tick_future_ret_full_batch",
+        kwargs=kwargs,
+        batch_size=batch_size,
+        is_signal=is_signal,
+    )
+
+
+def _tick_batches(
+    source: str | Path | pl.DataFrame,
+    columns: list[str | None],
+    *,
+    symbol: str,
+    kwargs: dict,
+    batch_size: int,
+    is_signal: bool,
+) -> Iterator[pl.DataFrame]:
+    assert batch_size > 0, "batch_size should be positive"
+    columns = [c for c in columns if c is not None]
+    signal = columns[0]
+    if isinstance(source, pl.DataFrame):
+        df = source.select(columns)
+    else:
+        df = pl.read_ipc(source, columns=columns, memory_map=True)
+    # the signal of a position series is the position of the next row, so
+    # one more row is read to shift it across the end of the batch
+    extra = 0 if is_signal else 1
+    args = [pl.col(c) for c in columns]
+    # the plugins keep the account left by a batch under the id of the run,
+    # the python module shares it as it is the same library. The account is
+    # dropped when the run is closed or freed, also if the iterator is left
+    # before its last batch.
+    from . import polars_qt as lib
+
+    with lib._TickBatchRun() as run:
+        # the run id differs in every run, the expressions are not cached
+        expr = _register_plugin(
+            args=args,
+            symbol=symbol,
+            is_elementwise=False,
+            kwargs={"run_id": run.id, "equity_kwargs": kwargs},
+        )
+        for offset in range(0, df.height, batch_size):
+            batch = df.slice(offset, batch_size + extra)
+            if not is_signal:
+                position = pl.col(signal).shift(-1, fill_value=0)
+                batch = batch.with_columns(position).head(batch_size)
+            yield batch.select(expr)
+
+
+def calc_tick_future_ret_book(
+    signal: IntoExpr,
+    bid: list[IntoExpr],
+    bid_vol: list[IntoExpr],
+    ask: list[IntoExpr],
+    ask_vol: list[IntoExpr],
+    *,
+    is_signal: bool = True,
+    init_cash: int = 0,
+    multiplier: int = 1,
+    c_rate: float = 3e-4,
+    blowup: bool = False,
+    commission_type: str = "Percent",
+    open_price_method: str = "average",
+    order_type: str = "market",
+    contract_chg_signal: IntoExpr | None = None,
+) -> pl.Expr:
+    """
+    Calculate future return with L1-L5 order book snapshots, the output is the
+    same profit struct as calc_tick_future_ret_full.
+    signal: lot_num signal to trade
+    bid: bid prices from level 1
+    bid_vol: bid volumes from level 1
+    ask: ask prices from level 1
+    ask_vol: ask volumes from level 1
+    is_signal: signal series is signal or position series, position series is signal series shift 1
+    init_cash: initial cash
+    multiplier: contract multiplier
+    c_rate: commission rate
+    blowup: whether to stop trading once init_cash plus the profit is below 0,
+        the following ticks show an unrealized profit of 0 as in
+        calc_tick_future_ret_full
+    commission_type: commission type, Percent or Absolute
+        percent: percent | pct
+        absolute: absolute | fixed | fix
+    open_price_method: first | last | average
+    order_type:
+        market: walk the visible depth, the lots beyond the depth are sent
+            again at the next tick. The depth taken at a tick is not removed
+            from the next snapshot.
+        limit: rest at the best price of own side and wait in the queue, the
+            decrease of the level volume is treated as trades ahead of the order
+    contract_chg_signal: signal to change contract, series of boolean dtype. The
+        position is closed on the book of that tick and opened again from the
+        next tick
+    """
+    levels = len(bid)
+    assert levels > 0, "at least one level is needed"
+    assert all(len(side) == levels for side in (bid_vol, ask, ask_vol)), (
+        "bid, bid_vol, ask and ask_vol must have the same number of levels"
+    )
+    signal = parse_into_expr(signal)
+    # cast pos to signal if signal is pos
+    signal = signal.shift(-1, fill_value=0) if not is_signal else signal
+    args = [signal] + [
+        parse_into_expr(e) for side in (bid, bid_vol, ask, ask_vol) for e in side
+    ]
+    if contract_chg_signal is not None:
+        args.append(parse_into_expr(contract_chg_signal))
+    return register_plugin(
+        args=args,
+        symbol="calc_tick_future_ret_book",
+        is_elementwise=False,
+        kwargs={
+            "init_cash": int(init_cash),
+            "multiplier": multiplier,
+            "c_rate": c_rate,
+            "blowup": blowup,
+            "commission_type": commission_type,
+            "open_price_method": open_price_method,
+            "order_type": order_type,
+            "levels": levels,
+        },
+    )
@@ -4,7 +4,7 @@ from typing import TYPE_CHECKING
 
 import polars as pl
 
-from polars_qt.utils import parse_into_expr, register_plugin
+from polars_qt.utils import parse_duration, parse_into_expr, register_plugin
 
 if TYPE_CHECKING:
     from datetime import datetime
@@ -12,12 +12,92 @@ if TYPE_CHECKING:
     from polars.type_aliases import IntoExpr
 
 
+def _output_dtype(dtype) -> str:
+    assert dtype in (pl.Float32, pl.Float64), (
+        "output_dtype should be Float32 or Float64"
+    )
+    return "float32" if dtype == pl.Float32 else "float64"
+
+
+def _window(window, min_periods):
+    # several windows give a struct, min_periods then defaults to window // 2
+    # of each window on the rust side
+    if isinstance(window, (list, tuple)):
+        if len(window) == 0:
+            msg = "window should not be empty"
+            raise ValueError(msg)
+        # a repeated window would give a repeated field name
+        return list(dict.fromkeys(window)), min_periods
+    if min_periods is None:
+        min_periods = window // 2
+    return window, min_periods
+
+
+def _rolling_by(
+    expr: pl.Expr,
+    by: IntoExpr,
+    window,
+    stats: list[str],
+    min_periods=None,
+    pct=False,
+    rev=False,
+    output_dtype=pl.Float64,
+) -> pl.Expr:
+    # the window is (t - window, t] of the sorted Date / Datetime column `by`
+    assert not isinstance(window, (list, tuple)), "by supports a single window"
+    return register_plugin(
+        args=[expr, parse_into_expr(by)],
+        kwargs={
+            "period": parse_duration(window),
+            "min_periods": min_periods,
+            "stats": stats,
+            "pct": pct,
+            "rev": rev,
+            "output_dtype": _output_dtype(output_dtype),
+        },
+        symbol="rolling_stats_by",
+        is_elementwise=False,
+    )
+
+
 def rolling_rank(
-    expr: IntoExpr, window, min_periods=None, pct=False, rev=False
+    expr: IntoExpr,
+    window,
+    min_periods=None,
+    pct=False,
+    rev=False,
+    method="auto",
+    output_dtype=pl.Float64,
+    by: IntoExpr | None = None,
 ) -> pl.Expr:
+    """
+    Rolling rank of the last value in the window
+    window: int, or a list of ints for a struct with a field per window,
+        repeated windows are computed once
+    by: a sorted Date / Datetime column, the window is then a duration such as
+        "5m" and covers the rows in (t - window, t], min_periods defaults to 1
+    method: "naive" scans the window for each value, "tree" uses an order
+        statistics tree which is O(log n) per value, "auto" uses the tree for
+        large windows
+    output_dtype: Float64 or Float32, the rank is computed in f64 either way
+    """
     expr = parse_into_expr(expr)
-    if min_periods is None:
-        min_periods = window // 2
+    if by is not None:
+        return (
+            _rolling_by(
+                expr,
+                by,
+                window,
+                ["rank"],
+                min_periods,
+                pct=pct,
+                rev=rev,
+                output_dtype=output_dtype,
+            )
+            .struct.field("rank")
+            .name.keep()
+        )
+    window, min_periods = _window(window, min_periods)
     return register_plugin(
         args=[expr],
         kwargs={
@@ -25,44 +105,151 @@ def rolling_rank(
             "min_periods": min_periods,
             "pct": pct,
             "rev": rev,
+            "method": method,
+            "output_dtype": _output_dtype(output_dtype),
         },
         symbol="rolling_rank",
         is_elementwise=False,
     )
 
 
-def rolling_skew(expr: IntoExpr, window, min_periods=None) -> pl.Expr:
+def rolling_skew(
+    expr: IntoExpr,
+    window,
+    min_periods=None,
+    output_dtype=pl.Float64,
+    by: IntoExpr | None = None,
+) -> pl.Expr:
+    """
+    Rolling skew of the window
+    window: int, or a list of ints for a struct with a field per window,
+        repeated windows are computed once
+    by: a sorted Date / Datetime column, the window is then a duration such as
+        "5m" and covers the rows in (t - window, t], min_periods defaults to 1
+    output_dtype: Float64 or Float32, accumulators are f64 either way
+    """
     expr = parse_into_expr(expr)
-    if min_periods is None:
-        min_periods = window // 2
+    if by is not None:
+        return (
+            _rolling_by(
+                expr, by, window, ["skew"], min_periods, output_dtype=output_dtype
+            )
+            .struct.field("skew")
+            .name.keep()
+        )
+    window, min_periods = _window(window, min_periods)
     return register_plugin(
         args=[expr],
         kwargs={
             "window": window,
             "min_periods": min_periods,
+            "output_dtype": _output_dtype(output_dtype),
         },
         symbol="rolling_skew",
         is_elementwise=False,
     )
 
 
-def rolling_kurt(expr: IntoExpr, window, min_periods=None) -> pl.Expr:
+def rolling_kurt(
+    expr: IntoExpr,
+    window,
+    min_periods=None,
+    output_dtype=pl.Float64,
+    by: IntoExpr | None = None,
+) -> pl.Expr:
+    """
+    Rolling kurtosis of the window
+    window: int, or a list of ints for a struct with a field per window,
+        repeated windows are computed once
+    by: a sorted Date / Datetime column, the window is then a duration such as
+        "5m" and covers the rows in (t - window, t], min_periods defaults to 1
+    output_dtype: Float64 or Float32, accumulators are f64 either way
+    """
     expr = parse_into_expr(expr)
-    if min_periods is None:
-        min_periods = window // 2
+    if by is not None:
+        return (
+            _rolling_by(
+                expr, by, window, ["kurt"], min_periods, output_dtype=output_dtype
+            )
+            .struct.field("kurt")
+            .name.keep()
+        )
+    window, min_periods = _window(window, min_periods)
     return register_plugin(
         args=[expr],
         kwargs={
             "window": window,
             "min_periods": min_periods,
+            "output_dtype": _output_dtype(output_dtype),
         },
         symbol="rolling_kurt",
         is_elementwise=False,
     )
 
 
-def rolling_zscore(expr: IntoExpr, window, min_periods=None) -> pl.Expr:
+def rolling_zscore(
+    expr: IntoExpr,
+    window,
+    min_periods=None,
+    output_dtype=pl.Float64,
+    by: IntoExpr | None = None,
+) -> pl.Expr:
+    """
+    Rolling zscore of the window
+    window: int, or a list of ints for a struct with a field per window,
+        repeated windows are computed once
+    by: a sorted Date / Datetime column, the window is then a duration such as
+        "5m" and covers the rows in (t - window, t], min_periods defaults to 1
+    output_dtype: Float64 or Float32, accumulators are f64 either way
+    """
     expr = parse_into_expr(expr)
+    if by is not None:
+        return (
+            _rolling_by(
+                expr, by, window, ["zscore"], min_periods, output_dtype=output_dtype
+            )
+            .struct.field("zscore")
+            .name.keep()
+        )
+    window, min_periods = _window(window, min_periods)
+    return register_plugin(
+        args=[expr],
+        kwargs={
+            "window": window,
+            "min_periods": min_periods,
+            "output_dtype": _output_dtype(output_dtype),
+        },
+        symbol="rolling_zscore",
+        is_elementwise=False,
+    )
+
+
+def rolling_stats(
+    expr: IntoExpr,
+    window,
+    stats=("mean", "std", "skew", "kurt", "zscore", "rank"),
+    min_periods=None,
+    pct=False,
+    output_dtype=pl.Float64,
+    by: IntoExpr | None = None,
+) -> pl.Expr:
+    """
+    Several rolling statistics of the same window in one plugin call, the result
+    is a struct with a field for each statistic
+    stats: mean | std | skew | kurt | zscore | ewm | rank, the moment statistics
+        share their accumulators and are computed in a single pass
+    pct: return the rank divided by the number of valid values
+    output_dtype: Float64 or Float32
+    by: a sorted Date / Datetime column, the window is then a duration such as
+        "5m", ewm is not supported, see `rolling_zscore`
+    """
+    expr = parse_into_expr(expr)
+    stats = [stats] if isinstance(stats, str) else list(stats)
+    assert len(set(stats)) == len(stats), "stats should not contain duplicates"
+    if by is not None:
+        return _rolling_by(
+            expr, by, window, stats, min_periods, pct=pct, output_dtype=output_dtype
+        )
     if min_periods is None:
         min_periods = window // 2
     return register_plugin(
@@ -70,8 +257,11 @@ def rolling_zscore(expr: IntoExpr, window, min_periods=None) -> pl.Expr:
         kwargs={
             "window": window,
             "min_periods": min_periods,
+            "stats": stats,
+            "pct": pct,
+            "output_dtype": _output_dtype(output_dtype),
         },
-        symbol="rolling_zscore",
+        symbol="rolling_stats",
         is_elementwise=False,
     )
 
@@ -88,28 +278,44 @@ def zscore(expr: IntoExpr, min_periods=None) -> pl.Expr:
     )
 
 
-def tick_up_prob(n_ask: IntoExpr, n_bid: IntoExpr, degree=None) -> pl.Expr:
+def tick_up_prob(n_ask: IntoExpr, n_bid: IntoExpr, degree=None, tol=None) -> pl.Expr:
+    """
+    Probability that the next mid price move is up given the queue sizes
+    degree: number of points of the midpoint quadrature, default 1_000_000
+    tol: if set, use adaptive quadrature with this absolute error tolerance
+        instead of a fixed degree
+    Results of integer queue sizes are cached and reused across calls.
+    """
     n_ask = parse_into_expr(n_ask)
     n_bid = parse_into_expr(n_bid)
     return register_plugin(
         args=[n_ask, n_bid],
         kwargs={
             "degree": degree,
+            "tol": tol,
         },
         symbol="tick_up_prob",
         is_elementwise=True,
     )
 
 
-def rolling_ewm(expr: IntoExpr, window, min_periods=None) -> pl.Expr:
+def rolling_ewm(
+    expr: IntoExpr, window, min_periods=None, output_dtype=pl.Float64
+) -> pl.Expr:
+    """
+    Rolling exponentially weighted mean of the window
+    window: int, or a list of ints for a struct with a field per window,
+        repeated windows are computed once
+    output_dtype: Float64 or Float32, accumulators are f64 either way
+    """
     expr = parse_into_expr(expr)
-    if min_periods is None:
-        min_periods = window // 2
+    window, min_periods = _window(window, min_periods)
     return register_plugin(
         args=[expr],
         kwargs={
             "window": window,
             "min_periods": min_periods,
+            "output_dtype": _output_dtype(output_dtype),
         },
         symbol="rolling_ewm",
         is_elementwise=False,
@@ -0,0 +1,85 @@
+"""
+Opt-in profiling of the plugin calls.
+
+    import polars_qt as pq
+    pq.profiling.enable()
+    df.select(pl.col("fac").qt.rolling_zscore(100), ...)
+    pq.profiling.stats()
+
+or set `POLARS_QT_PROFILE=1` in the environment before the first plugin call.
+For every plugin symbol the stats are the number of calls, the input rows, the
+wall time, the estimated size of the outputs (`est_output_bytes`, the size of
+the returned series, not the memory allocated by the plugin) and how many
+inputs were cast to another dtype or copied into contiguous blocks. The casts and copies made on
+the polars thread pool inside a plugin are not counted.
+
+When profiling is off a plugin call only reads one flag.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+import polars as pl
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+SCHEMA = {
+    "symbol": pl.String,
+    "calls": pl.UInt64,
+    "rows": pl.UInt64,
+    "time_s": pl.Float64,
+    "est_output_bytes": pl.UInt64,
+    "casts": pl.UInt64,
+    "copies": pl.UInt64,
+}
+
+
+def _lib():
+    # the plugins are loaded by polars, the python module is only needed here
+    from . import polars_qt
+
+    return polars_qt
+
+
+def enable() -> None:
+    """Start recording the plugin calls."""
+    _lib()._profiling_set_enabled(True)
+
+
+def disable() -> None:
+    """Stop recording, the stats recorded so far are kept."""
+    _lib()._profiling_set_enabled(False)
+
+
+def reset() -> None:
+    """Drop the stats recorded so far."""
+    _lib()._profiling_reset()
+
+
+def stats() -> pl.DataFrame:
+    """Stats of every plugin called since the last reset, slowest first."""
+    rows = [
+        (symbol, calls, n, nanos / 1e9, size, casts, copies)
+        for symbol, calls, n, nanos, size, casts, copies in _lib()._profiling_stats()
+    ]
+    return pl.DataFrame(rows, schema=SCHEMA, orient="row").sort(
+        "time_s", descending=True
+    )
+
+
+@contextmanager
+def profile() -> Iterator[None]:
+    """
+    Record the plugin calls made in the block only.
+
+    The stats are reset on entry, read them with `stats()` after the block.
+    """
+    reset()
+    enable()
+    try:
+        yield
+    finally:
+        disable()
@@ -4,9 +4,11 @@ from functools import wraps
 
 import polars as pl
 
+from ._backtest import backtest, walk_forward
 from .equity import (
     calc_future_ret,
     calc_tick_future_ret,
+    calc_tick_future_ret_book,
     calc_tick_future_ret_full,
     to_trades,
 )
@@ -15,30 +17,75 @@ from .strategy import (
     auto_boll,
     auto_tangqian,
     boll,
+    boll_grid,
     delay_boll,
     fix_time,
     prob_threshold,
 )
 
 
-@pl.api.register_expr_namespace("qt")
 class ExprQuantExtend:
+    """The `qt` namespace of expressions, registered by `polars_qt/__init__.py`."""
+
     def __init__(self, expr: pl.Expr):
         self.expr = expr
 
-    def rolling_rank(self, window, min_periods=None, pct=False, rev=False) -> pl.Expr:
+    def rolling_rank(
+        self,
+        window,
+        min_periods=None,
+        pct=False,
+        rev=False,
+        method="auto",
+        output_dtype=pl.Float64,
+        by=None,
+    ) -> pl.Expr:
         return rolling_rank(
-            self.expr, window=window, min_periods=min_periods, pct=pct, rev=rev
+            self.expr,
+            window=window,
+            min_periods=min_periods,
+            pct=pct,
+            rev=rev,
+            method=method,
+            output_dtype=output_dtype,
+            by=by,
         )
 
-    def rolling_skew(self, window, min_periods=None) -> pl.Expr:
-        return rolling_skew(self.expr, window=window, min_periods=min_periods)
+    def rolling_skew(
+        self, window, min_periods=None, output_dtype=pl.Float64, by=None
+    ) -> pl.Expr:
+        return rolling_skew(
+            self.expr,
+            window=window,
+            min_periods=min_periods,
+            output_dtype=output_dtype,
+            by=by,
+        )
 
-    def rolling_kurt(self, window, min_periods=None) -> pl.Expr:
-        return rolling_kurt(self.expr, window=window, min_periods=min_periods)
+    def rolling_kurt(
+        self, window, min_periods=None, output_dtype=pl.Float64, by=None
+    ) -> pl.Expr:
+        return rolling_kurt(
+            self.expr,
+            window=window,
+            min_periods=min_periods,
+            output_dtype=output_dtype,
+            by=by,
+        )
+
+    def rolling_zscore(
+        self, window, min_periods=None, output_dtype=pl.Float64, by=None
+    ) -> pl.Expr:
+        return rolling_zscore(
+            self.expr,
+            window=window,
+            min_periods=min_periods,
+            output_dtype=output_dtype,
+            by=by,
+        )
 
-    def rolling_zscore(self, window, min_periods=None) -> pl.Expr:
-        return rolling_zscore(self.expr, window=window, min_periods=min_periods)
+    def rolling_stats(self, *args, **kwargs) -> pl.Expr:
+        return rolling_stats(self.expr, *args, **kwargs)
 
     def zscore(self, min_periods=None) -> pl.Expr:
         return zscore(self.expr, min_periods=min_periods)
@@ -67,9 +114,21 @@ class ExprQuantExtend:
     def calc_tick_future_ret_full(self, *args, **kwargs) -> pl.Expr:
         return calc_tick_future_ret_full(self.expr, *args, **kwargs)
 
+    def calc_tick_future_ret_book(self, *args, **kwargs) -> pl.Expr:
+        return calc_tick_future_ret_book(self.expr, *args, **kwargs)
+
+    def backtest(self, *args, **kwargs) -> pl.Expr:
+        return backtest(self.expr, *args, **kwargs)
+
+    def walk_forward(self, *args, **kwargs) -> pl.Expr:
+        return walk_forward(self.expr, *args, **kwargs)
+
     def boll(self, *args, **kwargs) -> pl.Expr:
         return boll(self.expr, *args, **kwargs)
 
+    def boll_grid(self, *args, **kwargs) -> pl.Expr:
+        return boll_grid(self.expr, *args, **kwargs)
+
     def boll_rev(self, *args, **kwargs):
         return self.boll(*args, **kwargs, rev=True)
 
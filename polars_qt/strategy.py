@@ -1,15 +1,71 @@
 from __future__ import annotations
 
+from functools import wraps
 from typing import TYPE_CHECKING
 
-import polars as pl
-
-from polars_qt.utils import parse_into_expr, register_plugin
+from polars_qt.funcs import rolling_zscore
+from polars_qt.utils import (
+    _BOOL_LIT,
+    parse_duration,
+    parse_into_expr,
+    register_plugin,
+)
 
 if TYPE_CHECKING:
+    import polars as pl
     from polars.type_aliases import IntoExpr
 
 
+def _strategy_plugin(symbol: str):
+    """
+    Register the decorated function as a strategy plugin.
+    The decorated function should return the args and kwargs of the plugin,
+    and they can still be accessed by `func.inputs` (used by fused plugins
+    such as `backtest`).
+    The plugin also accepts `by`, a group key such as symbol, the strategy then
+    runs on each group in parallel, like `.over(by)` but in one plugin call.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, by: IntoExpr | None = None, **kwargs) -> pl.Expr:
+            assert by is None or kwargs.get("time_col") is None, (
+                "time_col can not be used together with by, use .over(by) instead"
+            )
+            plugin_args, plugin_kwargs = func(*args, **kwargs)
+            if by is not None:
+                return register_plugin(
+                    args=[parse_into_expr(by), *plugin_args],
+                    kwargs=plugin_kwargs,
+                    symbol=f"{symbol}_panel",
+                    is_elementwise=False,
+                )
+            return register_plugin(
+                args=plugin_args,
+                kwargs=plugin_kwargs,
+                symbol=symbol,
+                is_elementwise=False,
+            )
+
+        wrapper.inputs = func
+        return wrapper
+
+    return decorator
+
+
+def _parse_filters(filters) -> list[pl.Expr]:
+    """
+    Parse the 4 filters of a strategy. A bool is passed as a scalar which the
+    plugin broadcasts instead of a column as long as the factor, the other
+    filters are cast to Boolean by the plugin.
+    """
+    assert len(filters) == 4, "filters must be a list of 4 elements"
+    return [
+        _BOOL_LIT[f] if isinstance(f, bool) else parse_into_expr(f) for f in filters
+    ]
+
+
+@_strategy_plugin("boll")
 def boll(
     fac: IntoExpr,
     params: tuple[int, float, float] | tuple[int, float] | int,
@@ -23,6 +79,7 @@ def boll(
     long_signal: float = 1,
     short_signal: float = -1,
     close_signal: float = 0,
+    time_col: IntoExpr | None = None,
 ) -> pl.Expr:
     """
     Bollinger Bands
@@ -36,6 +93,14 @@ def boll(
     zscore: whether to calculate zscore for fac
     rev: reverse the long and short signal, filters will also be reversed automatically
     delay_open: if open signal is blocked by filters, whether to delay the open signal when filters are True
+    time_col: a sorted Date / Datetime column, the window is then a duration such
+        as "5m", see `rolling_zscore(by=...)`. min_periods is then the minimum
+        number of rows in the duration window (default 1), and the window is
+        not used when zscore is False. Only boll and boll_grid take a
+        time_col: their band is a zscore of the factor, which is computed by
+        time before the strategy kernel. auto_boll, delay_boll and
+        auto_tangqian compute their bands inside the kernel over a number of
+        rows.
     """
     fac = parse_into_expr(fac)
     # process params
@@ -48,17 +113,19 @@ def boll(
         params = (*params, 0.0, last_param)
     elif len(params) == 3:
         params = (*params, last_param)
+    if time_col is not None:
+        # the zscore of a time window is computed before the strategy kernel,
+        # which then reads one row of the normalized factor
+        if zscore:
+            fac = rolling_zscore(fac, params[0], min_periods, by=time_col)
+        params = (1, *params[1:])
+        min_periods = 1
+        zscore = False
 
     # process args and filters
     args = [fac]
     if filters is not None:
-        assert len(filters) == 4, "filters must be a list of 4 elements"
-        filters = [
-            parse_into_expr(f).cast(pl.Boolean)
-            if not isinstance(f, bool)
-            else pl.repeat(f, fac.len())
-            for f in filters
-        ]
+        filters = _parse_filters(filters)
         filters = [*filters[2:], *filters[:2]] if rev else filters
         args.extend(filters)
     else:
@@ -74,14 +141,102 @@ def boll(
         "short_signal": float(short_signal),
         "close_signal": float(close_signal),
     }
+    return args, kwargs
+
+
+def boll_grid(
+    fac: IntoExpr,
+    windows: list[int] | int,
+    open_widths: list[float] | float,
+    stop_widths: list[float] | float = 0.0,
+    min_periods: int | None = None,
+    filters: tuple[IntoExpr, IntoExpr, IntoExpr, IntoExpr] | None = None,
+    *,
+    rev=False,
+    zscore=True,
+    delay_open: bool = True,
+    long_signal: float = 1,
+    short_signal: float = -1,
+    close_signal: float = 0,
+    time_col: IntoExpr | None = None,
+) -> pl.Expr:
+    """
+    Bollinger Bands over a grid of params in a single call
+    fac: factor to calculate bollinger bands
+    windows: windows to search
+    open_widths: open widths to search
+    stop_widths: stop widths to search
+    time_col: a sorted Date / Datetime column, the windows are then durations
+        such as "5m" and min_periods is the minimum number of rows in a
+        duration window, see `boll`
+    other arguments are the same as `boll`
+
+    return a struct column with one field for each (window, open_width, stop_width)
+    combo, the field is named as `{window}_{open_width}_{stop_width}`.
+    The rolling moments are calculated only once for each window. Repeated
+    windows or widths are searched once.
+    """
+    fac = parse_into_expr(fac)
+    windows = list(windows) if isinstance(windows, (tuple, list)) else [windows]
+    if not isinstance(open_widths, (tuple, list)):
+        open_widths = [open_widths]
+    if not isinstance(stop_widths, (tuple, list)):
+        stop_widths = [stop_widths]
+    # a repeated param would give two fields of the same name
+    windows, open_widths, stop_widths = (
+        list(dict.fromkeys(params)) for params in (windows, open_widths, stop_widths)
+    )
+
+    # process args and filters
+    args = [fac]
+    if filters is not None:
+        filters = _parse_filters(filters)
+        filters = [*filters[2:], *filters[:2]] if rev else filters
+        args.extend(filters)
+    if rev:
+        long_signal, short_signal = short_signal, long_signal
+    combos = []
+    for i, window in enumerate(windows):
+        for open_width in open_widths:
+            for stop_width in stop_widths:
+                combo_kwargs = {
+                    # the window of a time band is only used by `periods`
+                    "params": (
+                        1 if time_col is not None else window,
+                        float(open_width),
+                        float(stop_width),
+                        None,
+                    ),
+                    # a time band reads one row of the normalized factor
+                    "min_periods": 1 if time_col is not None else min_periods,
+                    # factor is already normalized once for each window
+                    "zscore": False,
+                    "delay_open": delay_open,
+                    "long_signal": float(long_signal),
+                    "short_signal": float(short_signal),
+                    "close_signal": float(close_signal),
+                }
+                combos.append((f"{window}_{open_width}_{stop_width}", i, combo_kwargs))
+    periods = None
+    if time_col is not None:
+        periods = [parse_duration(window) for window in windows]
+        args.append(parse_into_expr(time_col))
+    kwargs = {
+        "windows": windows if periods is None else [],
+        "periods": periods,
+        "min_periods": min_periods,
+        "zscore": zscore,
+        "combos": combos,
+    }
     return register_plugin(
         args=args,
         kwargs=kwargs,
-        symbol="boll",
+        symbol="boll_grid",
         is_elementwise=False,
     )
 
 
+@_strategy_plugin("auto_boll")
 def auto_boll(
     fac: IntoExpr,
     params: tuple[int, float, float] | tuple[int, float] | int,
@@ -119,13 +274,7 @@ def auto_boll(
     # process args and filters
     args = [fac]
     if filters is not None:
-        assert len(filters) == 4, "filters must be a list of 4 elements"
-        filters = [
-            parse_into_expr(f).cast(pl.Boolean)
-            if not isinstance(f, bool)
-            else pl.repeat(f, fac.len())
-            for f in filters
-        ]
+        filters = _parse_filters(filters)
         filters = [*filters[2:], *filters[:2]] if rev else filters
         args.extend(filters)
     if rev:
@@ -140,14 +289,10 @@ def auto_boll(
         "short_signal": float(short_signal),
         "close_signal": float(close_signal),
     }
-    return register_plugin(
-        args=args,
-        kwargs=kwargs,
-        symbol="auto_boll",
-        is_elementwise=False,
-    )
+    return args, kwargs
 
 
+@_strategy_plugin("delay_boll")
 def delay_boll(
     fac: IntoExpr,
     params: tuple[int, float, float, float] | tuple[int, float, float],
@@ -182,13 +327,7 @@ def delay_boll(
     # process args and filters
     args = [fac]
     if filters is not None:
-        assert len(filters) == 4, "filters must be a list of 4 elements"
-        filters = [
-            parse_into_expr(f).cast(pl.Boolean)
-            if not isinstance(f, bool)
-            else pl.repeat(f, fac.len())
-            for f in filters
-        ]
+        filters = _parse_filters(filters)
         args.extend(filters)
     else:
         pass
@@ -199,14 +338,10 @@ def delay_boll(
         "short_signal": float(short_signal),
         "close_signal": float(close_signal),
     }
-    return register_plugin(
-        args=args,
-        kwargs=kwargs,
-        symbol="delay_boll",
-        is_elementwise=False,
-    )
+    return args, kwargs
 
 
+@_strategy_plugin("martingale")
 def martingale(
     close: IntoExpr,
     n: int,
@@ -222,14 +357,7 @@ def martingale(
     close = parse_into_expr(close)
     args = [close]
     if filters is not None:
-        args.extend(
-            [
-                parse_into_expr(filters).cast(pl.Boolean),
-                pl.repeat(True, close.len()),
-                pl.repeat(False, close.len()),
-                pl.repeat(False, close.len()),
-            ]
-        )
+        args.extend(_parse_filters((filters, True, False, False)))
     else:
         pass
     kwargs = {
@@ -242,14 +370,10 @@ def martingale(
         "b": b,
         "stop_loss_m": stop_loss_m,
     }
-    return register_plugin(
-        args=args,
-        kwargs=kwargs,
-        symbol="martingale",
-        is_elementwise=False,
-    )
+    return args, kwargs
 
 
+@_strategy_plugin("fix_time")
 def fix_time(
     fac: IntoExpr,
     n: int,
@@ -261,27 +385,17 @@ def fix_time(
     fac = parse_into_expr(fac)
     args = [fac]
     if filters is not None:
-        assert len(filters) == 4, "filters must be a list of 4 elements"
-        filters = [
-            parse_into_expr(f).cast(pl.Boolean)
-            if not isinstance(f, bool)
-            else pl.repeat(f, fac.len())
-            for f in filters
-        ]
+        filters = _parse_filters(filters)
         args.extend(filters)
     kwargs = {
         "n": n,
         "pos_map": pos_map,
         "extend_time": extend_time,
     }
-    return register_plugin(
-        args=args,
-        kwargs=kwargs,
-        symbol="fix_time",
-        is_elementwise=False,
-    )
+    return args, kwargs
 
 
+@_strategy_plugin("auto_tangqian")
 def auto_tangqian(
     fac: IntoExpr,
     params: tuple[int, float, float] | tuple[int, float] | int,
@@ -318,13 +432,7 @@ def auto_tangqian(
     # process args and filters
     args = [fac]
     if filters is not None:
-        assert len(filters) == 4, "filters must be a list of 4 elements"
-        filters = [
-            parse_into_expr(f).cast(pl.Boolean)
-            if not isinstance(f, bool)
-            else pl.repeat(f, fac.len())
-            for f in filters
-        ]
+        filters = _parse_filters(filters)
         filters = [*filters[2:], *filters[:2]] if rev else filters
         args.extend(filters)
     if rev:
@@ -338,14 +446,10 @@ def auto_tangqian(
         "short_signal": float(short_signal),
         "close_signal": float(close_signal),
     }
-    return register_plugin(
-        args=args,
-        kwargs=kwargs,
-        symbol="auto_tangqian",
-        is_elementwise=False,
-    )
+    return args, kwargs
 
 
+@_strategy_plugin("prob_threshold")
 def prob_threshold(
     fac: IntoExpr,
     thresholds: (float, float, float, float),
@@ -356,22 +460,11 @@ def prob_threshold(
     fac = parse_into_expr(fac)
     args = [fac]
     if filters is not None:
-        assert len(filters) == 4, "filters must be a list of 4 elements"
-        filters = [
-            parse_into_expr(f).cast(pl.Boolean)
-            if not isinstance(f, bool)
-            else pl.repeat(f, fac.len())
-            for f in filters
-        ]
+        filters = _parse_filters(filters)
         args.extend(filters)
     kwargs = {
         "thresholds": thresholds,
         "per_hand": float(per_hand),
         "max_hand": float(max_hand),
     }
-    return register_plugin(
-        args=args,
-        kwargs=kwargs,
-        symbol="prob_threshold",
-        is_elementwise=False,
-    )
+    return args, kwargs
@@ -0,0 +1,587 @@
+from __future__ import annotations
+
+import math
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from typing import TYPE_CHECKING
+
+import polars as pl
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Sequence
+
+# same as tevec, variance below EPS is treated as zero
+EPS = 1e-14
+
+
+def _is_none(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _to_list(values) -> list:
+    if isinstance(values, pl.Series):
+        return values.to_list()
+    return list(values)
+
+
+def _iter_filters(filters, n: int) -> Iterable:
+    if filters is None:
+        return (None for _ in range(n))
+    assert len(filters) == 4, "filters must be a list of 4 elements"
+    filters = [[f] * n if isinstance(f, bool) else _to_list(f) for f in filters]
+    assert all(len(f) == n for f in filters), "filters must have the same length"
+    return zip(*filters)
+
+
+def _powi(base: float, exp: int) -> float:
+    # same multiplication order as rust's `powi`, so results are bit-identical
+    out = 1.0
+    while True:
+        if exp & 1:
+            out *= base
+        exp //= 2
+        if exp == 0:
+            return out
+        base *= base
+
+
+class _Rolling:
+    """
+    Base class of incremental rolling functions.
+    Subclasses implement `_add(value)` which pushes a new value and returns the
+    result of the current window, and `_remove(value)` which drops the oldest
+    value once the window is full. Null values take a slot in the window but
+    are not counted, NaN is a normal value just as in the batch kernels.
+    """
+
+    def __init__(self, window: int, min_periods: int | None = None):
+        self.window = window
+        # as the batch kernels, min_periods can't exceed the window
+        self.min_periods = min(
+            window // 2 if min_periods is None else min_periods, window
+        )
+        self.values = deque(maxlen=window)
+
+    def update(self, value) -> float | None:
+        """
+        Feed a new value and return the result of the current window
+        """
+        value = None if value is None else float(value)
+        if len(self.values) == self.window:
+            # the batch kernels remove the oldest value after the last output,
+            # doing it before the next add keeps the same operation order
+            old = self.values[0]
+            if old is not None:
+                self._remove(old)
+        self.values.append(value)
+        out = self._add(value)
+        if out is not None and math.isnan(out):
+            return None
+        return out
+
+    def update_batch(self, values: pl.Series | Sequence) -> pl.Series:
+        """
+        Feed a batch of values and return the result of each window
+        """
+        name = values.name if isinstance(values, pl.Series) else ""
+        out = [self.update(v) for v in _to_list(values)]
+        return pl.Series(name, out, dtype=pl.Float64)
+
+    def seed(self, values: pl.Series | Sequence) -> pl.Series:
+        """
+        Warm up the window with history values, return their results
+        """
+        return self.update_batch(values)
+
+
+class RollingZscore(_Rolling):
+    """
+    Incremental version of `rolling_zscore`, O(1) per update and the output is
+    bit-identical to the batch expression. The variance comes from the raw
+    sums as in tevec's `ts_vzscore`, which is also the band of `boll`.
+    """
+
+    def __init__(self, window: int, min_periods: int | None = None):
+        super().__init__(window, min_periods)
+        self.n = 0
+        self.sum = 0.0
+        self.sum2 = 0.0
+
+    def _remove(self, value: float):
+        self.n -= 1
+        self.sum -= value
+        self.sum2 -= value * value
+
+    def _add(self, value: float | None) -> float | None:
+        if value is None:
+            return None
+        self.n += 1
+        self.sum += value
+        self.sum2 += value * value
+        if self.n < self.min_periods:
+            return None
+        n = float(self.n)
+        mean = self.sum / n
+        var = self.sum2 / n
+        var -= mean * mean
+        if not var > EPS:
+            return None
+        if n == 1.0:
+            # rounding residue left in var, std is inf as in the batch kernel
+            return (value - mean) * 0.0
+        return (value - mean) / math.sqrt(var * n / (n - 1.0))
+
+
+class _RollingMoments(_Rolling):
+    def __init__(self, window: int, min_periods: int | None = None):
+        super().__init__(window, min_periods)
+        self.n = 0
+        self.sum = 0.0
+        self.sum2 = 0.0
+        self.sum3 = 0.0
+        self.sum4 = 0.0
+
+    def _remove(self, value: float):
+        self.n -= 1
+        self.sum -= value
+        value2 = value * value
+        self.sum2 -= value2
+        self.sum3 -= value2 * value
+        self.sum4 -= value2 * value2
+
+    def _add(self, value: float | None) -> float | None:
+        if value is not None:
+            self.n += 1
+            self.sum += value
+            value2 = value * value
+            self.sum2 += value2
+            self.sum3 += value2 * value
+            self.sum4 += value2 * value2
+        if self.n < self.min_periods:
+            return None
+        return self._moment()
+
+
+class RollingSkew(_RollingMoments):
+    """
+    Incremental version of `rolling_skew`, O(1) per update and the output is
+    bit-identical to the batch expression
+    """
+
+    def _moment(self) -> float | None:
+        # the operations of tevec's ts_vskew one by one
+        if self.n < 3:
+            return None
+        n = float(self.n)
+        mean = self.sum / n
+        var = self.sum2 / n - mean * mean
+        if var <= EPS:
+            return 0.0
+        std = math.sqrt(var)
+        m = mean / std
+        res = m * -3.0 + (self.sum3 / n) / (std * std * std) - m * m * m
+        return res * (math.sqrt(float(self.n * (self.n - 1))) / float(self.n - 2))
+
+
+class RollingKurt(_RollingMoments):
+    """
+    Incremental version of `rolling_kurt`, O(1) per update and the output is
+    bit-identical to the batch expression
+    """
+
+    def _moment(self) -> float | None:
+        # the operations of tevec's ts_vkurt one by one
+        if self.n < 4:
+            return None
+        n = float(self.n)
+        mean = self.sum / n
+        var = self.sum2 / n - mean * mean
+        if var <= EPS:
+            return 0.0
+        r = mean * mean / var
+        res = (self.sum4 / n + mean * -4.0 * (self.sum3 / n)) / (var * var)
+        res = r * r * 3.0 + (r * 6.0 + res)
+        c = self.n
+        return (res * float(c * c - 1) - float(3 * (c - 1) * (c - 1))) * (
+            1.0 / float((c - 2) * (c - 3))
+        )
+
+
+class RollingEwm(_Rolling):
+    """
+    Incremental version of `rolling_ewm`, O(1) per update and the output is
+    bit-identical to the batch expression
+    """
+
+    def __init__(self, window: int, min_periods: int | None = None):
+        super().__init__(window, min_periods)
+        self.alpha = 2.0 / window
+        self.oma = 1.0 - self.alpha
+        self.n = 0
+        self.q = 0.0
+
+    def _remove(self, value: float):
+        self.n -= 1
+        self.q -= value * _powi(self.oma, self.n)
+
+    def _add(self, value: float | None) -> float | None:
+        if value is not None:
+            self.n += 1
+            self.q += value - self.alpha * self.q
+        if self.n < self.min_periods or self.n == 0:
+            return None
+        return self.q * self.alpha / (1.0 - _powi(self.oma, self.n))
+
+
+class _SortedList:
+    """
+    A sorted list of floats kept in buckets of about `load` values, as
+    sortedcontainers does. A value is found in its bucket by binary search
+    and the values before the bucket are counted by a Fenwick tree over the
+    bucket sizes, so adding, removing and ranking a value cost about
+    O(log n + load) rather than the O(n) of inserting into one list.
+    """
+
+    def __init__(self, load: int = 1000):
+        self.load = max(load, 4)
+        self.lists: list[list[float]] = []
+        self.maxes: list[float] = []
+        self.tree: list[int] = [0]
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _rebuild(self):
+        # the tree is rebuilt in O(buckets) when a bucket is split or merged
+        n = len(self.lists)
+        tree = [0] * (n + 1)
+        for i, lst in enumerate(self.lists, 1):
+            tree[i] += len(lst)
+            j = i + (i & -i)
+            if j <= n:
+                tree[j] += tree[i]
+        self.tree = tree
+
+    def _update(self, k: int, delta: int):
+        k += 1
+        tree = self.tree
+        while k < len(tree):
+            tree[k] += delta
+            k += k & -k
+
+    def _prefix(self, k: int) -> int:
+        # number of values in the buckets before bucket k
+        tree = self.tree
+        out = 0
+        while k > 0:
+            out += tree[k]
+            k -= k & -k
+        return out
+
+    def add(self, value: float) -> tuple[int, int]:
+        """
+        Add `value`, return the number of values less than it and equal to
+        it, itself included.
+        """
+        lists, maxes = self.lists, self.maxes
+        self.size += 1
+        if not maxes:
+            lists.append([value])
+            maxes.append(value)
+            self.tree = [0, 1]
+            return 0, 1
+        if len(lists) == 1 and len(lists[0]) < 2 * self.load:
+            # a single bucket is a plain sorted list
+            lst = lists[0]
+            less = bisect_left(lst, value)
+            lst.insert(less, value)
+            maxes[0] = lst[-1]
+            self.tree[1] += 1
+            return less, bisect_right(lst, value, lo=less) - less
+        # the buckets before k only hold values less than `value`
+        k = bisect_left(maxes, value)
+        if k == len(maxes):
+            k -= 1
+            lst = lists[k]
+            less = len(lst)
+            lst.append(value)
+            maxes[k] = value
+        else:
+            lst = lists[k]
+            less = bisect_left(lst, value)
+            lst.insert(less, value)
+        # the values equal to it may go on in the next buckets
+        spill = lst[-1] == value and k + 1 < len(maxes)
+        equal = bisect_right(lst, value, lo=less) - less
+        less += self._prefix(k)
+        if len(lst) > 2 * self.load:
+            lists[k : k + 1] = [lst[: self.load], lst[self.load :]]
+            maxes[k : k + 1] = [lst[self.load - 1], lst[-1]]
+            self._rebuild()
+        else:
+            self._update(k, 1)
+        if spill:
+            equal = self.bisect_right(value) - less
+        return less, equal
+
+    def remove(self, value: float):
+        # `value` must be in the list
+        lists, maxes = self.lists, self.maxes
+        self.size -= 1
+        if len(lists) == 1 and self.size:
+            lst = lists[0]
+            del lst[bisect_left(lst, value)]
+            maxes[0] = lst[-1]
+            self.tree[1] -= 1
+            return
+        k = bisect_left(maxes, value)
+        lst = lists[k]
+        del lst[bisect_left(lst, value)]
+        if lst and (len(lst) >= self.load // 2 or len(lists) == 1):
+            maxes[k] = lst[-1]
+            self._update(k, -1)
+            return
+        # a small bucket is merged into its neighbour
+        if len(lists) > 1:
+            j = k - 1 if k > 0 else k
+            merged = lists[j] + lists[j + 1]
+            lists[j : j + 2] = [merged]
+            maxes[j : j + 2] = [merged[-1]]
+            if len(merged) > 2 * self.load:
+                half = len(merged) // 2
+                lists[j : j + 1] = [merged[:half], merged[half:]]
+                maxes[j : j + 1] = [merged[half - 1], merged[-1]]
+        else:
+            del lists[k], maxes[k]
+        self._rebuild()
+
+    def bisect_right(self, value: float) -> int:
+        k = bisect_right(self.maxes, value)
+        if k == len(self.maxes):
+            return self.size
+        return self._prefix(k) + bisect_right(self.lists[k], value)
+
+
+class RollingRank(_Rolling):
+    """
+    Incremental version of `rolling_rank`, the window is kept in a bucketed
+    sorted list so the rank of a new value is found by binary search
+    pct: return the rank divided by the number of valid values
+    rev: rank in descending order
+    """
+
+    def __init__(
+        self, window: int, min_periods: int | None = None, pct=False, rev=False
+    ):
+        super().__init__(window, min_periods)
+        # unlike the moments, rolling_rank does not clamp min_periods to the
+        # window, a larger one gives only nulls
+        self.min_periods = window // 2 if min_periods is None else min_periods
+        self.pct = pct
+        self.rev = rev
+        self.sorted = _SortedList()
+        # NaN can not be ordered, it is counted but never compared
+        self.nan_count = 0
+
+    def _remove(self, value: float):
+        if math.isnan(value):
+            self.nan_count -= 1
+        else:
+            self.sorted.remove(value)
+
+    def _add(self, value: float | None) -> float | None:
+        if value is None:
+            return None
+        if math.isnan(value):
+            self.nan_count += 1
+            less, equal = 0, 1
+        else:
+            less, equal = self.sorted.add(value)
+        n = len(self.sorted) + self.nan_count
+        if n < self.min_periods:
+            return None
+        rank = less + 0.5 * (equal + 1)
+        if self.rev:
+            rank = n + 1 - rank
+        return rank / n if self.pct else rank
+
+
+class _Strategy:
+    """
+    Base class of streaming strategies.
+    Subclasses implement `_step(value, filters)` which consumes one bar and
+    returns the signal of that bar.
+    Only boll and prob_threshold have a streaming version: the state machines
+    of auto_boll, delay_boll, martingale, fix_time and auto_tangqian live in
+    tea_strategy, which only runs them over a whole series.
+    """
+
+    signal: float
+
+    def update(self, value, filters: Sequence[bool] | None = None) -> float:
+        """
+        Feed a new bar and return its signal
+        value: factor value of the new bar
+        filters: long_open, long_stop, short_open, short_stop of the new bar
+        """
+        return self._step(value, filters)
+
+    def update_batch(
+        self,
+        fac: pl.Series | Sequence,
+        filters: Sequence[pl.Series | Sequence[bool] | bool] | None = None,
+    ) -> pl.Series:
+        """
+        Feed a batch of bars and return their signals
+        fac: factor values
+        filters: long_open, long_stop, short_open, short_stop series
+        """
+        name = fac.name if isinstance(fac, pl.Series) else ""
+        fac = _to_list(fac)
+        out = [self._step(v, f) for v, f in zip(fac, _iter_filters(filters, len(fac)))]
+        return pl.Series(name, out, dtype=pl.Float64)
+
+    def seed(
+        self,
+        fac: pl.Series | Sequence,
+        filters: Sequence[pl.Series | Sequence[bool] | bool] | None = None,
+    ) -> pl.Series:
+        """
+        Warm up the state with history bars, return the signals of the history
+        """
+        return self.update_batch(fac, filters)
+
+
+class Boll(_Strategy):
+    """
+    Streaming Bollinger Bands, the signals are identical to `boll`
+    fac: factor to calculate bollinger bands
+    params:
+        params: window, open_width, stop_width(default: 0.0), take_profit_width(default: None)
+    min_periods: minimum periods to calculate bollinger bands
+    filters: long_open, long_stop, short_open, short_stop
+        for open condition, if filter is False, open behavior is disabled
+        for stop condition, if filter is True, return signal will be close_signal
+    zscore: whether to calculate zscore for fac
+    rev: reverse the long and short signal, filters will also be reversed automatically
+    delay_open: if open signal is blocked by filters, whether to delay the open signal when filters are True
+    """
+
+    def __init__(
+        self,
+        params: tuple[int, float, float] | tuple[int, float] | int,
+        min_periods: int | None = None,
+        *,
+        rev=False,
+        zscore=True,
+        delay_open: bool = True,
+        long_signal: float = 1,
+        short_signal: float = -1,
+        close_signal: float = 0,
+    ):
+        if not isinstance(params, (tuple, list)):
+            params = (params,)
+        # window, open_width, stop_width, take_profit_width
+        defaults = (None, 0.0, 0.0, None)
+        window, open_width, stop_width, take_profit = (
+            *params,
+            *defaults[len(params) :],
+        )
+        self.open_width = float(open_width)
+        self.stop_width = float(stop_width)
+        self.take_profit = None if take_profit is None else float(take_profit)
+        self.rev = rev
+        self.delay_open = delay_open
+        if rev:
+            long_signal, short_signal = short_signal, long_signal
+        self.long_signal = float(long_signal)
+        self.short_signal = float(short_signal)
+        self.close_signal = float(close_signal)
+        self.zscore = RollingZscore(window, min_periods) if zscore else None
+        self.signal = self.close_signal
+        self.last_fac = 0.0
+
+    def _step(self, value, filters: Sequence[bool] | None = None) -> float:
+        if self.zscore is not None:
+            fac = self.zscore.update(value)
+            # boll needs at least two valid values to get a band
+            if self.zscore.n < 2:
+                fac = None
+        else:
+            fac = value
+        if _is_none(fac):
+            return self.signal
+        fac = float(fac)
+        if filters is None:
+            long_open, stop, short_open = True, False, True
+        else:
+            long_open, long_stop, short_open, short_stop = (
+                (*filters[2:], *filters[:2]) if self.rev else filters
+            )
+            # as in the batch kernel, either stop filter closes the position
+            # whatever its side
+            stop = bool(long_stop) or bool(short_stop)
+        o, s, tp = self.open_width, self.stop_width, self.take_profit
+        last_fac = self.last_fac
+        can_long = long_open and (self.delay_open or last_fac < o)
+        can_short = short_open and (self.delay_open or last_fac > -o)
+        # stop when fac crosses the stop band
+        stop = stop or (last_fac > s and fac <= s) or (last_fac < -s and fac >= -s)
+        if self.signal == self.long_signal:
+            if stop or (tp is not None and fac >= tp):
+                self.signal = self.close_signal
+            if fac <= -o and can_short:
+                self.signal = self.short_signal
+        elif self.signal == self.short_signal:
+            if stop or (tp is not None and fac <= -tp):
+                self.signal = self.close_signal
+            if fac >= o and can_long:
+                self.signal = self.long_signal
+        elif fac >= o and can_long:
+            self.signal = self.long_signal
+        elif fac <= -o and can_short:
+            self.signal = self.short_signal
+        self.last_fac = fac
+        return self.signal
+
+
+class ProbThreshold(_Strategy):
+    """
+    Streaming version of `prob_threshold`, the signals are identical to the
+    batch expression
+    thresholds: long_open, long_stop, short_open, short_stop
+    per_hand: position added each time the open threshold is hit
+    max_hand: max absolute position
+    """
+
+    def __init__(
+        self,
+        thresholds: tuple[float, float, float, float],
+        per_hand=1.0,
+        max_hand=3.0,
+    ):
+        self.thresholds = tuple(float(t) for t in thresholds)
+        self.per_hand = float(per_hand)
+        self.max_hand = float(max_hand)
+        self.signal = 0.0
+
+    def _step(self, value, filters: Sequence[bool] | None = None) -> float:
+        if _is_none(value):
+            return self.signal
+        value = float(value)
+        if filters is None:
+            filters = (True, False, True, False)
+        long_open, long_stop, short_open, short_stop = filters
+        long_open_t, long_stop_t, short_open_t, short_stop_t = self.thresholds
+        pos = self.signal
+        if value >= long_open_t and long_open and pos < self.max_hand:
+            pos = min(max(pos, 0.0) + self.per_hand, self.max_hand)
+        elif value <= short_open_t and short_open and pos > -self.max_hand:
+            pos = max(min(pos, 0.0) - self.per_hand, -self.max_hand)
+        elif (pos > 0 and (value <= long_stop_t or long_stop)) or (
+            pos < 0 and (value >= short_stop_t or short_stop)
+        ):
+            pos = 0.0
+        self.signal = pos
+        return pos
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
 import re
+import threading
+from collections import OrderedDict
+from datetime import timedelta
 from pathlib import Path
 from typing import TYPE_CHECKING, Any, Sequence
 
@@ -18,14 +21,43 @@ def parse_version(version: Sequence[str | int]) -> tuple[int, ...]:
     return tuple(int(re.sub(r"\D", "", str(v))) for v in version)
 
 
-OLD_POLARS = parse_version(pl.__version__) < parse_version("0.20.16")
+# the compiled library is next to this file, see `_register_plugin`
+_PLUGIN_PATH = Path(__file__).parent
 
-if OLD_POLARS:
-    from polars.utils.udfs import _get_shared_lib_location
 
-    lib: str | Path = _get_shared_lib_location(__file__)
-else:
-    lib = Path(__file__).parent
+_DURATION_NS = {
+    "ns": 1,
+    "us": 1_000,
+    "ms": 1_000_000,
+    "s": 1_000_000_000,
+    "m": 60 * 1_000_000_000,
+    "h": 3600 * 1_000_000_000,
+    "d": 86400 * 1_000_000_000,
+    "w": 7 * 86400 * 1_000_000_000,
+}
+
+
+def parse_duration(duration: str | timedelta) -> int:
+    """
+    Length of a time window in nanoseconds.
+
+    `duration` is a timedelta or a string in the polars duration language with
+    fixed length units only, e.g. "5m", "1h30m", "500ms", "2d".
+    """
+    if isinstance(duration, timedelta):
+        ns = (
+            duration.days * 86400 + duration.seconds
+        ) * 1_000_000_000 + duration.microseconds * 1_000
+    else:
+        parts = re.findall(r"(\d+)(ns|us|ms|s|m|h|d|w)", duration)
+        if not parts or "".join(n + u for n, u in parts) != duration:
+            msg = f"invalid duration {duration!r}, expected e.g. '5m', '1h30m', '500ms'"
+            raise ValueError(msg)
+        ns = sum(int(n) * _DURATION_NS[u] for n, u in parts)
+    if ns <= 0:
+        msg = "duration should be positive"
+        raise ValueError(msg)
+    return ns
 
 
 def parse_into_expr(
@@ -68,31 +100,108 @@ def parse_into_expr(
     return expr
 
 
+EXPR_CACHE_SIZE = 4096
+_expr_cache: OrderedDict[tuple, pl.Expr] = OrderedDict()
+_expr_cache_lock = threading.Lock()
+# the literals of the boolean strategy filters, shared so that the cache can
+# key them by value
+_BOOL_LIT = {True: pl.lit(True), False: pl.lit(False)}
+_BOOL_LIT_KEYS = {id(expr): (bool, value) for value, expr in _BOOL_LIT.items()}
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+def _freeze(value: Any) -> Any:
+    # hashable form of the kwargs, the type is kept as True == 1 == 1.0
+    tp = type(value)
+    if tp is dict:
+        return (tp, tuple([(k, _freeze(v)) for k, v in value.items()]))
+    if tp is list or tp is tuple:
+        return (tp, tuple([_freeze(v) for v in value]))
+    return (tp, value)
+
+
+def _freeze_arg(arg: Any) -> Any:
+    # hashable form of an arg without serializing it: a column name or a bare
+    # `pl.col` is keyed by the name, a scalar by its value. None for the other
+    # expressions, which are not cached.
+    if isinstance(arg, pl.Expr):
+        key = _BOOL_LIT_KEYS.get(id(arg))
+        if key is None and arg.meta.is_column():
+            key = (str, arg.meta.output_name())
+        return key
+    if isinstance(arg, _SCALAR_TYPES):
+        return (type(arg), arg)
+    return None
+
+
+def clear_expr_cache() -> None:
+    """Drop the plugin expressions cached by `register_plugin`."""
+    with _expr_cache_lock:
+        _expr_cache.clear()
+
+
 def register_plugin(
     *,
     symbol: str,
     is_elementwise: bool,
     kwargs: dict[str, Any] | None = None,
     args: list[IntoExpr],
-    # lib: str | Path,
+    returns_scalar: bool = False,
+) -> pl.Expr:
+    """
+    Build the expression of a plugin, the last `EXPR_CACHE_SIZE` expressions
+    are cached by symbol, kwargs and args, so building the same expression
+    again skips the kwargs serialization. Only column names, bare `pl.col`,
+    scalars and the boolean filter literals are keyed, an expression with any
+    other arg (e.g. `pl.col("a") * 2` or a `pl.lit(Series)`) is not cached.
+    returns_scalar: the plugin returns a single value, a scalar per group in
+        a group_by context
+    """
+    frozen = [_freeze_arg(arg) for arg in args]
+    key = None
+    if None not in frozen:
+        key = (symbol, is_elementwise, returns_scalar, tuple(frozen), _freeze(kwargs))
+        try:
+            hash(key)
+        except TypeError:
+            # unhashable kwargs
+            key = None
+    if key is not None:
+        with _expr_cache_lock:
+            hit = _expr_cache.get(key)
+            if hit is not None:
+                _expr_cache.move_to_end(key)
+                return hit
+    expr = _register_plugin(
+        symbol=symbol,
+        is_elementwise=is_elementwise,
+        kwargs=kwargs,
+        args=[parse_into_expr(arg) for arg in args],
+        returns_scalar=returns_scalar,
+    )
+    if key is not None:
+        with _expr_cache_lock:
+            _expr_cache[key] = expr
+            while len(_expr_cache) > EXPR_CACHE_SIZE:
+                _expr_cache.popitem(last=False)
+    return expr
+
+
+def _register_plugin(
+    *,
+    symbol: str,
+    is_elementwise: bool,
+    kwargs: dict[str, Any] | None = None,
+    args: list[IntoExpr],
+    returns_scalar: bool = False,
 ) -> pl.Expr:
-    # global lib
-    if OLD_POLARS:
-        assert isinstance(args[0], pl.Expr)
-        assert isinstance(lib, str)
-        return args[0].register_plugin(
-            lib=lib,
-            symbol=symbol,
-            args=args[1:],
-            kwargs=kwargs,
-            is_elementwise=is_elementwise,
-        )
     from polars.plugins import register_plugin_function
 
     return register_plugin_function(
         args=args,
-        plugin_path=lib,
+        plugin_path=_PLUGIN_PATH,
         function_name=symbol,
         kwargs=kwargs,
         is_elementwise=is_elementwise,
+        returns_scalar=returns_scalar,
     )
@@ -0,0 +1,197 @@
+use crate::equity_stats::{stats_field, EquityStats};
+use crate::future_ret_stream::for_each_equity;
+use crate::strategy::from_input::FromInput;
+use crate::{auto_cast, read_as_f32};
+use polars::prelude::*;
+use pyo3_polars::derive::polars_expr;
+use serde::Deserialize;
+use tea_strategy::equity::FutureRetKwargs;
+use tea_strategy::*;
+
+#[derive(Deserialize)]
+struct BacktestKwargs<K> {
+    strategy_kwargs: K,
+    equity_kwargs: FutureRetKwargs,
+    has_filters: bool,
+    has_contract_chg_signal: bool,
+    output: String,
+}
+
+#[derive(Deserialize)]
+struct BacktestOutputKwargs {
+    output: String,
+}
+
+fn backtest_output(input_fields: &[Field], kwargs: BacktestOutputKwargs) -> PolarsResult<Field> {
+    let name = input_fields[0].name().clone();
+    match kwargs.output.as_str() {
+        "equity" | "ret" | "final" => Ok(Field::new(name, DataType::Float64)),
+        "both" => Ok(Field::new(
+            name,
+            DataType::Struct(vec![
+                Field::new("equity".into(), DataType::Float64),
+                Field::new("ret".into(), DataType::Float64),
+            ]),
+        )),
+        "stats" => Ok(stats_field(name)),
+        output => {
+            polars_bail!(InvalidOperation: format!("output {} not supported for backtest, expected equity, ret, final, both or stats", output))
+        }
+    }
+}
+
+/// whether every position can be represented in Float32 without rounding
+pub(crate) fn pos_fits_f32(pos: &Float64Chunked) -> bool {
+    pos.iter().flatten().all(|v| v as f32 as f64 == v)
+}
+
+fn equity_to_ret(equity: &Float64Chunked) -> Float64Chunked {
+    let mut last = None;
+    equity
+        .iter()
+        .map(|v| {
+            let ret = match (last, v) {
+                (Some(last), Some(v)) if last != 0. => Some(v / last - 1.),
+                _ => None,
+            };
+            if v.is_some() {
+                last = v;
+            }
+            ret
+        })
+        .collect()
+}
+
+/// Only keep the outputs asked by user. Every output goes through the same
+/// row by row `calc_future_ret`, final and stats are reduced without the
+/// equity curve. The position is the signal of the last bar, the signal is
+/// read with a lag of one row rather than shifted.
+fn backtest_result(
+    signal: &Float64Chunked,
+    open: &Series,
+    close: &Series,
+    contract_chg_signal: Option<&BooleanChunked>,
+    kwargs: &FutureRetKwargs,
+    name: &PlSmallStr,
+    output: &str,
+) -> PolarsResult<Series> {
+    // Float32 prices are read in place when the signal is exact in Float32
+    let signal = if read_as_f32(&[open, close]) && pos_fits_f32(signal) {
+        signal.cast(&DataType::Float32)?
+    } else {
+        signal.clone().into_series()
+    };
+    let kwargs = kwargs.into();
+    let out = match output {
+        "final" => {
+            let mut last = None;
+            for_each_equity(
+                &signal,
+                open,
+                close,
+                None,
+                contract_chg_signal,
+                &kwargs,
+                1,
+                |_, equity| last = equity,
+            )?;
+            Series::new(name.clone(), vec![last])
+        }
+        "stats" => {
+            let mut stats = EquityStats::default();
+            for_each_equity(
+                &signal,
+                open,
+                close,
+                None,
+                contract_chg_signal,
+                &kwargs,
+                1,
+                |pos, equity| stats.update(pos, equity),
+            )?;
+            stats.into_series(name.clone())?
+        }
+        "equity" | "ret" | "both" => {
+            let mut equity = Vec::with_capacity(signal.len());
+            for_each_equity(
+                &signal,
+                open,
+                close,
+                None,
+                contract_chg_signal,
+                &kwargs,
+                1,
+                |_, v| equity.push(v),
+            )?;
+            let equity = Float64Chunked::from_iter_options(name.clone(), equity.into_iter());
+            match output {
+                "equity" => equity.into_series(),
+                "ret" => equity_to_ret(&equity).into_series(),
+                _ => {
+                    let ret = equity_to_ret(&equity).with_name("ret".into()).into_series();
+                    let equity = equity.with_name("equity".into()).into_series();
+                    StructChunked::from_series(name.clone(), equity.len(), [equity, ret].iter())?
+                        .into_series()
+                }
+            }
+        }
+        output => {
+            polars_bail!(InvalidOperation: format!("output {} not supported for backtest, expected equity, ret, final, both or stats", output))
+        }
+    };
+    Ok(out.with_name(name.clone()))
+}
+
+/// Fuse a strategy with `calc_future_ret`, inputs should be
+/// fac, [long_open, long_stop, short_open, short_stop], open, close, [contract_chg_signal]
+///
+/// The signal is materialized as a Float64 column before the equity loop
+/// reads it, the kernels of tea_strategy collect their output and have no
+/// per row interface. The fusion saves the round trip through polars, not
+/// the signal column.
+macro_rules! define_backtest {
+    ($name: ident, $strategy: ident $({$mark: tt})?, $kwargs: ty) => {
+        $crate::profiled! {
+        #[polars_expr(output_type_func_with_kwargs=backtest_output)]
+        fn $name(inputs: &[Series], kwargs: BacktestKwargs<$kwargs>) -> PolarsResult<Series> {
+            let offset = if kwargs.has_filters { 5 } else { 1 };
+            let expect_len = offset + 2 + kwargs.has_contract_chg_signal as usize;
+            polars_ensure!(
+                inputs.len() == expect_len,
+                ComputeError: format!("wrong length of inputs in function {}", stringify!($name))
+            );
+            // the strategy runs in tea_strategy over the whole input, only
+            // its signal is read row by row by the equity loop
+            let signal = $crate::strategy_kernel!(
+                $strategy $({$mark})?,
+                &inputs[..offset],
+                &kwargs.strategy_kwargs
+            );
+            let (open, close) = (&inputs[offset], &inputs[offset + 1]);
+            let contract_chg_signal = if !kwargs.has_contract_chg_signal {
+                None
+            } else {
+                Some(auto_cast!(Boolean(inputs[offset + 2])))
+            };
+            let contract_chg_signal = contract_chg_signal.as_ref().map(|s| s.bool().unwrap());
+            backtest_result(
+                &signal,
+                open,
+                close,
+                contract_chg_signal,
+                &kwargs.equity_kwargs,
+                inputs[0].name(),
+                &kwargs.output,
+            )
+        }
+        }
+    };
+}
+
+define_backtest!(backtest_boll, boll, BollKwargs);
+define_backtest!(backtest_auto_boll, auto_boll{?}, AutoBollKwargs);
+define_backtest!(backtest_delay_boll, delay_boll{?}, DelayBollKwargs);
+define_backtest!(backtest_martingale, martingale{?}, MartingaleKwargs);
+define_backtest!(backtest_fix_time, fix_time{?}, FixTimeKwargs);
+define_backtest!(backtest_auto_tangqian, auto_tangqian{?}, AutoTangQiAnKwargs);
+define_backtest!(backtest_prob_threshold, prob_threshold{?}, ProbThresholdKwargs);
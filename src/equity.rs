@@ -1,94 +1,476 @@
-use crate::auto_cast;
+use crate::equity_stats::stats_output;
+use crate::future_ret_stream::{
+    future_ret_stats, tick_future_ret_stats, FutureRetStreamKwargs, TickStreamKwargs,
+};
+use crate::{auto_cast, float_dispatch};
 use polars::prelude::*;
+use polars_core::POOL;
 use pyo3_polars::derive::polars_expr;
+use rayon::prelude::*;
+use serde::Deserialize;
 use tea_strategy::equity;
 use tea_strategy::equity::{
     profit_vec_to_series, FutureRetKwargs, FutureRetSpreadKwargs, TickFutureRetFullKwargs,
     TickFutureRetKwargs,
 };
 
-#[polars_expr(output_type=Float64)]
-fn calc_future_ret(inputs: &[Series], kwargs: FutureRetKwargs) -> PolarsResult<Series> {
+fn impl_calc_future_ret(
+    inputs: &[Series],
+    kwargs: &FutureRetKwargs,
+) -> PolarsResult<Float64Chunked> {
     let (pos, opening_cost, closing_cost) = (&inputs[0], &inputs[1], &inputs[2]);
-    let (pos, opening_cost, closing_cost) = auto_cast!(Float64(pos, opening_cost, closing_cost));
     let contract_chg_signal = if inputs.len() == 3 {
         None
     } else {
         Some(auto_cast!(Boolean(inputs[3])))
     };
-    let out: Float64Chunked = equity::calc_future_ret(
-        pos.f64()?,
-        opening_cost.f64()?,
-        closing_cost.f64()?,
-        contract_chg_signal.as_ref().map(|s| s.bool().unwrap()),
-        &kwargs,
-    );
-    Ok(out.into_series())
+    let contract_chg_signal = contract_chg_signal.as_ref().map(|s| s.bool().unwrap());
+    let out: Float64Chunked = float_dispatch!((pos, opening_cost, closing_cost) => {
+        equity::calc_future_ret(pos, opening_cost, closing_cost, contract_chg_signal, kwargs)
+    });
+    Ok(out)
 }
 
+crate::profiled! {
 #[polars_expr(output_type=Float64)]
-fn calc_future_ret_with_spread(
+fn calc_future_ret(inputs: &[Series], kwargs: FutureRetKwargs) -> PolarsResult<Series> {
+    Ok(impl_calc_future_ret(inputs, &kwargs)?.into_series())
+}
+}
+
+/// the contract change signal of a kernel taking `n` other inputs
+fn contract_chg_signal(inputs: &[Series], n: usize) -> PolarsResult<Option<BooleanChunked>> {
+    match inputs.get(n) {
+        Some(s) => Ok(Some(s.cast(&DataType::Boolean)?.bool()?.clone())),
+        None => Ok(None),
+    }
+}
+
+crate::profiled! {
+/// Summary statistics of `calc_future_ret`, the equity goes to the
+/// statistics row by row and the curve is not stored.
+#[polars_expr(output_type_func=stats_output)]
+fn calc_future_ret_stats(inputs: &[Series], kwargs: FutureRetStreamKwargs) -> PolarsResult<Series> {
+    let contract_chg_signal = contract_chg_signal(inputs, 3)?;
+    let (pos, open, close) = (&inputs[0], &inputs[1], &inputs[2]);
+    future_ret_stats(
+        pos,
+        open,
+        close,
+        None,
+        contract_chg_signal.as_ref(),
+        &kwargs,
+    )
+}
+}
+
+fn impl_calc_future_ret_with_spread(
     inputs: &[Series],
-    kwargs: FutureRetSpreadKwargs,
-) -> PolarsResult<Series> {
+    kwargs: &FutureRetSpreadKwargs,
+) -> PolarsResult<Float64Chunked> {
     let (pos, opening_cost, closing_cost, spread) =
         (&inputs[0], &inputs[1], &inputs[2], &inputs[3]);
-    let (pos, opening_cost, closing_cost, spread) =
-        auto_cast!(Float64(pos, opening_cost, closing_cost, spread));
     let contract_chg_signal = if inputs.len() == 4 {
         None
     } else {
         Some(auto_cast!(Boolean(inputs[4])))
     };
-    let out: Float64Chunked = equity::calc_future_ret_with_spread(
-        pos.f64()?,
-        opening_cost.f64()?,
-        closing_cost.f64()?,
-        spread.f64()?,
-        contract_chg_signal.as_ref().map(|s| s.bool().unwrap()),
-        &kwargs,
-    );
-    Ok(out.into_series())
+    let contract_chg_signal = contract_chg_signal.as_ref().map(|s| s.bool().unwrap());
+    let out: Float64Chunked = float_dispatch!((pos, opening_cost, closing_cost, spread) => {
+        equity::calc_future_ret_with_spread(
+            pos,
+            opening_cost,
+            closing_cost,
+            spread,
+            contract_chg_signal,
+            kwargs,
+        )
+    });
+    Ok(out)
 }
 
+crate::profiled! {
 #[polars_expr(output_type=Float64)]
-fn calc_tick_future_ret(inputs: &[Series], kwargs: TickFutureRetKwargs) -> PolarsResult<Series> {
+fn calc_future_ret_with_spread(
+    inputs: &[Series],
+    kwargs: FutureRetSpreadKwargs,
+) -> PolarsResult<Series> {
+    Ok(impl_calc_future_ret_with_spread(inputs, &kwargs)?.into_series())
+}
+}
+
+crate::profiled! {
+#[polars_expr(output_type_func=stats_output)]
+fn calc_future_ret_with_spread_stats(
+    inputs: &[Series],
+    kwargs: FutureRetStreamKwargs,
+) -> PolarsResult<Series> {
+    let contract_chg_signal = contract_chg_signal(inputs, 4)?;
+    let (pos, open, close, spread) = (&inputs[0], &inputs[1], &inputs[2], &inputs[3]);
+    future_ret_stats(
+        pos,
+        open,
+        close,
+        Some(spread),
+        contract_chg_signal.as_ref(),
+        &kwargs,
+    )
+}
+}
+
+fn impl_calc_tick_future_ret(
+    inputs: &[Series],
+    kwargs: &TickFutureRetKwargs,
+) -> PolarsResult<Float64Chunked> {
     let (signal, bid, ask) = (&inputs[0], &inputs[1], &inputs[2]);
-    let (signal, bid, ask) = auto_cast!(Float64(signal, bid, ask));
     let contract_chg_signal = if inputs.len() == 3 {
         None
     } else {
         Some(auto_cast!(Boolean(inputs[3])))
     };
-    let out: Float64Chunked = equity::calc_tick_future_ret(
-        signal.f64()?,
-        bid.f64()?,
-        ask.f64()?,
-        contract_chg_signal.as_ref().map(|s| s.bool().unwrap()),
-        &kwargs,
-    );
-    Ok(out.into_series())
+    let contract_chg_signal = contract_chg_signal.as_ref().map(|s| s.bool().unwrap());
+    let out: Float64Chunked = float_dispatch!((signal, bid, ask) => {
+        equity::calc_tick_future_ret(signal, bid, ask, contract_chg_signal, kwargs)
+    });
+    Ok(out)
 }
 
+crate::profiled! {
+#[polars_expr(output_type=Float64)]
+fn calc_tick_future_ret(inputs: &[Series], kwargs: TickFutureRetKwargs) -> PolarsResult<Series> {
+    Ok(impl_calc_tick_future_ret(inputs, &kwargs)?.into_series())
+}
+}
+
+crate::profiled! {
+#[polars_expr(output_type_func=stats_output)]
+fn calc_tick_future_ret_stats(inputs: &[Series], kwargs: TickStreamKwargs) -> PolarsResult<Series> {
+    tick_future_ret_stats(inputs, &kwargs)
+}
+}
+
+crate::profiled! {
 #[polars_expr(output_type=Float64)]
 fn calc_tick_future_ret_full(
     inputs: &[Series],
     kwargs: TickFutureRetFullKwargs,
 ) -> PolarsResult<Series> {
     let (signal, bid, ask) = (&inputs[0], &inputs[1], &inputs[2]);
-    let (signal, bid, ask) = auto_cast!(Float64(signal, bid, ask));
     let contract_chg_signal = if inputs.len() == 3 {
         None
     } else {
         Some(auto_cast!(Boolean(inputs[3])))
     };
-    let profit_vec = equity::calc_tick_future_ret_full(
-        signal.f64()?,
-        bid.f64()?,
-        ask.f64()?,
-        contract_chg_signal.as_ref().map(|s| s.bool().unwrap()),
-        &kwargs,
-    );
+    let contract_chg_signal = contract_chg_signal.as_ref().map(|s| s.bool().unwrap());
+    let profit_vec = float_dispatch!((signal, bid, ask) => {
+        equity::calc_tick_future_ret_full(signal, bid, ask, contract_chg_signal, &kwargs)
+    });
     let out = profit_vec_to_series(&profit_vec);
     Ok(out)
 }
+}
+
+#[derive(Deserialize)]
+struct FutureRetPanelKwargs {
+    equity_kwargs: FutureRetKwargs,
+    portfolio: bool,
+}
+
+#[derive(Deserialize)]
+struct FutureRetPanelOutputKwargs {
+    portfolio: bool,
+}
+
+fn future_ret_panel_output(
+    input_fields: &[Field],
+    kwargs: FutureRetPanelOutputKwargs,
+) -> PolarsResult<Field> {
+    let name = input_fields[1].name().clone();
+    if kwargs.portfolio {
+        Ok(Field::new(
+            name,
+            DataType::Struct(vec![
+                Field::new("equity".into(), DataType::Float64),
+                Field::new("portfolio".into(), DataType::Float64),
+            ]),
+        ))
+    } else {
+        Ok(Field::new(name, DataType::Float64))
+    }
+}
+
+/// value of a per-row or a scalar config column for the group of rows `idx`,
+/// a per-row column must hold the same value on every row of the group
+fn group_config(s: &Series, idx: &[IdxSize], name: &str) -> PolarsResult<f64> {
+    let ca = s.f64()?;
+    let value = if ca.len() == 1 {
+        ca.get(0)
+    } else {
+        let value = ca.get(idx[0] as usize);
+        if idx[1..].iter().any(|&i| ca.get(i as usize) != value) {
+            polars_bail!(ComputeError: "{name} of calc_future_ret_panel should be constant within a symbol")
+        }
+        value
+    };
+    match value {
+        Some(v) => Ok(v),
+        None => polars_bail!(ComputeError: "{name} of calc_future_ret_panel should not be null"),
+    }
+}
+
+crate::profiled! {
+/// Equity of every symbol in a panel, inputs are by, pos, open, close,
+/// multiplier, c_rate and an optional contract_chg_signal. multiplier and
+/// c_rate must be constant within each symbol.
+#[polars_expr(output_type_func_with_kwargs=future_ret_panel_output)]
+fn calc_future_ret_panel(inputs: &[Series], kwargs: FutureRetPanelKwargs) -> PolarsResult<Series> {
+    let by = &inputs[0];
+    let name = inputs[1].name().clone();
+    let (multiplier, c_rate) = (&inputs[4], &inputs[5]);
+    let (multiplier, c_rate) = auto_cast!(Float64(multiplier, c_rate));
+    let mut equity_inputs = vec![inputs[1].clone(), inputs[2].clone(), inputs[3].clone()];
+    if inputs.len() == 7 {
+        equity_inputs.push(inputs[6].clone());
+    }
+    let groups = by.group_tuples(true, false)?.into_idx();
+    let outs = POOL.install(|| {
+        groups
+            .all()
+            .par_iter()
+            .map(|idx| {
+                let kwargs = FutureRetKwargs {
+                    multiplier: group_config(multiplier, idx, "multiplier")?,
+                    c_rate: group_config(c_rate, idx, "c_rate")?,
+                    ..kwargs.equity_kwargs.clone()
+                };
+                let inputs = equity_inputs
+                    .iter()
+                    .map(|s| s.take_slice(idx))
+                    .collect::<PolarsResult<Vec<_>>>()?;
+                impl_calc_future_ret(&inputs, &kwargs)
+            })
+            .collect::<PolarsResult<Vec<_>>>()
+    })?;
+    let len = by.len();
+    let mut equity = vec![None; len];
+    let mut row_group = vec![0; len];
+    for (group, (idx, out)) in groups.all().iter().zip(outs).enumerate() {
+        for (&i, v) in idx.iter().zip(out.iter()) {
+            equity[i as usize] = v;
+            row_group[i as usize] = group;
+        }
+    }
+    let equity = Float64Chunked::from_iter_options("equity".into(), equity.into_iter());
+    if !kwargs.portfolio {
+        return Ok(equity.with_name(name).into_series());
+    }
+    // rows are visited in order, a symbol which has not started yet holds its init cash
+    let init_cash = kwargs.equity_kwargs.init_cash as f64;
+    let mut last = vec![init_cash; groups.len()];
+    let mut total = init_cash * groups.len() as f64;
+    // the changes are summed with Neumaier's compensation, a plain running
+    // sum of them drifts from the sum of the last equities on a long panel
+    let mut compensation = 0.;
+    let portfolio: Float64Chunked = equity
+        .iter()
+        .zip(row_group)
+        .map(|(v, group)| {
+            if let Some(v) = v {
+                let delta = v - last[group];
+                let sum = total + delta;
+                compensation += if total.abs() >= delta.abs() {
+                    (total - sum) + delta
+                } else {
+                    (delta - sum) + total
+                };
+                total = sum;
+                last[group] = v;
+            }
+            Some(total + compensation)
+        })
+        .collect();
+    let out = StructChunked::from_series(
+        name,
+        len,
+        [
+            equity.into_series(),
+            portfolio.with_name("portfolio".into()).into_series(),
+        ]
+        .iter(),
+    )?;
+    Ok(out.into_series())
+}
+}
+
+#[cfg(test)]
+mod tests {
+    //! The loops of `future_ret_stream` are copies of the kernels of
+    //! tea_strategy, they must give the kernel output on every row.
+    use super::*;
+    use crate::future_ret_stream::{for_each_equity, tick_full_from, tick_ret_from, TickState};
+    use serde::de::DeserializeOwned;
+    use serde_json::{json, Value};
+
+    /// xorshift, the cases are the same on every run
+    struct Rng(u64);
+
+    impl Rng {
+        fn below(&mut self, n: u64) -> u64 {
+            self.0 ^= self.0 << 13;
+            self.0 ^= self.0 >> 7;
+            self.0 ^= self.0 << 17;
+            self.0 % n
+        }
+
+        fn choose<T: Copy>(&mut self, values: &[T]) -> T {
+            values[self.below(values.len() as u64) as usize]
+        }
+    }
+
+    fn kwargs<T: DeserializeOwned>(value: &Value) -> T {
+        serde_json::from_value(value.clone()).unwrap()
+    }
+
+    /// pos (or signal), open (or bid), close (or ask), spread and a contract
+    /// change signal, with null positions and prices
+    fn case(rng: &mut Rng, n: usize) -> [Series; 5] {
+        let mut price = 100.;
+        let (mut pos, mut open, mut close, mut spread, mut chg) =
+            (vec![], vec![], vec![], vec![], vec![]);
+        for i in 0..n {
+            price += rng.below(5) as f64 - 2.;
+            pos.push((i % 11 != 7).then(|| rng.choose(&[0., 0., 1., -1., 0.5, -0.5, 2.])));
+            open.push((i % 13 != 5).then_some(price));
+            close.push(Some(price + 1. + rng.below(2) as f64));
+            spread.push(Some(rng.below(3) as f64 * 0.5));
+            chg.push(rng.below(10) == 0);
+        }
+        [
+            Series::new("pos".into(), pos),
+            Series::new("open".into(), open),
+            Series::new("close".into(), close),
+            Series::new("spread".into(), spread),
+            Series::new("chg".into(), chg),
+        ]
+    }
+
+    /// equal up to the rounding of the last bits, nulls at the same rows
+    fn assert_close(stream: &[Option<f64>], kernel: &Series) {
+        let kernel = kernel.f64().unwrap();
+        assert_eq!(stream.len(), kernel.len());
+        for (i, (a, b)) in stream.iter().zip(kernel.iter()).enumerate() {
+            match (*a, b) {
+                (Some(a), Some(b)) => assert!(
+                    (a - b).abs() <= 1e-9 * b.abs().max(1.) || (a.is_nan() && b.is_nan()),
+                    "row {i}: {a} != {b}"
+                ),
+                (a, b) => assert_eq!(a, b, "row {i}"),
+            }
+        }
+    }
+
+    fn nan_as_null(v: f64) -> Option<f64> {
+        (!v.is_nan()).then_some(v)
+    }
+
+    #[test]
+    fn test_future_ret_stream_matches_kernel() {
+        let mut rng = Rng(0x9e37_79b9_7f4a_7c15);
+        for case_id in 0..200 {
+            let n = 1 + rng.below(300) as usize;
+            let [mut pos, mut open, mut close, spread, chg] = case(&mut rng, n);
+            if case_id % 4 == 3 {
+                // Float32 inputs are read in place by both
+                pos = pos.cast(&DataType::Float32).unwrap();
+                open = open.cast(&DataType::Float32).unwrap();
+                close = close.cast(&DataType::Float32).unwrap();
+            }
+            let config = json!({
+                "init_cash": rng.choose(&[1_000, 1_000_000]),
+                "multiplier": rng.choose(&[1., 10.]),
+                "leverage": rng.choose(&[1., 3.]),
+                "slippage": rng.choose(&[0., 0.5]),
+                "c_rate": rng.choose(&[0., 3e-4]),
+                "blowup": case_id % 5 == 0,
+                "commission_type": rng.choose(&["percent", "absolute"]),
+            });
+            let chg = (case_id % 3 == 0).then_some(chg);
+            let mut inputs = vec![pos.clone(), open.clone(), close.clone()];
+            inputs.extend(chg.clone());
+            let chg = chg.as_ref().map(|s| s.bool().unwrap());
+            let stream_kwargs: FutureRetStreamKwargs = kwargs(&config);
+
+            let mut equity = vec![];
+            for_each_equity(&pos, &open, &close, None, chg, &stream_kwargs, 0, |_, e| {
+                equity.push(e)
+            })
+            .unwrap();
+            let expect = calc_future_ret(&inputs, kwargs(&config)).unwrap();
+            assert_close(&equity, &expect);
+
+            let mut equity = vec![];
+            for_each_equity(
+                &pos,
+                &open,
+                &close,
+                Some(&spread),
+                chg,
+                &stream_kwargs,
+                0,
+                |_, e| equity.push(e),
+            )
+            .unwrap();
+            inputs.insert(3, spread.clone());
+            let expect = calc_future_ret_with_spread(&inputs, kwargs(&config)).unwrap();
+            assert_close(&equity, &expect);
+        }
+    }
+
+    #[test]
+    fn test_tick_future_ret_stream_matches_kernel() {
+        let mut rng = Rng(0x2545_f491_4f6c_dd1d);
+        for case_id in 0..200 {
+            let n = 1 + rng.below(300) as usize;
+            let [signal, bid, ask, _, chg] = case(&mut rng, n);
+            let mut config = json!({
+                "init_cash": rng.choose(&[1_000, 1_000_000]),
+                "multiplier": rng.choose(&[1., 10.]),
+                "c_rate": rng.choose(&[0., 3e-4]),
+                "blowup": case_id % 5 == 0,
+                "commission_type": rng.choose(&["percent", "absolute"]),
+                "signal_type": rng.choose(&["percent", "absolute"]),
+            });
+            let mut inputs = vec![signal, bid, ask];
+            if case_id % 3 == 0 {
+                inputs.push(chg);
+            }
+            let stream_kwargs: TickStreamKwargs = kwargs(&config);
+
+            let mut st = TickState::new(stream_kwargs.init_cash);
+            let mut cash = vec![];
+            tick_ret_from(&inputs, &stream_kwargs, &mut st, |v| {
+                cash.push(nan_as_null(v))
+            })
+            .unwrap();
+            let expect = calc_tick_future_ret(&inputs, kwargs(&config)).unwrap();
+            assert_close(&cash, &expect);
+
+            config["signal_type"] = json!("absolute");
+            config["open_price_method"] = json!(rng.choose(&["average", "first", "last"]));
+            let stream_kwargs: TickStreamKwargs = kwargs(&config);
+            let mut st = TickState::new(stream_kwargs.init_cash);
+            let mut full: [Vec<Option<f64>>; 3] = Default::default();
+            tick_full_from(&inputs, &stream_kwargs, &mut st, |(u, r, o)| {
+                full[0].push(nan_as_null(u));
+                full[1].push(nan_as_null(r));
+                full[2].push(nan_as_null(o));
+            })
+            .unwrap();
+            let expect = calc_tick_future_ret_full(&inputs, kwargs(&config)).unwrap();
+            let expect = expect.struct_().unwrap().fields_as_series();
+            for (stream, kernel) in full.iter().zip(&expect) {
+                assert_close(stream, kernel);
+            }
+        }
+    }
+}
@@ -3,6 +3,8 @@ use pyo3_polars::derive::polars_expr;
 use serde::Deserialize;
 use tea_strategy::tevec::prelude::*;
 
+use super::chunked::rolling_by_blocks;
+
 #[derive(Deserialize)]
 struct BinaryConsecutivePropKwargs {
     window: usize,
@@ -59,6 +61,7 @@ fn impl_binary_consecutive_prop(
     out.unwrap()
 }
 
+crate::profiled! {
 #[polars_expr(output_type=Float64)]
 pub fn binary_consecutive_prop(
     inputs: &[Series],
@@ -67,6 +70,9 @@ pub fn binary_consecutive_prop(
     let s = &inputs[0];
     let name = s.name();
     let s = crate::auto_cast!(Boolean(s));
-    let res = impl_binary_consecutive_prop(s.bool()?, kwargs.window, kwargs.min_periods);
+    let res = rolling_by_blocks(s.bool()?, kwargs.window, |ca| {
+        impl_binary_consecutive_prop(ca, kwargs.window, kwargs.min_periods)
+    })?;
     Ok(res.into_series().with_name(name.clone()))
 }
+}
@@ -1,9 +1,20 @@
 use polars::prelude::arity::binary_elementwise_for_each;
 use polars::prelude::*;
+use polars_core::POOL;
 use pyo3_polars::derive::polars_expr;
+use rayon::prelude::*;
 use serde::Deserialize;
+use std::f64::consts::E;
 use tea_strategy::tevec::prelude::*;
 
+use super::chunked::try_rolling_by_blocks;
+
+/// Patterns up to this length are packed into u64 bitsets.
+const MAX_BITSET_PATTERN_LEN: usize = 64;
+/// Patterns up to this length look the weight of a mismatch mask up in a
+/// table of every mask.
+const MAX_TABLE_PATTERN_LEN: usize = 12;
+
 #[derive(Deserialize)]
 struct BinaryPatternVoteKwargs {
     lookup_len: usize,
@@ -38,7 +49,155 @@ fn binary_distance(a1: &BooleanChunked, a2: &BooleanChunked, alpha: f64) -> f64
     dist
 }
 
-fn impl_binary_pattern_vote(
+/// Vote of the last pattern in the lookup window `data`
+fn vote_by_slicing(
+    data: &BooleanChunked,
+    pattern_len: usize,
+    alpha: f64,
+    lambda: f64,
+    predict_n: usize,
+) -> Option<f64> {
+    if data.len() < pattern_len + predict_n {
+        return None;
+    }
+    let current_pattern = data.slice(-(pattern_len as i64), pattern_len);
+    debug_assert!(current_pattern.len() == pattern_len);
+    let mut up_sum = 0.;
+    let mut all_sum = 0.;
+    for i in 0..(data.len() - pattern_len - predict_n + 1) {
+        let past_pattern = data.slice(i as i64, pattern_len);
+        let past_predict = if predict_n == i {
+            data.get(i + pattern_len)
+                .map(|v| v as i8 as f64)
+                .unwrap_or(0.5)
+        } else {
+            data.slice((i + pattern_len) as i64, predict_n)
+                .mean()
+                .unwrap_or(0.5)
+        };
+
+        let dist = binary_distance(&past_pattern, &current_pattern, alpha);
+        let dist = E.powf(-lambda * dist);
+        up_sum += dist * past_predict;
+        all_sum += dist;
+    }
+    if all_sum == 0. {
+        None
+    } else {
+        Some(up_sum / all_sum)
+    }
+}
+
+/// Same as `vote_by_slicing` over every window, but every pattern is packed into a
+/// validity and a value bitset, so the distance of two patterns is a few
+/// bit operations plus a lookup of the precomputed alpha weights of the
+/// mismatched bits. The weights are added in the same order as
+/// `binary_distance`, so the output is identical.
+///
+/// A row still compares its pattern with every past pattern of its lookup
+/// window: the current pattern changes at every row, so every weight changes
+/// too, and the sums are kept in the order of the slicing implementation
+/// rather than updated as the window slides, which would round differently.
+/// The weight of a mismatch mask only depends on the mask, short patterns
+/// read it from a table instead of calling `powf` for every pair.
+fn impl_binary_pattern_vote_bitset(
+    arr: &BooleanChunked,
+    lookup_len: usize,
+    pattern_len: usize,
+    alpha: f64,
+    lambda: f64,
+    predict_n: usize,
+) -> Float64Chunked {
+    debug_assert!(pattern_len > 0 && pattern_len <= MAX_BITSET_PATTERN_LEN);
+    let values: Vec<Option<bool>> = arr.into_iter().collect();
+    let n = values.len();
+    let weights: Vec<f64> = (0..pattern_len)
+        .map(|j| alpha.powi((pattern_len - j) as i32))
+        .collect();
+    let weight = |mut mismatch: u64| -> f64 {
+        let mut dist = 0f64;
+        while mismatch != 0 {
+            dist += weights[mismatch.trailing_zeros() as usize];
+            mismatch &= mismatch - 1;
+        }
+        E.powf(-lambda * dist)
+    };
+    let table: Option<Vec<f64>> = (pattern_len <= MAX_TABLE_PATTERN_LEN)
+        .then(|| (0..1u64 << pattern_len).map(weight).collect());
+    // bit j of valid[s] and value[s] is the element s + j
+    let mut valid = Vec::with_capacity((n + 1).saturating_sub(pattern_len));
+    let mut value = Vec::with_capacity((n + 1).saturating_sub(pattern_len));
+    let (mut valid_bits, mut value_bits) = (0u64, 0u64);
+    // prefix count of valid and true elements
+    let mut valid_count = Vec::with_capacity(n + 1);
+    let mut true_count = Vec::with_capacity(n + 1);
+    valid_count.push(0usize);
+    true_count.push(0usize);
+    for (i, v) in values.iter().enumerate() {
+        valid_bits >>= 1;
+        value_bits >>= 1;
+        if let Some(v) = v {
+            valid_bits |= 1 << (pattern_len - 1);
+            if *v {
+                value_bits |= 1 << (pattern_len - 1);
+            }
+        }
+        if i + 1 >= pattern_len {
+            valid.push(valid_bits);
+            value.push(value_bits);
+        }
+        valid_count.push(valid_count[i] + v.is_some() as usize);
+        true_count.push(true_count[i] + (*v == Some(true)) as usize);
+    }
+    // mean of the predict_n elements after the pattern starting at `start`
+    let past_predict = |start: usize, i: usize| -> f64 {
+        let begin = start + pattern_len;
+        // keep the special case of the slicing implementation
+        if i == predict_n {
+            return values[begin].map(|v| v as i8 as f64).unwrap_or(0.5);
+        }
+        let end = begin + predict_n;
+        let count = valid_count[end] - valid_count[begin];
+        if count == 0 {
+            0.5
+        } else {
+            (true_count[end] - true_count[begin]) as f64 / count as f64
+        }
+    };
+    let vote = |t: usize| -> Option<f64> {
+        let window_start = (t + 1).saturating_sub(lookup_len);
+        let window_len = t + 1 - window_start;
+        if window_len < pattern_len + predict_n {
+            return None;
+        }
+        let current = t + 1 - pattern_len;
+        let (current_valid, current_value) = (valid[current], value[current]);
+        let mut up_sum = 0.;
+        let mut all_sum = 0.;
+        for i in 0..(window_len - pattern_len - predict_n + 1) {
+            let start = window_start + i;
+            let (past_valid, past_value) = (valid[start], value[start]);
+            let mismatch = (past_valid ^ current_valid)
+                | (past_valid & current_valid & (past_value ^ current_value));
+            let dist = match &table {
+                Some(table) => table[mismatch as usize],
+                None => weight(mismatch),
+            };
+            up_sum += dist * past_predict(start, i);
+            all_sum += dist;
+        }
+        if all_sum == 0. {
+            None
+        } else {
+            Some(up_sum / all_sum)
+        }
+    };
+    let out: Vec<Option<f64>> =
+        POOL.install(|| (0..n).into_par_iter().with_min_len(256).map(vote).collect());
+    out.into_iter().collect()
+}
+
+pub fn impl_binary_pattern_vote(
     arr: &BooleanChunked,
     lookup_len: usize,
     pattern_len: usize,
@@ -50,47 +209,27 @@ fn impl_binary_pattern_vote(
     if lookup_len < pattern_len + predict_n {
         polars_bail!(InvalidOperation:format!("lookup length: {lookup_len} must be greater than pattern length + predict_n: {}", pattern_len + predict_n))
     }
-    use std::f64::consts::E;
+    if pattern_len > 0 && pattern_len <= MAX_BITSET_PATTERN_LEN {
+        return Ok(impl_binary_pattern_vote_bitset(
+            arr,
+            lookup_len,
+            pattern_len,
+            alpha,
+            lambda,
+            predict_n,
+        ));
+    }
     let out = arr
         .rolling_custom::<Float64Chunked, _, _>(
             lookup_len,
-            |data| {
-                if data.len() < pattern_len + predict_n {
-                    return None;
-                }
-                let current_pattern = data.slice(-(pattern_len as i64), pattern_len);
-                debug_assert!(current_pattern.len() == pattern_len);
-                let mut up_sum = 0.;
-                let mut all_sum = 0.;
-                for i in 0..(data.len() - pattern_len - predict_n + 1) {
-                    let past_pattern = data.slice(i as i64, pattern_len);
-                    let past_predict = if predict_n == i {
-                        data.get(i + pattern_len)
-                            .map(|v| v as i8 as f64)
-                            .unwrap_or(0.5)
-                    } else {
-                        data.slice((i + pattern_len) as i64, predict_n)
-                            .mean()
-                            .unwrap_or(0.5)
-                    };
-
-                    let dist = binary_distance(&past_pattern, &current_pattern, alpha);
-                    let dist = E.powf(-lambda * dist);
-                    up_sum += dist * past_predict;
-                    all_sum += dist;
-                }
-                if all_sum == 0. {
-                    None
-                } else {
-                    Some(up_sum / all_sum)
-                }
-            },
+            |data| vote_by_slicing(&data, pattern_len, alpha, lambda, predict_n),
             None,
         )
         .unwrap();
     Ok(out)
 }
 
+crate::profiled! {
 #[polars_expr(output_type=Float64)]
 pub fn binary_pattern_vote(
     inputs: &[Series],
@@ -99,13 +238,59 @@ pub fn binary_pattern_vote(
     let s = &inputs[0];
     let name = s.name();
     let s = crate::auto_cast!(Boolean(s));
-    let res = impl_binary_pattern_vote(
-        s.bool()?,
-        kwargs.lookup_len,
-        kwargs.pattern_len,
-        kwargs.alpha,
-        kwargs.lambda,
-        kwargs.predict_n,
-    )?;
+    // the vote of a row only depends on the lookup window before it
+    let res = try_rolling_by_blocks(s.bool()?, kwargs.lookup_len, |ca| {
+        impl_binary_pattern_vote(
+            ca,
+            kwargs.lookup_len,
+            kwargs.pattern_len,
+            kwargs.alpha,
+            kwargs.lambda,
+            kwargs.predict_n,
+        )
+    })?;
     Ok(res.into_series().with_name(name.clone()))
 }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_bitset_same_as_slicing() {
+        let data: Vec<Option<bool>> = (0..300u64)
+            .map(|i| {
+                let h = i.wrapping_mul(0x9E3779B97F4A7C15) >> 59;
+                if h % 9 == 0 {
+                    None
+                } else {
+                    Some(h % 2 == 0)
+                }
+            })
+            .collect();
+        let arr = BooleanChunked::from_iter_options("a".into(), data.into_iter());
+        for (lookup_len, pattern_len, predict_n) in [
+            (20, 5, 1),
+            (40, 8, 3),
+            (50, 12, 1),
+            (50, 13, 2),
+            (90, 64, 2),
+        ] {
+            let fast =
+                impl_binary_pattern_vote_bitset(&arr, lookup_len, pattern_len, 0.9, 0.5, predict_n);
+            // the slicing path only runs for long patterns, call it by hand
+            let slow = arr
+                .rolling_custom::<Float64Chunked, _, _>(
+                    lookup_len,
+                    |data| vote_by_slicing(&data, pattern_len, 0.9, 0.5, predict_n),
+                    None,
+                )
+                .unwrap();
+            assert_eq!(
+                fast.into_iter().collect::<Vec<_>>(),
+                slow.into_iter().collect::<Vec<_>>()
+            );
+        }
+    }
+}
@@ -0,0 +1,89 @@
+use polars::prelude::*;
+
+/// Minimum number of rows evaluated at once by `rolling_by_blocks`.
+const BLOCK_LEN: usize = 1 << 16;
+
+/// Evaluate a rolling kernel on an input with many chunks without making a
+/// contiguous copy of the whole column.
+///
+/// The input is cut into blocks of at least `BLOCK_LEN` rows. Each block is
+/// evaluated together with the `window - 1` rows before it, whose outputs are
+/// dropped, so the window of the first row of a block is complete. Only one
+/// block is copied at a time, and the output keeps one chunk per block. A
+/// single chunk input is passed to the kernel as it is.
+///
+/// This is for the kernels of tevec, which are not written against the chunks
+/// (the naive rank, fdiff, binary counts and votes). The result is the same as
+/// on the whole column only because they compute every window from its own
+/// rows. Kernels with running sums (zscore, skew, kurt, ewm) and the tree rank
+/// read the chunks in place instead, see `impl_rolling_moments`.
+pub(super) fn rolling_by_blocks<T, F>(
+    ca: &ChunkedArray<T>,
+    window: usize,
+    func: F,
+) -> PolarsResult<Float64Chunked>
+where
+    T: PolarsDataType,
+    F: Fn(&ChunkedArray<T>) -> Float64Chunked,
+{
+    try_rolling_by_blocks(ca, window, |ca| Ok(func(ca)))
+}
+
+/// `rolling_by_blocks` for a kernel which may fail.
+pub(super) fn try_rolling_by_blocks<T, F>(
+    ca: &ChunkedArray<T>,
+    window: usize,
+    func: F,
+) -> PolarsResult<Float64Chunked>
+where
+    T: PolarsDataType,
+    F: Fn(&ChunkedArray<T>) -> PolarsResult<Float64Chunked>,
+{
+    let out = rolling_by_blocks_as(ca, window, &DataType::Float64, func)?;
+    Ok(out.f64()?.clone())
+}
+
+/// `try_rolling_by_blocks` with the output cast to `dtype`. The tevec kernels
+/// only return Float64. For a Float32 output of an input longer than a block,
+/// every block is cast as soon as it is computed, so only one block of Float64
+/// exists at a time. A shorter single chunk input is cast as a whole.
+pub(super) fn rolling_by_blocks_as<T, F>(
+    ca: &ChunkedArray<T>,
+    window: usize,
+    dtype: &DataType,
+    func: F,
+) -> PolarsResult<Series>
+where
+    T: PolarsDataType,
+    F: Fn(&ChunkedArray<T>) -> PolarsResult<Float64Chunked>,
+{
+    if ca.chunks().len() <= 1 && (dtype == &DataType::Float64 || ca.len() <= BLOCK_LEN) {
+        return func(ca)?.into_series().cast(dtype);
+    }
+    let halo = window.saturating_sub(1);
+    let block = BLOCK_LEN.max(4 * window);
+    let len = ca.len();
+    let mut out: Option<Series> = None;
+    let mut start = 0;
+    while start < len {
+        let end = (start + block).min(len);
+        let lo = start.saturating_sub(halo);
+        let piece = ca.slice(lo as i64, end - lo).rechunk();
+        crate::profiling::record_copy();
+        let res = func(&piece)?
+            .slice((start - lo) as i64, end - start)
+            .into_series()
+            .cast(dtype)?;
+        match out.as_mut() {
+            Some(out) => {
+                out.append(&res)?;
+            }
+            None => out = Some(res),
+        }
+        start = end;
+    }
+    match out {
+        Some(out) => Ok(out),
+        None => func(ca)?.into_series().cast(dtype),
+    }
+}
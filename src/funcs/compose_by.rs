@@ -2,6 +2,7 @@ use num_traits::ToPrimitive;
 use polars::prelude::*;
 use pyo3_polars::derive::polars_expr;
 
+crate::profiled! {
 #[polars_expr(output_type=Int32)]
 fn compose_by(inputs: &[Series]) -> PolarsResult<Series> {
     let (expr, by) = (&inputs[0], &inputs[1]);
@@ -25,6 +26,7 @@ fn compose_by(inputs: &[Series]) -> PolarsResult<Series> {
         }
     }
 }
+}
 
 fn impl_compose_by<T>(arr: &ChunkedArray<T>, value: f64) -> ChunkedArray<Int32Type>
 where
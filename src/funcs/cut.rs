@@ -11,36 +11,45 @@ struct CutKwargs {
     add_bounds: Option<bool>,
 }
 
+crate::profiled! {
 #[polars_expr(output_type=Float64)]
 pub fn cut(inputs: &[Series], kwargs: CutKwargs) -> PolarsResult<Series> {
-    use PlDataType::*;
     let (fac, bin, labels) = (&inputs[0], &inputs[1], &inputs[2]);
     let name = fac.name();
     let right = kwargs.right.unwrap_or(true);
     let add_bounds = kwargs.add_bounds.unwrap_or(true);
-    let labels_f64 = labels.cast(&Float64)?;
-    let labels = labels_f64.f64()?;
+    // the labels are the output, which is Float64
+    let labels = crate::auto_cast!(Float64(labels));
+    let labels = labels.f64()?;
     let res: Float64Chunked = match fac.dtype() {
-        PlDataType::Int32 => fac
-            .i32()?
-            .titer()
-            .vcut(bin.cast(&Int32)?.i32()?, labels, right, add_bounds)?
-            .try_collect_trusted_vec1()?,
-        PlDataType::Int64 => fac
-            .i64()?
-            .titer()
-            .vcut(bin.cast(&Int64)?.i64()?, labels, right, add_bounds)?
-            .try_collect_trusted_vec1()?,
-        PlDataType::Float32 => fac
-            .f32()?
-            .titer()
-            .vcut(bin.cast(&Float32)?.f32()?, labels, right, add_bounds)?
-            .try_collect_trusted_vec1()?,
-        PlDataType::Float64 => fac
-            .f64()?
-            .titer()
-            .vcut(bin.cast(&Float64)?.f64()?, labels, right, add_bounds)?
-            .try_collect_trusted_vec1()?,
+        PlDataType::Int32 => {
+            let bin = crate::auto_cast!(Int32(bin));
+            fac.i32()?
+                .titer()
+                .vcut(bin.i32()?, labels, right, add_bounds)?
+                .try_collect_trusted_vec1()?
+        }
+        PlDataType::Int64 => {
+            let bin = crate::auto_cast!(Int64(bin));
+            fac.i64()?
+                .titer()
+                .vcut(bin.i64()?, labels, right, add_bounds)?
+                .try_collect_trusted_vec1()?
+        }
+        PlDataType::Float32 => {
+            let bin = crate::auto_cast!(Float32(bin));
+            fac.f32()?
+                .titer()
+                .vcut(bin.f32()?, labels, right, add_bounds)?
+                .try_collect_trusted_vec1()?
+        }
+        PlDataType::Float64 => {
+            let bin = crate::auto_cast!(Float64(bin));
+            fac.f64()?
+                .titer()
+                .vcut(bin.f64()?, labels, right, add_bounds)?
+                .try_collect_trusted_vec1()?
+        }
         dtype => {
             polars_bail!(InvalidOperation:format!("dtype {dtype} not \
             supported for cut, expected Int32, Int64, Float32, Float64."))
@@ -48,3 +57,4 @@ pub fn cut(inputs: &[Series], kwargs: CutKwargs) -> PolarsResult<Series> {
     };
     Ok(res.with_name(name.clone()).into_series())
 }
+}
@@ -4,6 +4,8 @@ use pyo3_polars::derive::polars_expr;
 use serde::Deserialize;
 use tevec::rolling::*;
 
+use super::chunked::rolling_by_blocks;
+
 #[derive(Deserialize)]
 struct FdiffKwargs {
     d: f64,
@@ -12,6 +14,7 @@ struct FdiffKwargs {
     min_periods: Option<usize>,
 }
 
+crate::profiled! {
 #[polars_expr(output_type=Float64)]
 fn fdiff(inputs: &[Series], kwargs: FdiffKwargs) -> PolarsResult<Series> {
     let s = &inputs[0];
@@ -19,10 +22,18 @@ fn fdiff(inputs: &[Series], kwargs: FdiffKwargs) -> PolarsResult<Series> {
     let ignore_na = kwargs.ignore_na.unwrap_or(true);
     let out: Float64Chunked = if !ignore_na {
         match s.dtype() {
-            PlDataType::Int32 => s.i32()?.ts_fdiff(kwargs.d, kwargs.window),
-            PlDataType::Int64 => s.i64()?.ts_fdiff(kwargs.d, kwargs.window),
-            PlDataType::Float32 => s.f32()?.ts_fdiff(kwargs.d, kwargs.window),
-            PlDataType::Float64 => s.f64()?.ts_fdiff(kwargs.d, kwargs.window),
+            PlDataType::Int32 => rolling_by_blocks(s.i32()?, kwargs.window, |ca| {
+                ca.ts_fdiff(kwargs.d, kwargs.window)
+            })?,
+            PlDataType::Int64 => rolling_by_blocks(s.i64()?, kwargs.window, |ca| {
+                ca.ts_fdiff(kwargs.d, kwargs.window)
+            })?,
+            PlDataType::Float32 => rolling_by_blocks(s.f32()?, kwargs.window, |ca| {
+                ca.ts_fdiff(kwargs.d, kwargs.window)
+            })?,
+            PlDataType::Float64 => rolling_by_blocks(s.f64()?, kwargs.window, |ca| {
+                ca.ts_fdiff(kwargs.d, kwargs.window)
+            })?,
             dtype => {
                 polars_bail!(InvalidOperation: "dtype {dtype} not \
                 supported for fdiff, expected Int32, Int64, Float32, Float64.")
@@ -30,18 +41,18 @@ fn fdiff(inputs: &[Series], kwargs: FdiffKwargs) -> PolarsResult<Series> {
         }
     } else {
         match s.dtype() {
-            PlDataType::Int32 => s
-                .i32()?
-                .ts_vfdiff(kwargs.d, kwargs.window, kwargs.min_periods),
-            PlDataType::Int64 => s
-                .i64()?
-                .ts_vfdiff(kwargs.d, kwargs.window, kwargs.min_periods),
-            PlDataType::Float32 => s
-                .f32()?
-                .ts_vfdiff(kwargs.d, kwargs.window, kwargs.min_periods),
-            PlDataType::Float64 => s
-                .f64()?
-                .ts_vfdiff(kwargs.d, kwargs.window, kwargs.min_periods),
+            PlDataType::Int32 => rolling_by_blocks(s.i32()?, kwargs.window, |ca| {
+                ca.ts_vfdiff(kwargs.d, kwargs.window, kwargs.min_periods)
+            })?,
+            PlDataType::Int64 => rolling_by_blocks(s.i64()?, kwargs.window, |ca| {
+                ca.ts_vfdiff(kwargs.d, kwargs.window, kwargs.min_periods)
+            })?,
+            PlDataType::Float32 => rolling_by_blocks(s.f32()?, kwargs.window, |ca| {
+                ca.ts_vfdiff(kwargs.d, kwargs.window, kwargs.min_periods)
+            })?,
+            PlDataType::Float64 => rolling_by_blocks(s.f64()?, kwargs.window, |ca| {
+                ca.ts_vfdiff(kwargs.d, kwargs.window, kwargs.min_periods)
+            })?,
             dtype => {
                 polars_bail!(InvalidOperation: "dtype {dtype} not \
                 supported for fdiff, expected Int32, Int64, Float32, Float64.")
@@ -50,3 +61,4 @@ fn fdiff(inputs: &[Series], kwargs: FdiffKwargs) -> PolarsResult<Series> {
     };
     Ok(out.with_name(name.clone()).into_series())
 }
+}
@@ -9,6 +9,7 @@ struct HalfLifeKwargs {
     min_periods: Option<usize>,
 }
 
+crate::profiled! {
 #[polars_expr(output_type=Int32)]
 pub fn half_life(inputs: &[Series], kwargs: HalfLifeKwargs) -> PolarsResult<Series> {
     let s = &inputs[0];
@@ -25,3 +26,4 @@ pub fn half_life(inputs: &[Series], kwargs: HalfLifeKwargs) -> PolarsResult<Seri
     };
     Ok(Series::new(name.clone(), vec![res as i32]))
 }
+}
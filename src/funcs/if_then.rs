@@ -2,6 +2,7 @@ use crate::output_func::same_output_type;
 use polars::prelude::*;
 use pyo3_polars::derive::polars_expr;
 
+crate::profiled! {
 #[polars_expr(output_type_func=same_output_type)]
 fn if_then(inputs: &[Series]) -> PolarsResult<Series> {
     let cond = inputs[0].bool()?;
@@ -16,3 +17,4 @@ fn if_then(inputs: &[Series]) -> PolarsResult<Series> {
         Ok(inputs[2].clone())
     }
 }
+}
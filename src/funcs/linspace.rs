@@ -3,6 +3,7 @@ use polars::prelude::*;
 use pyo3_polars::derive::polars_expr;
 use tea_strategy::tevec::prelude::*;
 
+crate::profiled! {
 #[polars_expr(output_type=Float64)]
 pub fn linspace(inputs: &[Series]) -> PolarsResult<Series> {
     let (start, end, num) = (&inputs[0], &inputs[1], &inputs[2]);
@@ -19,3 +20,4 @@ pub fn linspace(inputs: &[Series]) -> PolarsResult<Series> {
     );
     Ok(arr.with_name(name.clone()).into_series())
 }
+}
@@ -1,5 +1,6 @@
 mod binary_consecutive_prop;
 mod binary_pattern_vote;
+mod chunked;
 mod compose_by;
 mod cut;
 mod fdiff;
@@ -7,6 +8,21 @@ mod half_life;
 mod if_then;
 mod linspace;
 mod rolling_funcs;
+mod rolling_rank_tree;
+mod rolling_stats;
 mod tick_up_prob;
+mod time_window;
 mod to_trades;
 mod zscore;
+
+pub(crate) use rolling_stats::rolling_zscore_by_time;
+
+/// Kernels benched by `benches/kernels.rs`
+#[cfg(feature = "bench")]
+pub mod bench {
+    pub use super::binary_pattern_vote::impl_binary_pattern_vote;
+    pub use super::rolling_rank_tree::impl_rolling_rank_tree;
+    pub use super::rolling_stats::{rolling_moments, Stat};
+    pub use super::tick_up_prob::tick_up_prob_rs;
+    pub use super::to_trades::to_trades;
+}
@@ -4,108 +4,179 @@ use pyo3_polars::derive::polars_expr;
 use serde::Deserialize;
 use tea_strategy::tevec::prelude::*;
 
+use super::chunked::rolling_by_blocks_as;
+use super::rolling_rank_tree::{rolling_rank_tree_as, RANK_TREE_WINDOW};
+use super::rolling_stats::{
+    multi_window_moment, rolling_moment, window_field_name, Stat, Window, WindowOutputKwargs,
+};
+use crate::output_func::float_output_dtype;
+
 #[derive(Deserialize)]
 struct TsEwmKwargs {
-    window: usize,
+    window: Window,
     min_periods: Option<usize>,
+    output_dtype: Option<String>,
+}
+
+fn rolling_ewm_output(input_fields: &[Field], kwargs: WindowOutputKwargs) -> PolarsResult<Field> {
+    kwargs.field(input_fields, "ewm")
 }
 
-#[polars_expr(output_type=Float64)]
+crate::profiled! {
+#[polars_expr(output_type_func_with_kwargs=rolling_ewm_output)]
 fn rolling_ewm(inputs: &[Series], kwargs: TsEwmKwargs) -> PolarsResult<Series> {
     let s = &inputs[0];
-    let name = s.name();
-    let out: Float64Chunked = match s.dtype() {
-        PlDataType::Int32 => s.i32()?.ts_vewm(kwargs.window, kwargs.min_periods),
-        PlDataType::Int64 => s.i64()?.ts_vewm(kwargs.window, kwargs.min_periods),
-        PlDataType::Float32 => s.f32()?.ts_vewm(kwargs.window, kwargs.min_periods),
-        PlDataType::Float64 => s.f64()?.ts_vewm(kwargs.window, kwargs.min_periods),
-        dtype => {
-            polars_bail!(InvalidOperation: "dtype {dtype} not \
-            supported for rolling_ewm, expected Int32, Int64, Float32, Float64.")
+    let dtype = float_output_dtype(kwargs.output_dtype.as_deref())?;
+    match &kwargs.window {
+        Window::One(window) => {
+            rolling_moment(s, *window, kwargs.min_periods, Stat::Ewm, "ewm", &dtype)
         }
-    };
-    Ok(out.with_name(name.clone()).into_series())
+        Window::Many(windows) => {
+            multi_window_moment(s, windows, kwargs.min_periods, Stat::Ewm, "ewm", &dtype)
+        }
+    }
+}
 }
 
 #[derive(Deserialize)]
 struct TsSkewKwargs {
-    window: usize,
+    window: Window,
     min_periods: Option<usize>,
+    output_dtype: Option<String>,
+}
+
+fn rolling_skew_output(input_fields: &[Field], kwargs: WindowOutputKwargs) -> PolarsResult<Field> {
+    kwargs.field(input_fields, "skew")
 }
 
-#[polars_expr(output_type=Float64)]
+crate::profiled! {
+#[polars_expr(output_type_func_with_kwargs=rolling_skew_output)]
 fn rolling_skew(inputs: &[Series], kwargs: TsSkewKwargs) -> PolarsResult<Series> {
     let s = &inputs[0];
-    let name = s.name();
-    let out: Float64Chunked = match s.dtype() {
-        PlDataType::Int32 => s.i32()?.ts_vskew(kwargs.window, kwargs.min_periods),
-        PlDataType::Int64 => s.i64()?.ts_vskew(kwargs.window, kwargs.min_periods),
-        PlDataType::Float32 => s.f32()?.ts_vskew(kwargs.window, kwargs.min_periods),
-        PlDataType::Float64 => s.f64()?.ts_vskew(kwargs.window, kwargs.min_periods),
-        dtype => {
-            polars_bail!(InvalidOperation: "dtype {dtype} not \
-            supported for rolling_skew, expected Int32, Int64, Float32, Float64.")
+    let dtype = float_output_dtype(kwargs.output_dtype.as_deref())?;
+    match &kwargs.window {
+        Window::One(window) => {
+            rolling_moment(s, *window, kwargs.min_periods, Stat::Skew, "skew", &dtype)
         }
-    };
-    Ok(out.with_name(name.clone()).into_series())
+        Window::Many(windows) => {
+            multi_window_moment(s, windows, kwargs.min_periods, Stat::Skew, "skew", &dtype)
+        }
+    }
+}
 }
 
 #[derive(Deserialize)]
 struct TsKurtKwargs {
-    window: usize,
+    window: Window,
     min_periods: Option<usize>,
+    output_dtype: Option<String>,
+}
+
+fn rolling_kurt_output(input_fields: &[Field], kwargs: WindowOutputKwargs) -> PolarsResult<Field> {
+    kwargs.field(input_fields, "kurt")
 }
 
-#[polars_expr(output_type=Float64)]
+crate::profiled! {
+#[polars_expr(output_type_func_with_kwargs=rolling_kurt_output)]
 fn rolling_kurt(inputs: &[Series], kwargs: TsKurtKwargs) -> PolarsResult<Series> {
     let s = &inputs[0];
-    let name = s.name();
-    let out: Float64Chunked = match s.dtype() {
-        PlDataType::Int32 => s.i32()?.ts_vkurt(kwargs.window, kwargs.min_periods),
-        PlDataType::Int64 => s.i64()?.ts_vkurt(kwargs.window, kwargs.min_periods),
-        PlDataType::Float32 => s.f32()?.ts_vkurt(kwargs.window, kwargs.min_periods),
-        PlDataType::Float64 => s.f64()?.ts_vkurt(kwargs.window, kwargs.min_periods),
-        dtype => {
-            polars_bail!(InvalidOperation: "dtype {dtype} not \
-            supported for rolling_kurt, expected Int32, Int64, Float32, Float64.")
+    let dtype = float_output_dtype(kwargs.output_dtype.as_deref())?;
+    match &kwargs.window {
+        Window::One(window) => {
+            rolling_moment(s, *window, kwargs.min_periods, Stat::Kurt, "kurt", &dtype)
         }
-    };
-    Ok(out.with_name(name.clone()).into_series())
+        Window::Many(windows) => {
+            multi_window_moment(s, windows, kwargs.min_periods, Stat::Kurt, "kurt", &dtype)
+        }
+    }
+}
 }
 
 #[derive(Deserialize)]
 struct TsRankKwargs {
-    window: usize,
+    window: Window,
     min_periods: Option<usize>,
     pct: bool,
     rev: bool,
+    method: Option<String>,
+    output_dtype: Option<String>,
 }
 
-#[polars_expr(output_type=Float64)]
-fn rolling_rank(inputs: &[Series], kwargs: TsRankKwargs) -> PolarsResult<Series> {
-    let s = &inputs[0];
-    let name = s.name();
-    let out: Float64Chunked = match s.dtype() {
-        PlDataType::Int32 => {
-            s.i32()?
-                .ts_vrank(kwargs.window, kwargs.min_periods, kwargs.pct, kwargs.rev)
-        }
-        PlDataType::Int64 => {
-            s.i64()?
-                .ts_vrank(kwargs.window, kwargs.min_periods, kwargs.pct, kwargs.rev)
-        }
-        PlDataType::Float32 => {
-            s.f32()?
-                .ts_vrank(kwargs.window, kwargs.min_periods, kwargs.pct, kwargs.rev)
+macro_rules! impl_rolling_rank {
+    ($ca: expr, $window: expr, $kwargs: expr, $dtype: expr, $use_tree: expr) => {
+        if $use_tree {
+            // the tree reads the chunks in place and writes $dtype
+            rolling_rank_tree_as(
+                $ca,
+                $window,
+                $kwargs.min_periods,
+                $kwargs.pct,
+                $kwargs.rev,
+                $dtype,
+            )
+        } else {
+            rolling_by_blocks_as($ca, $window, $dtype, |ca| {
+                Ok(ca.ts_vrank($window, $kwargs.min_periods, $kwargs.pct, $kwargs.rev))
+            })?
         }
-        PlDataType::Float64 => {
-            s.f64()?
-                .ts_vrank(kwargs.window, kwargs.min_periods, kwargs.pct, kwargs.rev)
+    };
+}
+
+fn rolling_rank_output(input_fields: &[Field], kwargs: WindowOutputKwargs) -> PolarsResult<Field> {
+    kwargs.field(input_fields, "rank")
+}
+
+fn impl_rolling_rank(
+    s: &Series,
+    window: usize,
+    kwargs: &TsRankKwargs,
+    dtype: &PlDataType,
+) -> PolarsResult<Series> {
+    let use_tree = match kwargs.method.as_deref() {
+        None | Some("auto") => window >= RANK_TREE_WINDOW,
+        Some("tree") => true,
+        Some("naive") => false,
+        Some(method) => {
+            polars_bail!(InvalidOperation: "method {method} not \
+            supported for rolling_rank, expected auto, tree, naive.")
         }
+    };
+    let out = match s.dtype() {
+        PlDataType::Int32 => impl_rolling_rank!(s.i32()?, window, kwargs, dtype, use_tree),
+        PlDataType::Int64 => impl_rolling_rank!(s.i64()?, window, kwargs, dtype, use_tree),
+        PlDataType::Float32 => impl_rolling_rank!(s.f32()?, window, kwargs, dtype, use_tree),
+        PlDataType::Float64 => impl_rolling_rank!(s.f64()?, window, kwargs, dtype, use_tree),
         dtype => {
             polars_bail!(InvalidOperation: "dtype {dtype} not \
             supported for rolling_rank, expected Int32, Int64, Float32, Float64.")
         }
     };
-    Ok(out.with_name(name.clone()).into_series())
+    Ok(out)
+}
+
+crate::profiled! {
+/// The rank does not share accumulators between windows, with several windows
+/// every window is ranked on its own.
+#[polars_expr(output_type_func_with_kwargs=rolling_rank_output)]
+fn rolling_rank(inputs: &[Series], kwargs: TsRankKwargs) -> PolarsResult<Series> {
+    let s = &inputs[0];
+    let name = s.name();
+    let dtype = float_output_dtype(kwargs.output_dtype.as_deref())?;
+    match &kwargs.window {
+        Window::One(window) => {
+            let out = impl_rolling_rank(s, *window, &kwargs, &dtype)?;
+            Ok(out.with_name(name.clone()))
+        }
+        Window::Many(windows) => {
+            let fields = windows
+                .iter()
+                .map(|w| {
+                    let out = impl_rolling_rank(s, *w, &kwargs, &dtype)?;
+                    Ok(out.with_name(window_field_name("rank", *w)))
+                })
+                .collect::<PolarsResult<Vec<_>>>()?;
+            Ok(StructChunked::from_series(name.clone(), s.len(), fields.iter())?.into_series())
+        }
+    }
+}
 }
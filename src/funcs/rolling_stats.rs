@@ -0,0 +1,874 @@
+use num_traits::{NumCast, ToPrimitive};
+use polars::prelude::DataType as PlDataType;
+use polars::prelude::*;
+use pyo3_polars::derive::polars_expr;
+use serde::Deserialize;
+use std::collections::VecDeque;
+use tea_strategy::tevec::prelude::*;
+
+use super::chunked::rolling_by_blocks_as;
+use super::rolling_rank_tree::{impl_rolling_rank_by_time, rolling_rank_tree_as, RANK_TREE_WINDOW};
+use super::time_window::{time_index, TimeWindow};
+use crate::output_func::float_output_dtype;
+
+#[derive(Clone, Copy, PartialEq)]
+pub enum Stat {
+    Mean,
+    Std,
+    Skew,
+    Kurt,
+    Zscore,
+    Ewm,
+    Rank,
+}
+
+impl Stat {
+    fn parse(name: &str) -> PolarsResult<Self> {
+        Ok(match name {
+            "mean" => Stat::Mean,
+            "std" => Stat::Std,
+            "skew" => Stat::Skew,
+            "kurt" => Stat::Kurt,
+            "zscore" => Stat::Zscore,
+            "ewm" => Stat::Ewm,
+            "rank" => Stat::Rank,
+            name => polars_bail!(InvalidOperation: "stat {name} not supported for \
+                rolling_stats, expected mean, std, skew, kurt, zscore, ewm or rank."),
+        })
+    }
+}
+
+#[derive(Deserialize)]
+struct RollingStatsKwargs {
+    window: usize,
+    min_periods: Option<usize>,
+    stats: Vec<String>,
+    pct: bool,
+    output_dtype: Option<String>,
+}
+
+#[derive(Deserialize)]
+struct RollingStatsOutputKwargs {
+    stats: Vec<String>,
+    output_dtype: Option<String>,
+}
+
+fn rolling_stats_output(
+    input_fields: &[Field],
+    kwargs: RollingStatsOutputKwargs,
+) -> PolarsResult<Field> {
+    let dtype = float_output_dtype(kwargs.output_dtype.as_deref())?;
+    let fields = kwargs
+        .stats
+        .iter()
+        .map(|name| Field::new(name.as_str().into(), dtype.clone()))
+        .collect();
+    Ok(Field::new(
+        input_fields[0].name().clone(),
+        PlDataType::Struct(fields),
+    ))
+}
+
+/// Window of a rolling function, several windows give a struct with a
+/// `{stat}_{window}` field for each window
+#[derive(Deserialize)]
+#[serde(untagged)]
+pub(super) enum Window {
+    One(usize),
+    Many(Vec<usize>),
+}
+
+#[derive(Deserialize)]
+pub(super) struct WindowOutputKwargs {
+    window: Window,
+    output_dtype: Option<String>,
+}
+
+impl WindowOutputKwargs {
+    pub(super) fn field(&self, input_fields: &[Field], stat: &str) -> PolarsResult<Field> {
+        let dtype = float_output_dtype(self.output_dtype.as_deref())?;
+        let name = input_fields[0].name().clone();
+        match &self.window {
+            Window::One(_) => Ok(Field::new(name, dtype)),
+            Window::Many(windows) => {
+                // a repeated window would give a repeated field name
+                let distinct = windows
+                    .iter()
+                    .enumerate()
+                    .all(|(i, w)| !windows[..i].contains(w));
+                polars_ensure!(
+                    !windows.is_empty() && distinct,
+                    ComputeError: "windows should be distinct and not empty"
+                );
+                Ok(Field::new(
+                    name,
+                    PlDataType::Struct(
+                        windows
+                            .iter()
+                            .map(|w| Field::new(window_field_name(stat, *w), dtype.clone()))
+                            .collect(),
+                    ),
+                ))
+            }
+        }
+    }
+}
+
+pub(super) fn window_field_name(stat: &str, window: usize) -> PlSmallStr {
+    format!("{stat}_{window}").into()
+}
+
+/// One moment statistic over every window of `windows` in a single pass, see
+/// `impl_rolling_moments`, the fields are named `{stat}_{window}`
+fn window_moments(
+    s: &Series,
+    windows: &[usize],
+    min_periods: Option<usize>,
+    stat: Stat,
+    stat_name: &str,
+    dtype: &PlDataType,
+) -> PolarsResult<Vec<Series>> {
+    let stats = [stat];
+    let outs = match s.dtype() {
+        PlDataType::Int32 => rolling_moments(s.i32()?, windows, min_periods, &stats, dtype),
+        PlDataType::Int64 => rolling_moments(s.i64()?, windows, min_periods, &stats, dtype),
+        PlDataType::Float32 => rolling_moments(s.f32()?, windows, min_periods, &stats, dtype),
+        PlDataType::Float64 => rolling_moments(s.f64()?, windows, min_periods, &stats, dtype),
+        dtype => {
+            polars_bail!(InvalidOperation: "dtype {dtype} not \
+            supported for rolling_{stat_name}, expected Int32, Int64, Float32, Float64.")
+        }
+    };
+    Ok(outs
+        .into_iter()
+        .zip(windows)
+        .map(|(mut out, w)| {
+            out.pop()
+                .flatten()
+                .unwrap()
+                .with_name(window_field_name(stat_name, *w))
+        })
+        .collect())
+}
+
+/// One moment statistic over a single window. The chunks of `s` are read in
+/// place with the accumulators carried from one chunk to the next, and the
+/// output is written in `dtype` as it is computed.
+pub(super) fn rolling_moment(
+    s: &Series,
+    window: usize,
+    min_periods: Option<usize>,
+    stat: Stat,
+    stat_name: &str,
+    dtype: &PlDataType,
+) -> PolarsResult<Series> {
+    let out = window_moments(s, &[window], min_periods, stat, stat_name, dtype)?
+        .pop()
+        .unwrap();
+    Ok(out.with_name(s.name().clone()))
+}
+
+/// Struct of one moment statistic over several windows, computed in a single
+/// pass, see `impl_rolling_moments`
+pub(super) fn multi_window_moment(
+    s: &Series,
+    windows: &[usize],
+    min_periods: Option<usize>,
+    stat: Stat,
+    stat_name: &str,
+    dtype: &PlDataType,
+) -> PolarsResult<Series> {
+    let fields = window_moments(s, windows, min_periods, stat, stat_name, dtype)?;
+    Ok(StructChunked::from_series(s.name().clone(), s.len(), fields.iter())?.into_series())
+}
+
+/// Flags of the accumulators of `Moments`, each statistic only updates the
+/// ones it reads.
+const SUM: u8 = 1;
+const SUM2: u8 = 1 << 1;
+const SUM3: u8 = 1 << 2;
+const SUM4: u8 = 1 << 3;
+const EWM: u8 = 1 << 4;
+const WELFORD: u8 = 1 << 5;
+const ZSCORE: u8 = SUM | SUM2;
+const SKEW: u8 = SUM | SUM2 | SUM3;
+const KURT: u8 = SUM | SUM2 | SUM3 | SUM4;
+const ALL: u8 = KURT | EWM | WELFORD;
+
+impl Stat {
+    /// the accumulators of `Moments` read by the statistic
+    const fn needs(self) -> u8 {
+        match self {
+            Stat::Mean => SUM,
+            Stat::Std => WELFORD,
+            Stat::Zscore => ZSCORE,
+            Stat::Skew => SKEW,
+            Stat::Kurt => KURT,
+            Stat::Ewm => EWM,
+            Stat::Rank => 0,
+        }
+    }
+}
+
+/// Call `$func::<..., N>` with `N` the accumulators needed by `$stats`. A
+/// single statistic gets a kernel which only updates what it reads, several
+/// statistics share the kernel updating every accumulator.
+macro_rules! with_needs {
+    ($stats: expr, $func: ident::<$($t: ty),*>($($arg: expr),* $(,)?)) => {
+        match $stats.iter().fold(0, |needs, stat| needs | stat.needs()) {
+            SUM => $func::<$($t,)* SUM>($($arg),*),
+            WELFORD => $func::<$($t,)* WELFORD>($($arg),*),
+            ZSCORE => $func::<$($t,)* ZSCORE>($($arg),*),
+            SKEW => $func::<$($t,)* SKEW>($($arg),*),
+            KURT => $func::<$($t,)* KURT>($($arg),*),
+            EWM => $func::<$($t,)* EWM>($($arg),*),
+            _ => $func::<$($t,)* ALL>($($arg),*),
+        }
+    };
+}
+
+/// Accumulators shared by the moment based statistics, values are added and
+/// removed in the same order as the single statistic kernels of tevec. Only
+/// the accumulators flagged in `N` are updated, the branches on `N` are
+/// resolved at compile time.
+#[derive(Default)]
+struct Moments<const N: u8> {
+    n: usize,
+    sum: f64,
+    sum2: f64,
+    sum3: f64,
+    sum4: f64,
+    /// exponentially weighted sum of the window
+    q: f64,
+    /// mean and sum of squared deviations updated as Welford does, the
+    /// variance of std, `sum2` cancels when the mean is large compared to
+    /// the deviations
+    w_mean: f64,
+    m2: f64,
+    /// values added since `w_mean` and `m2` were computed from the window
+    since_refresh: usize,
+}
+
+impl<const N: u8> Moments<N> {
+    #[inline]
+    fn add(&mut self, v: f64, alpha: f64) {
+        self.n += 1;
+        if N & SUM != 0 {
+            self.sum += v;
+        }
+        if N & SUM2 != 0 {
+            let v2 = v * v;
+            self.sum2 += v2;
+            if N & SUM3 != 0 {
+                self.sum3 += v2 * v;
+            }
+            if N & SUM4 != 0 {
+                self.sum4 += v2 * v2;
+            }
+        }
+        if N & EWM != 0 {
+            self.q += v - alpha * self.q;
+        }
+        if N & WELFORD != 0 {
+            let delta = v - self.w_mean;
+            self.w_mean += delta / self.n as f64;
+            self.m2 += delta * (v - self.w_mean);
+        }
+    }
+
+    #[inline]
+    fn remove(&mut self, v: f64, oma: f64) {
+        self.n -= 1;
+        if N & SUM != 0 {
+            self.sum -= v;
+        }
+        if N & SUM2 != 0 {
+            let v2 = v * v;
+            self.sum2 -= v2;
+            if N & SUM3 != 0 {
+                self.sum3 -= v2 * v;
+            }
+            if N & SUM4 != 0 {
+                self.sum4 -= v2 * v2;
+            }
+        }
+        if N & EWM != 0 {
+            self.q -= v * oma.powi(self.n as i32);
+        }
+        if N & WELFORD != 0 {
+            if self.n == 0 {
+                self.w_mean = 0.;
+                self.m2 = 0.;
+            } else {
+                let delta = v - self.w_mean;
+                self.w_mean -= delta / self.n as f64;
+                self.m2 -= delta * (v - self.w_mean);
+            }
+        }
+    }
+
+    /// compute `w_mean` and `m2` again from the values of the window, the
+    /// rounding of the add and remove updates would build up otherwise
+    fn refresh<I: Iterator<Item = f64>>(&mut self, window: impl Fn() -> I) {
+        self.since_refresh = 0;
+        if self.n == 0 {
+            return;
+        }
+        let mean = window().sum::<f64>() / self.n as f64;
+        self.w_mean = mean;
+        self.m2 = window().map(|v| (v - mean) * (v - mean)).sum();
+    }
+
+    /// mean and variance from the raw power sums
+    #[inline]
+    fn raw_mean_var(&self) -> (f64, f64) {
+        let n = self.n as f64;
+        let mean = self.sum / n;
+        (mean, self.sum2 / n - mean * mean)
+    }
+
+    fn stat(&self, stat: Stat, value: Option<f64>, alpha: f64) -> Option<f64> {
+        debug_assert!(stat.needs() & !N == 0, "accumulator not updated");
+        let n = self.n as f64;
+        let out = match stat {
+            Stat::Mean => self.sum / n,
+            Stat::Std => {
+                if self.n < 2 {
+                    return None;
+                }
+                if self.m2 / n > EPS {
+                    (self.m2 / (n - 1.)).sqrt()
+                } else {
+                    0.
+                }
+            }
+            Stat::Zscore => {
+                // the raw sums of ts_vzscore, which is also the band of the
+                // boll strategies of tea_strategy
+                let v = value?;
+                let (mean, var) = self.raw_mean_var();
+                if !(var > EPS) {
+                    return None;
+                }
+                if self.n == 1 {
+                    // rounding residue left in var, std is inf as in ts_vzscore
+                    (v - mean) * 0.
+                } else {
+                    (v - mean) / (var * n / (n - 1.)).sqrt()
+                }
+            }
+            // skew and kurt follow the operations of tevec's ts_vskew and
+            // ts_vkurt one by one, so the results are bit-identical: a window
+            // with no variance gives 0, the bias adjustments are computed on
+            // integers
+            Stat::Skew => {
+                if self.n < 3 {
+                    return None;
+                }
+                let (mean, var) = self.raw_mean_var();
+                if var <= EPS {
+                    0.
+                } else {
+                    let std = var.sqrt();
+                    let m = mean / std;
+                    let res = m * -3. + (self.sum3 / n) / (std * std * std) - m * m * m;
+                    let c = self.n;
+                    res * (((c * (c - 1)) as f64).sqrt() / (c - 2) as f64)
+                }
+            }
+            Stat::Kurt => {
+                if self.n < 4 {
+                    return None;
+                }
+                let (mean, var) = self.raw_mean_var();
+                if var <= EPS {
+                    0.
+                } else {
+                    let r = mean * mean / var;
+                    let res = (self.sum4 / n + mean * -4. * (self.sum3 / n)) / (var * var);
+                    let res = r * r * 3. + (r * 6. + res);
+                    let c = self.n;
+                    (res * (c * c - 1) as f64 - (3 * (c - 1) * (c - 1)) as f64)
+                        * (1. / ((c - 2) * (c - 3)) as f64)
+                }
+            }
+            Stat::Ewm => self.q * alpha / (1. - (1. - alpha).powi(self.n as i32)),
+            Stat::Rank => unreachable!("rank is not a moment statistic"),
+        };
+        if out.is_nan() {
+            None
+        } else {
+            Some(out)
+        }
+    }
+}
+
+/// All the moment statistics of `stats` for every window in a single pass over
+/// `ca`, rank is skipped. Every window has its own accumulators and reads the
+/// value leaving it from one ring buffer of the largest window, so an extra
+/// window costs O(1) per row. The input is read chunk by chunk and never
+/// copied. The output is indexed by window and then by statistic.
+fn impl_rolling_moments<T, O>(
+    ca: &ChunkedArray<T>,
+    windows: &[usize],
+    min_periods: Option<usize>,
+    stats: &[Stat],
+) -> Vec<Vec<Option<ChunkedArray<O>>>>
+where
+    T: PolarsNumericType,
+    O: PolarsFloatType,
+    O::Native: NumCast,
+{
+    with_needs!(stats, moments_pass::<T, O>(ca, windows, min_periods, stats))
+}
+
+fn moments_pass<T, O, const N: u8>(
+    ca: &ChunkedArray<T>,
+    windows: &[usize],
+    min_periods: Option<usize>,
+    stats: &[Stat],
+) -> Vec<Vec<Option<ChunkedArray<O>>>>
+where
+    T: PolarsNumericType,
+    O: PolarsFloatType,
+    O::Native: NumCast,
+{
+    let windows: Vec<usize> = windows.iter().map(|w| (*w).max(1)).collect();
+    let max_window = windows.iter().copied().max().unwrap_or(1);
+    let params: Vec<_> = windows
+        .iter()
+        .map(|&w| {
+            let alpha = 2. / w as f64;
+            let min_periods = min_periods.unwrap_or(w / 2).min(w);
+            (w, alpha, 1. - alpha, min_periods)
+        })
+        .collect();
+    let mut builders: Vec<Vec<_>> = windows
+        .iter()
+        .map(|_| {
+            stats
+                .iter()
+                .map(|stat| {
+                    (*stat != Stat::Rank)
+                        .then(|| PrimitiveChunkedBuilder::<O>::new("".into(), ca.len()))
+                })
+                .collect()
+        })
+        .collect();
+    let mut values: VecDeque<Option<f64>> = VecDeque::with_capacity(max_window);
+    let mut moments: Vec<Moments<N>> = windows.iter().map(|_| Moments::default()).collect();
+    for v in ca.iter() {
+        let v = v.and_then(|v| v.to_f64());
+        for ((&(w, alpha, oma, min_periods), moments), builders) in params
+            .iter()
+            .zip(moments.iter_mut())
+            .zip(builders.iter_mut())
+        {
+            if values.len() >= w {
+                if let Some(old) = values[values.len() - w] {
+                    moments.remove(old, oma);
+                }
+            }
+            if let Some(v) = v {
+                moments.add(v, alpha);
+            }
+            if N & WELFORD != 0 {
+                moments.since_refresh += 1;
+                if moments.since_refresh >= w {
+                    let prev = values.len() - values.len().min(w - 1);
+                    moments.refresh(|| values.range(prev..).flatten().copied().chain(v));
+                }
+            }
+            for (stat, builder) in stats.iter().zip(builders.iter_mut()) {
+                if let Some(builder) = builder {
+                    let out = if moments.n >= min_periods && moments.n > 0 {
+                        moments.stat(*stat, v, alpha)
+                    } else {
+                        None
+                    };
+                    builder.append_option(out.and_then(NumCast::from));
+                }
+            }
+        }
+        if values.len() == max_window {
+            values.pop_front();
+        }
+        values.push_back(v);
+    }
+    builders
+        .into_iter()
+        .map(|builders| {
+            builders
+                .into_iter()
+                .map(|builder| builder.map(|b| b.finish()))
+                .collect()
+        })
+        .collect()
+}
+
+/// `impl_rolling_moments` with the output dtype chosen at runtime
+pub fn rolling_moments<T>(
+    ca: &ChunkedArray<T>,
+    windows: &[usize],
+    min_periods: Option<usize>,
+    stats: &[Stat],
+    dtype: &PlDataType,
+) -> Vec<Vec<Option<Series>>>
+where
+    T: PolarsNumericType,
+{
+    fn to_series<O: PolarsFloatType>(
+        out: Vec<Vec<Option<ChunkedArray<O>>>>,
+    ) -> Vec<Vec<Option<Series>>> {
+        out.into_iter()
+            .map(|out| {
+                out.into_iter()
+                    .map(|ca| ca.map(|ca| ca.into_series()))
+                    .collect()
+            })
+            .collect()
+    }
+    match dtype {
+        PlDataType::Float32 => to_series(impl_rolling_moments::<T, Float32Type>(
+            ca,
+            windows,
+            min_periods,
+            stats,
+        )),
+        _ => to_series(impl_rolling_moments::<T, Float64Type>(
+            ca,
+            windows,
+            min_periods,
+            stats,
+        )),
+    }
+}
+
+fn impl_rolling_stats<T, F>(
+    ca: &ChunkedArray<T>,
+    stats: &[Stat],
+    kwargs: &RollingStatsKwargs,
+    dtype: &PlDataType,
+    rank: F,
+) -> PolarsResult<Vec<Series>>
+where
+    T: PolarsNumericType,
+    F: Fn(&ChunkedArray<T>, usize) -> PolarsResult<Series>,
+{
+    let min_periods = kwargs
+        .min_periods
+        .unwrap_or(kwargs.window / 2)
+        .min(kwargs.window);
+    let moments = rolling_moments(ca, &[kwargs.window], Some(min_periods), stats, dtype)
+        .pop()
+        .unwrap();
+    moments
+        .into_iter()
+        .zip(&kwargs.stats)
+        .map(|(out, name)| {
+            // rank needs an ordered window instead of moments
+            let out = match out {
+                Some(out) => out,
+                None => rank(ca, min_periods)?,
+            };
+            Ok(out.with_name(name.as_str().into()))
+        })
+        .collect()
+}
+
+macro_rules! rolling_stats_with_rank {
+    ($ca: expr, $stats: expr, $kwargs: expr, $dtype: expr) => {{
+        let kwargs = $kwargs;
+        let dtype = $dtype;
+        impl_rolling_stats($ca, $stats, kwargs, dtype, |ca, min_periods| {
+            if kwargs.window >= RANK_TREE_WINDOW {
+                // the tree reads the chunks in place and writes dtype
+                Ok(rolling_rank_tree_as(
+                    ca,
+                    kwargs.window,
+                    Some(min_periods),
+                    kwargs.pct,
+                    false,
+                    dtype,
+                ))
+            } else {
+                rolling_by_blocks_as(ca, kwargs.window, dtype, |ca| {
+                    Ok(ca.ts_vrank(kwargs.window, Some(min_periods), kwargs.pct, false))
+                })
+            }
+        })
+    }};
+}
+
+crate::profiled! {
+/// Several rolling statistics of the same window in one call, returned as a
+/// struct with a field per statistic. mean, std, skew, kurt, zscore and ewm
+/// share the same accumulators and are computed in a single pass.
+#[polars_expr(output_type_func_with_kwargs=rolling_stats_output)]
+fn rolling_stats(inputs: &[Series], kwargs: RollingStatsKwargs) -> PolarsResult<Series> {
+    let s = &inputs[0];
+    let name = s.name().clone();
+    let dtype = float_output_dtype(kwargs.output_dtype.as_deref())?;
+    let stats = kwargs
+        .stats
+        .iter()
+        .map(|name| Stat::parse(name))
+        .collect::<PolarsResult<Vec<_>>>()?;
+    let fields = match s.dtype() {
+        PlDataType::Int32 => rolling_stats_with_rank!(s.i32()?, &stats, &kwargs, &dtype)?,
+        PlDataType::Int64 => rolling_stats_with_rank!(s.i64()?, &stats, &kwargs, &dtype)?,
+        PlDataType::Float32 => rolling_stats_with_rank!(s.f32()?, &stats, &kwargs, &dtype)?,
+        PlDataType::Float64 => rolling_stats_with_rank!(s.f64()?, &stats, &kwargs, &dtype)?,
+        dtype => {
+            polars_bail!(InvalidOperation: "dtype {dtype} not \
+            supported for rolling_stats, expected Int32, Int64, Float32, Float64.")
+        }
+    };
+    Ok(StructChunked::from_series(name, s.len(), fields.iter())?.into_series())
+}
+}
+
+#[derive(Deserialize)]
+struct RollingStatsByKwargs {
+    /// length of the window in nanoseconds
+    period: i64,
+    min_periods: Option<usize>,
+    stats: Vec<String>,
+    pct: bool,
+    rev: bool,
+    output_dtype: Option<String>,
+}
+
+/// The moment statistics of `stats` over the time window `(t - period, t]`,
+/// rank is skipped. The values leaving the window are read by a second
+/// iterator over `ca` moved by `TimeWindow`, so the input is never copied.
+/// The Welford state of std is computed again from a slice of the window once
+/// as many values as the window holds were added, amortized O(1) per row.
+fn impl_rolling_moments_by_time<T, O>(
+    ca: &ChunkedArray<T>,
+    times: &Int64Chunked,
+    period: i64,
+    min_periods: usize,
+    stats: &[Stat],
+) -> PolarsResult<Vec<Option<ChunkedArray<O>>>>
+where
+    T: PolarsNumericType,
+    O: PolarsFloatType,
+    O::Native: NumCast,
+{
+    with_needs!(
+        stats,
+        moments_pass_by_time::<T, O>(ca, times, period, min_periods, stats)
+    )
+}
+
+fn moments_pass_by_time<T, O, const N: u8>(
+    ca: &ChunkedArray<T>,
+    times: &Int64Chunked,
+    period: i64,
+    min_periods: usize,
+    stats: &[Stat],
+) -> PolarsResult<Vec<Option<ChunkedArray<O>>>>
+where
+    T: PolarsNumericType,
+    O: PolarsFloatType,
+    O::Native: NumCast,
+{
+    let mut builders: Vec<_> = stats
+        .iter()
+        .map(|stat| {
+            (*stat != Stat::Rank).then(|| PrimitiveChunkedBuilder::<O>::new("".into(), ca.len()))
+        })
+        .collect();
+    let mut window = TimeWindow::new(times.iter(), times.iter(), period);
+    let mut tail = ca.iter();
+    let mut moments = Moments::<N>::default();
+    // first row of the window
+    let mut start = 0;
+    for (i, v) in ca.iter().enumerate() {
+        for _ in 0..window.advance()? {
+            start += 1;
+            if let Some(old) = tail.next().flatten().and_then(|v| v.to_f64()) {
+                moments.remove(old, 1.);
+            }
+        }
+        let v = v.and_then(|v| v.to_f64());
+        if let Some(v) = v {
+            moments.add(v, 0.);
+        }
+        if N & WELFORD != 0 {
+            moments.since_refresh += 1;
+            if moments.since_refresh >= i + 1 - start {
+                let rows = ca.slice(start as i64, i + 1 - start);
+                moments.refresh(|| rows.iter().flatten().filter_map(|v| v.to_f64()));
+            }
+        }
+        for (stat, builder) in stats.iter().zip(builders.iter_mut()) {
+            if let Some(builder) = builder {
+                let out = if moments.n >= min_periods && moments.n > 0 {
+                    moments.stat(*stat, v, 0.)
+                } else {
+                    None
+                };
+                builder.append_option(out.and_then(NumCast::from));
+            }
+        }
+    }
+    Ok(builders
+        .into_iter()
+        .map(|builder| builder.map(|b| b.finish()))
+        .collect())
+}
+
+fn rolling_stats_by_time<T>(
+    ca: &ChunkedArray<T>,
+    times: &Int64Chunked,
+    period: i64,
+    stats: &[Stat],
+    kwargs: &RollingStatsByKwargs,
+    dtype: &PlDataType,
+) -> PolarsResult<Vec<Series>>
+where
+    T: PolarsNumericType,
+{
+    fn to_series<O: PolarsFloatType>(out: Vec<Option<ChunkedArray<O>>>) -> Vec<Option<Series>> {
+        out.into_iter()
+            .map(|ca| ca.map(|ca| ca.into_series()))
+            .collect()
+    }
+    // a time window may hold a single row, so every row counts by default
+    let min_periods = kwargs.min_periods.unwrap_or(1);
+    let moments = match dtype {
+        PlDataType::Float32 => to_series(impl_rolling_moments_by_time::<T, Float32Type>(
+            ca,
+            times,
+            period,
+            min_periods,
+            stats,
+        )?),
+        _ => to_series(impl_rolling_moments_by_time::<T, Float64Type>(
+            ca,
+            times,
+            period,
+            min_periods,
+            stats,
+        )?),
+    };
+    moments
+        .into_iter()
+        .zip(&kwargs.stats)
+        .map(|(out, name)| {
+            let out = match out {
+                Some(out) => out,
+                None => impl_rolling_rank_by_time(
+                    ca,
+                    times,
+                    period,
+                    min_periods,
+                    kwargs.pct,
+                    kwargs.rev,
+                    dtype,
+                )?,
+            };
+            Ok(out.with_name(name.as_str().into()))
+        })
+        .collect()
+}
+
+crate::profiled! {
+/// `rolling_stats` over a time window instead of a number of rows. The second
+/// input is a Date or Datetime column sorted in ascending order, the window of
+/// a row at time `t` is `(t - period, t]`.
+#[polars_expr(output_type_func_with_kwargs=rolling_stats_output)]
+fn rolling_stats_by(inputs: &[Series], kwargs: RollingStatsByKwargs) -> PolarsResult<Series> {
+    let s = &inputs[0];
+    let by = &inputs[1];
+    polars_ensure!(
+        by.len() == s.len(),
+        ShapeMismatch: "the by column should have the same length as the input"
+    );
+    let name = s.name().clone();
+    let (times, period) = time_index(by, kwargs.period)?;
+    let dtype = float_output_dtype(kwargs.output_dtype.as_deref())?;
+    let stats = kwargs
+        .stats
+        .iter()
+        .map(|name| Stat::parse(name))
+        .collect::<PolarsResult<Vec<_>>>()?;
+    polars_ensure!(
+        !stats.contains(&Stat::Ewm),
+        InvalidOperation: "ewm is defined on a number of rows and does not support a time window"
+    );
+    let fields = match s.dtype() {
+        PlDataType::Int32 => {
+            rolling_stats_by_time(s.i32()?, &times, period, &stats, &kwargs, &dtype)?
+        }
+        PlDataType::Int64 => {
+            rolling_stats_by_time(s.i64()?, &times, period, &stats, &kwargs, &dtype)?
+        }
+        PlDataType::Float32 => {
+            rolling_stats_by_time(s.f32()?, &times, period, &stats, &kwargs, &dtype)?
+        }
+        PlDataType::Float64 => {
+            rolling_stats_by_time(s.f64()?, &times, period, &stats, &kwargs, &dtype)?
+        }
+        dtype => {
+            polars_bail!(InvalidOperation: "dtype {dtype} not \
+            supported for rolling_stats_by, expected Int32, Int64, Float32, Float64.")
+        }
+    };
+    Ok(StructChunked::from_series(name, s.len(), fields.iter())?.into_series())
+}
+}
+
+/// Float64 rolling zscore over a time window, used by the strategies whose
+/// band is a time window.
+pub(crate) fn rolling_zscore_by_time(
+    s: &Series,
+    by: &Series,
+    period_ns: i64,
+    min_periods: Option<usize>,
+) -> PolarsResult<Float64Chunked> {
+    polars_ensure!(
+        by.len() == s.len(),
+        ShapeMismatch: "the by column should have the same length as the input"
+    );
+    let (times, period) = time_index(by, period_ns)?;
+    let min_periods = min_periods.unwrap_or(1);
+    let stats = [Stat::Zscore];
+    let mut out = match s.dtype() {
+        PlDataType::Int32 => impl_rolling_moments_by_time::<_, Float64Type>(
+            s.i32()?,
+            &times,
+            period,
+            min_periods,
+            &stats,
+        )?,
+        PlDataType::Int64 => impl_rolling_moments_by_time::<_, Float64Type>(
+            s.i64()?,
+            &times,
+            period,
+            min_periods,
+            &stats,
+        )?,
+        PlDataType::Float32 => impl_rolling_moments_by_time::<_, Float64Type>(
+            s.f32()?,
+            &times,
+            period,
+            min_periods,
+            &stats,
+        )?,
+        PlDataType::Float64 => impl_rolling_moments_by_time::<_, Float64Type>(
+            s.f64()?,
+            &times,
+            period,
+            min_periods,
+            &stats,
+        )?,
+        dtype => {
+            polars_bail!(InvalidOperation: "dtype {dtype} not \
+            supported for rolling_zscore, expected Int32, Int64, Float32, Float64.")
+        }
+    };
+    Ok(out.pop().flatten().unwrap())
+}
@@ -1,20 +1,216 @@
 use gauss_quad::Midpoint;
-use polars::prelude::arity::binary_elementwise;
 use polars::prelude::*;
+use polars_arrow::array::{Array, PrimitiveArray};
+use polars_arrow::compute::utils::combine_validities_and;
+use polars_core::utils::align_chunks_binary;
+use polars_core::POOL;
 use pyo3_polars::derive::polars_expr;
+use rayon::prelude::*;
 use serde::Deserialize;
+use std::collections::{HashMap, HashSet};
 use std::f64::consts::PI;
+use std::sync::{LazyLock, Mutex};
 use tea_strategy::tevec::prelude::Cast;
 
+/// Upper bound of the cached (n_ask, n_bid) pairs, the cache is cleared once
+/// it is exceeded so a run over unusual queue sizes can not grow it forever.
+const UP_PROB_CACHE_SIZE: usize = 1 << 20;
+/// Max bisection depth of the adaptive quadrature.
+const ADAPTIVE_MAX_DEPTH: usize = 50;
+/// Min number of rows handled by one rayon task, most rows are table lookups.
+const PAR_BLOCK_SIZE: usize = 64;
+
+/// Probabilities of integer queue sizes which have been integrated, shared by
+/// all the calls with the same quadrature.
+static UP_PROB_CACHE: LazyLock<Mutex<HashMap<(QuadKey, i32, i64), f64>>> =
+    LazyLock::new(|| Mutex::new(HashMap::new()));
+
+#[derive(Clone, Copy, PartialEq, Eq, Hash)]
+enum QuadKey {
+    Midpoint(usize),
+    Adaptive(u64),
+}
+
+enum Quad {
+    Midpoint(usize, Midpoint),
+    /// Adaptive Gauss-Kronrod quadrature with absolute error tolerance
+    Adaptive(f64),
+}
+
+impl Quad {
+    fn new(degree: Option<usize>, tol: Option<f64>) -> PolarsResult<Self> {
+        if let Some(tol) = tol {
+            polars_ensure!(tol > 0., InvalidOperation: "tol of tick_up_prob should be positive");
+            Ok(Quad::Adaptive(tol))
+        } else {
+            let degree = degree.unwrap_or(1_000_000);
+            let quad = Midpoint::new(degree)
+                .map_err(|e| polars_err!(InvalidOperation: "invalid degree {degree}: {e}"))?;
+            Ok(Quad::Midpoint(degree, quad))
+        }
+    }
+
+    #[inline]
+    fn key(&self) -> QuadKey {
+        match self {
+            Quad::Midpoint(degree, _) => QuadKey::Midpoint(*degree),
+            Quad::Adaptive(tol) => QuadKey::Adaptive(tol.to_bits()),
+        }
+    }
+
+    #[inline]
+    fn integrate<F: Fn(f64) -> f64>(&self, a: f64, b: f64, f: F) -> f64 {
+        match self {
+            Quad::Midpoint(_, quad) => quad.integrate(a, b, f),
+            Quad::Adaptive(tol) => adaptive_gk15(a, b, &f, *tol),
+        }
+    }
+}
+
+// nodes and weights of the 15 points Kronrod rule and the embedded 7 points
+// Gauss rule on [-1, 1], only the non-negative half is stored
+const GK15_NODES: [f64; 8] = [
+    0.991455371120812639206854697526329,
+    0.949107912342758524526189684047851,
+    0.864864423359769072789712788640926,
+    0.741531185599394439863864773280788,
+    0.586087235467691130294144845693013,
+    0.405845151377397166906606412076961,
+    0.207784955007898467600689403773245,
+    0.000000000000000000000000000000000,
+];
+const K15_WEIGHTS: [f64; 8] = [
+    0.022935322010529224963732008058970,
+    0.063092092629978553290700663189204,
+    0.104790010322250183839876322541518,
+    0.140653259715525918745189590510238,
+    0.169004726639267902826583426598550,
+    0.190350578064785409913256402421014,
+    0.204432940075298892414161999234649,
+    0.209482141084727828012999174891714,
+];
+const G7_WEIGHTS: [f64; 4] = [
+    0.129484966168869693270611432679082,
+    0.279705391489276667901467771423780,
+    0.381830050505118944950369775488975,
+    0.417959183673469387755102040816327,
+];
+
+/// Kronrod and Gauss estimation of the integral of f over [a, b]
 #[inline]
-fn up_prob(n_ask: f64, n_bid: f64, quad_method: &Midpoint) -> f64 {
+fn gk15<F: Fn(f64) -> f64>(a: f64, b: f64, f: &F) -> (f64, f64) {
+    let center = 0.5 * (a + b);
+    let half = 0.5 * (b - a);
+    let fc = f(center);
+    let mut kronrod = fc * K15_WEIGHTS[7];
+    let mut gauss = fc * G7_WEIGHTS[3];
+    for i in 0..7 {
+        let dx = half * GK15_NODES[i];
+        let sum = f(center - dx) + f(center + dx);
+        kronrod += K15_WEIGHTS[i] * sum;
+        // odd nodes are shared with the gauss rule
+        if i % 2 == 1 {
+            gauss += G7_WEIGHTS[i / 2] * sum;
+        }
+    }
+    (kronrod * half, gauss * half)
+}
+
+/// The interval is bisected until the difference of the Kronrod and Gauss
+/// estimations is below its share of `tol`. The nodes never touch the end
+/// points, so integrable singularities there are fine.
+fn adaptive_gk15<F: Fn(f64) -> f64>(a: f64, b: f64, f: &F, tol: f64) -> f64 {
+    let width = b - a;
+    let mut res = 0.;
+    let mut stack = vec![(a, b, 0)];
+    while let Some((a, b, depth)) = stack.pop() {
+        let (kronrod, gauss) = gk15(a, b, f);
+        if (kronrod - gauss).abs() <= tol * (b - a) / width || depth >= ADAPTIVE_MAX_DEPTH {
+            res += kronrod;
+        } else {
+            let mid = 0.5 * (a + b);
+            stack.push((a, mid, depth + 1));
+            stack.push((mid, b, depth + 1));
+        }
+    }
+    res
+}
+
+#[inline]
+fn up_prob(n_ask: f64, n_bid: f64, quad: &Quad) -> f64 {
     let f = |t: f64| -> f64 {
         (2. - t.cos() - ((2. - t.cos()) * (2. - t.cos()) - 1.).sqrt()).powi(n_ask as i32)
             * (n_bid * t).sin()
             * (t * 0.5).cos()
             / (t * 0.5).sin()
     };
-    1. / PI * quad_method.integrate(0.0, PI, f)
+    1. / PI * quad.integrate(0.0, PI, f)
+}
+
+/// The integrand only uses the integer part of n_ask, so a pair can be
+/// looked up in the table whenever n_bid is an integer.
+#[inline]
+fn integer_key(n_ask: f64, n_bid: f64) -> Option<(i32, i64)> {
+    if n_bid.fract() == 0. && n_bid.abs() < i64::MAX as f64 {
+        Some((n_ask as i32, n_bid as i64))
+    } else {
+        None
+    }
+}
+
+/// Probability of every distinct integer pair in the inputs, reusing the
+/// pairs integrated by previous calls.
+fn up_prob_table<T1, T2>(
+    n_ask: &ChunkedArray<T1>,
+    n_bid: &ChunkedArray<T2>,
+    quad: &Quad,
+) -> HashMap<(i32, i64), f64>
+where
+    T1: PolarsDataType + PolarsNumericType,
+    T1::Native: Cast<f64>,
+    T2: PolarsDataType + PolarsNumericType,
+    T2::Native: Cast<f64>,
+{
+    let quad_key = quad.key();
+    // the distinct pairs are collected before the cache is locked, so the
+    // lock is held for one lookup per pair rather than over the whole scan
+    let keys: HashSet<(i32, i64)> = n_ask
+        .into_iter()
+        .zip(n_bid)
+        .filter_map(|(n_ask, n_bid)| integer_key(n_ask?.cast(), n_bid?.cast()))
+        .collect();
+    let mut table = HashMap::with_capacity(keys.len());
+    let mut missing = Vec::new();
+    {
+        let cache = UP_PROB_CACHE.lock().unwrap();
+        for key in keys {
+            match cache.get(&(quad_key, key.0, key.1)) {
+                Some(prob) => {
+                    table.insert(key, *prob);
+                }
+                None => missing.push(key),
+            }
+        }
+    }
+    if !missing.is_empty() {
+        // each pair is a full integration, so they are spread one by one over
+        // the pool, the lock is not held meanwhile
+        let probs: Vec<f64> = POOL.install(|| {
+            missing
+                .par_iter()
+                .map(|(n_ask, n_bid)| up_prob(*n_ask as f64, *n_bid as f64, quad))
+                .collect()
+        });
+        let mut cache = UP_PROB_CACHE.lock().unwrap();
+        if cache.len() + missing.len() > UP_PROB_CACHE_SIZE {
+            cache.clear();
+        }
+        for (key, prob) in missing.into_iter().zip(probs) {
+            table.insert(key, prob);
+            cache.insert((quad_key, key.0, key.1), prob);
+        }
+    }
+    table
 }
 
 #[inline]
@@ -22,55 +218,105 @@ pub fn tick_up_prob_rs<T1, T2>(
     n_ask: &ChunkedArray<T1>,
     n_bid: &ChunkedArray<T2>,
     degree: Option<usize>,
-) -> Float64Chunked
+    tol: Option<f64>,
+) -> PolarsResult<Float64Chunked>
 where
     T1: PolarsDataType + PolarsNumericType,
     T1::Native: Cast<f64>,
     T2: PolarsDataType + PolarsNumericType,
     T2::Native: Cast<f64>,
 {
-    let quad_method = Midpoint::new(degree.unwrap_or(1_000_000)).unwrap();
-    binary_elementwise(n_ask, n_bid, |n_ask, n_bid| match (n_ask, n_bid) {
-        (Some(n_ask), Some(n_bid)) => Some(up_prob(n_ask.cast(), n_bid.cast(), &quad_method)),
-        _ => None,
-    })
+    let quad = Quad::new(degree, tol)?;
+    let table = up_prob_table(n_ask, n_bid, &quad);
+    let (n_ask, n_bid) = align_chunks_binary(n_ask, n_bid);
+    let chunks = n_ask
+        .downcast_iter()
+        .zip(n_bid.downcast_iter())
+        .map(|(n_ask, n_bid)| {
+            let validity = combine_validities_and(n_ask.validity(), n_bid.validity());
+            let mut out = vec![f64::NAN; n_ask.len()];
+            // rows are independent and written in place, the ones with a
+            // fractional n_bid are integrated on the polars thread pool so
+            // POLARS_MAX_THREADS is respected
+            POOL.install(|| {
+                out.par_iter_mut()
+                    .zip(n_ask.values().as_slice().par_iter())
+                    .zip(n_bid.values().as_slice().par_iter())
+                    .enumerate()
+                    .with_min_len(PAR_BLOCK_SIZE)
+                    .for_each(|(i, ((out, n_ask), n_bid))| {
+                        if validity.as_ref().is_some_and(|v| !v.get_bit(i)) {
+                            return;
+                        }
+                        let (n_ask, n_bid): (f64, f64) = ((*n_ask).cast(), (*n_bid).cast());
+                        *out = match integer_key(n_ask, n_bid) {
+                            Some(key) => table[&key],
+                            // non-integer n_bid falls back to integration
+                            None => up_prob(n_ask, n_bid, &quad),
+                        };
+                    })
+            });
+            PrimitiveArray::from_vec(out).with_validity(validity)
+        });
+    Ok(Float64Chunked::from_chunk_iter(PlSmallStr::EMPTY, chunks))
 }
 
 #[derive(Deserialize)]
 pub struct TickUpProbKwargs {
     degree: Option<usize>,
+    tol: Option<f64>,
 }
 
+crate::profiled! {
 #[polars_expr(output_type=Float64)]
 fn tick_up_prob(inputs: &[Series], kwargs: TickUpProbKwargs) -> PolarsResult<Series> {
     let n_ask = &inputs[0];
     let n_bid = &inputs[1];
     let name = n_ask.name();
+    let (degree, tol) = (kwargs.degree, kwargs.tol);
     use DataType::*;
     let out = match (n_ask.dtype(), n_bid.dtype()) {
-        (Int32, Int32) => tick_up_prob_rs(n_ask.i32()?, n_bid.i32()?, kwargs.degree),
-        (Int64, Int64) => tick_up_prob_rs(n_ask.i64()?, n_bid.i64()?, kwargs.degree),
-        (Float32, Float32) => tick_up_prob_rs(n_ask.f32()?, n_bid.f32()?, kwargs.degree),
-        (Float64, Float64) => tick_up_prob_rs(n_ask.f64()?, n_bid.f64()?, kwargs.degree),
-        (Int32, Int64) => tick_up_prob_rs(n_ask.i32()?, n_bid.i64()?, kwargs.degree),
-        (Int64, Int32) => tick_up_prob_rs(n_ask.i64()?, n_bid.i32()?, kwargs.degree),
-        (Float32, Float64) => tick_up_prob_rs(n_ask.f32()?, n_bid.f64()?, kwargs.degree),
-        (Float64, Float32) => tick_up_prob_rs(n_ask.f64()?, n_bid.f32()?, kwargs.degree),
+        (Int32, Int32) => tick_up_prob_rs(n_ask.i32()?, n_bid.i32()?, degree, tol),
+        (Int64, Int64) => tick_up_prob_rs(n_ask.i64()?, n_bid.i64()?, degree, tol),
+        (Float32, Float32) => tick_up_prob_rs(n_ask.f32()?, n_bid.f32()?, degree, tol),
+        (Float64, Float64) => tick_up_prob_rs(n_ask.f64()?, n_bid.f64()?, degree, tol),
+        (Int32, Int64) => tick_up_prob_rs(n_ask.i32()?, n_bid.i64()?, degree, tol),
+        (Int64, Int32) => tick_up_prob_rs(n_ask.i64()?, n_bid.i32()?, degree, tol),
+        (Float32, Float64) => tick_up_prob_rs(n_ask.f32()?, n_bid.f64()?, degree, tol),
+        (Float64, Float32) => tick_up_prob_rs(n_ask.f64()?, n_bid.f32()?, degree, tol),
         (dtype1, dtype2) => {
             polars_bail!(InvalidOperation: "dtype1 {dtype1} and dtype2 {dtype2} not
             supported for tick_up_prob, expected Int32, Int64, Float32, Float64.")
         }
-    };
+    }?;
     Ok(out.with_name(name.clone()).into_series())
 }
+}
 
 #[cfg(test)]
 mod tests {
     use super::*;
     #[test]
     fn test_up_prob() {
-        let quad_method = Midpoint::new(1_000_000).unwrap();
-        let res = up_prob(2., 1., &quad_method);
+        let quad = Quad::new(Some(1_000_000), None).unwrap();
+        let res = up_prob(2., 1., &quad);
         assert!((res - 0.30234727368).abs() < 1e-10)
     }
+
+    #[test]
+    fn test_up_prob_adaptive() {
+        let quad = Quad::new(None, Some(1e-12)).unwrap();
+        let res = up_prob(2., 1., &quad);
+        assert!((res - 0.30234727368).abs() < 1e-10)
+    }
+
+    #[test]
+    fn test_up_prob_table() {
+        let n_ask = Int32Chunked::new("a".into(), &[2, 2, 3, 2]);
+        let n_bid = Float64Chunked::new("b".into(), &[1., 1., 2., 1.5]);
+        let res = tick_up_prob_rs(&n_ask, &n_bid, Some(10_000), None).unwrap();
+        let quad = Quad::new(Some(10_000), None).unwrap();
+        let expect = [(2., 1.), (2., 1.), (3., 2.), (2., 1.5)].map(|(a, b)| up_prob(a, b, &quad));
+        assert_eq!(res.into_no_null_iter().collect::<Vec<_>>(), expect.to_vec());
+    }
 }
@@ -0,0 +1,82 @@
+use polars::prelude::*;
+use std::iter::Peekable;
+
+const NS_PER_DAY: i64 = 86_400_000_000_000;
+
+/// Physical values of a Date / Datetime `by` column and the length of a
+/// window of `period_ns` nanoseconds in the same unit.
+pub(super) fn time_index(by: &Series, period_ns: i64) -> PolarsResult<(Int64Chunked, i64)> {
+    let period = match by.dtype() {
+        DataType::Datetime(TimeUnit::Nanoseconds, _) => period_ns,
+        DataType::Datetime(TimeUnit::Microseconds, _) => period_ns / 1_000,
+        DataType::Datetime(TimeUnit::Milliseconds, _) => period_ns / 1_000_000,
+        DataType::Date => {
+            polars_ensure!(
+                period_ns % NS_PER_DAY == 0,
+                InvalidOperation: "the window of a Date by column should be whole days"
+            );
+            period_ns / NS_PER_DAY
+        }
+        dtype => {
+            polars_bail!(InvalidOperation: "dtype {dtype} not \
+            supported for the by column, expected Date or Datetime.")
+        }
+    };
+    polars_ensure!(
+        period > 0,
+        InvalidOperation: "the window should be at least one unit of the by column"
+    );
+    let times = by.to_physical_repr().cast(&DataType::Int64)?;
+    Ok((times.i64()?.clone(), period))
+}
+
+/// Two pointers over a sorted time column. The window of a row at time `t`
+/// is `(t - period, t]`, `advance` moves the head to the next row and the
+/// tail past the rows which left the window, so a pass is O(n) whatever the
+/// number of rows in a window.
+pub(super) struct TimeWindow<I: Iterator<Item = Option<i64>>> {
+    head: I,
+    tail: Peekable<I>,
+    period: i64,
+    last: Option<i64>,
+}
+
+impl<I: Iterator<Item = Option<i64>>> TimeWindow<I> {
+    /// `head` and `tail` should be two iterators over the same time column
+    pub(super) fn new(head: I, tail: I, period: i64) -> Self {
+        TimeWindow {
+            head,
+            tail: tail.peekable(),
+            period,
+            last: None,
+        }
+    }
+
+    /// Move to the next row, returns how many of the oldest rows left the
+    /// window.
+    pub(super) fn advance(&mut self) -> PolarsResult<usize> {
+        let t = match self.head.next() {
+            Some(Some(t)) => t,
+            Some(None) => polars_bail!(ComputeError: "the by column should not contain nulls"),
+            None => polars_bail!(ShapeMismatch: "the by column is shorter than the input"),
+        };
+        if let Some(last) = self.last {
+            polars_ensure!(
+                t >= last,
+                ComputeError: "the by column should be sorted in ascending order"
+            );
+        }
+        self.last = Some(t);
+        let start = t.saturating_sub(self.period);
+        let mut leaving = 0;
+        // the tail never passes the head as the current row is in the window
+        while let Some(Some(old)) = self.tail.peek() {
+            if *old > start {
+                break;
+            }
+            self.tail.next();
+            leaving += 1;
+        }
+        Ok(leaving)
+    }
+}
@@ -4,15 +4,18 @@ use pyo3_polars::derive::polars_expr;
 use tea_strategy::tevec::prelude::{unit, DateTime, TIter};
 use tea_strategy::{signal_to_trades, trade_vec_to_series};
 
+crate::profiled! {
 #[polars_expr(output_type=Float64)]
 pub fn to_trades(inputs: &[Series]) -> PolarsResult<Series> {
     use PlDataType::*;
-    let signal = &inputs[0].cast(&Float64)?;
+    // signal_to_trades reads f64 signals and prices, only the inputs of other
+    // dtypes are cast
+    let signal = crate::auto_cast!(Float64(inputs[0]));
     let name = signal.name();
     let time = &inputs[1].cast(&Datetime(TimeUnit::Nanoseconds, None))?;
     let trades = match inputs.len() {
         3 => {
-            let price = &inputs[2].cast(&Float64)?;
+            let price = crate::auto_cast!(Float64(inputs[2]));
             signal_to_trades(
                 signal.f64()?.titer(),
                 price.f64()?.titer().into(),
@@ -20,8 +23,7 @@ pub fn to_trades(inputs: &[Series]) -> PolarsResult<Series> {
             )
         }
         4 => {
-            let bid_price = &inputs[2].cast(&Float64)?;
-            let ask_price = &inputs[3].cast(&Float64)?;
+            let (bid_price, ask_price) = crate::auto_cast!(Float64(&inputs[2], &inputs[3]));
             signal_to_trades(
                 signal.f64()?.titer(),
                 (bid_price.f64()?.titer(), ask_price.f64()?.titer()).into(),
@@ -36,3 +38,4 @@ pub fn to_trades(inputs: &[Series]) -> PolarsResult<Series> {
     };
     Ok(trade_vec_to_series(&trades).with_name(name.clone()))
 }
+}
@@ -5,27 +5,47 @@ use pyo3_polars::derive::polars_expr;
 use serde::Deserialize;
 use tea_strategy::tevec::prelude::*;
 
+use super::rolling_stats::{multi_window_moment, rolling_moment, Stat, Window, WindowOutputKwargs};
+use crate::output_func::float_output_dtype;
+
 #[derive(Deserialize)]
 struct TsZscoreKwargs {
-    window: usize,
+    window: Window,
     min_periods: Option<usize>,
+    output_dtype: Option<String>,
 }
 
-#[polars_expr(output_type=Float64)]
+fn rolling_zscore_output(
+    input_fields: &[Field],
+    kwargs: WindowOutputKwargs,
+) -> PolarsResult<Field> {
+    kwargs.field(input_fields, "zscore")
+}
+
+crate::profiled! {
+#[polars_expr(output_type_func_with_kwargs=rolling_zscore_output)]
 fn rolling_zscore(inputs: &[Series], kwargs: TsZscoreKwargs) -> PolarsResult<Series> {
     let s = &inputs[0];
-    let name = s.name();
-    let out: Float64Chunked = match s.dtype() {
-        PlDataType::Int32 => s.i32()?.ts_vzscore(kwargs.window, kwargs.min_periods),
-        PlDataType::Int64 => s.i64()?.ts_vzscore(kwargs.window, kwargs.min_periods),
-        PlDataType::Float32 => s.f32()?.ts_vzscore(kwargs.window, kwargs.min_periods),
-        PlDataType::Float64 => s.f64()?.ts_vzscore(kwargs.window, kwargs.min_periods),
-        dtype => {
-            polars_bail!(InvalidOperation: "dtype {dtype} not \
-            supported for rolling_zscore, expected Int32, Int64, Float32, Float64.")
-        }
-    };
-    Ok(out.with_name(name.clone()).into_series())
+    let dtype = float_output_dtype(kwargs.output_dtype.as_deref())?;
+    match &kwargs.window {
+        Window::One(window) => rolling_moment(
+            s,
+            *window,
+            kwargs.min_periods,
+            Stat::Zscore,
+            "zscore",
+            &dtype,
+        ),
+        Window::Many(windows) => multi_window_moment(
+            s,
+            windows,
+            kwargs.min_periods,
+            Stat::Zscore,
+            "zscore",
+            &dtype,
+        ),
+    }
+}
 }
 
 #[derive(Deserialize)]
@@ -52,6 +72,7 @@ where
     })
 }
 
+crate::profiled! {
 #[polars_expr(output_type=Float64)]
 fn zscore(inputs: &[Series], kwargs: ZscoreKwargs) -> PolarsResult<Series> {
     let s = &inputs[0];
@@ -68,3 +89,4 @@ fn zscore(inputs: &[Series], kwargs: ZscoreKwargs) -> PolarsResult<Series> {
     };
     Ok(out.with_name(name.clone()).into_series())
 }
+}
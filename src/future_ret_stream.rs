@@ -0,0 +1,596 @@
+//! The equity kernels of tea_strategy row by row: `calc_future_ret` (and
+//! `calc_future_ret_with_spread`) for the outputs that reduce the equity
+//! curve (summary statistics, final equity), `calc_tick_future_ret` and
+//! `calc_tick_future_ret_full` for the same and for the ticks read batch by
+//! batch, starting from the account left by the previous batch.
+//!
+//! The kernels only return whole curves from an empty account, so their
+//! loops are vendored here from tea_strategy master, with the account made
+//! explicit. They follow the kernels step by step, in the same order of float
+//! operations, and give the same output on every row. This is the only copy
+//! in the crate, keep it in sync when bumping tea_strategy:
+//! `tests/test_equity.py` compares every path with the kernels.
+use crate::equity_stats::EquityStats;
+use crate::float_dispatch;
+use crate::tick_engine::OpenPriceMethod;
+use num_traits::ToPrimitive;
+use polars::prelude::*;
+use serde::Deserialize;
+use tea_strategy::equity::{CommissionType, FutureRetKwargs};
+
+/// kwargs of `calc_future_ret` and `calc_future_ret_with_spread`
+#[derive(Deserialize)]
+pub(crate) struct FutureRetStreamKwargs {
+    init_cash: f64,
+    multiplier: f64,
+    leverage: f64,
+    /// the spread column replaces it in `calc_future_ret_with_spread`
+    #[serde(default)]
+    slippage: f64,
+    c_rate: f64,
+    blowup: bool,
+    commission_type: CommissionType,
+}
+
+impl From<&FutureRetKwargs> for FutureRetStreamKwargs {
+    fn from(kwargs: &FutureRetKwargs) -> Self {
+        FutureRetStreamKwargs {
+            init_cash: kwargs.init_cash as f64,
+            multiplier: kwargs.multiplier,
+            leverage: kwargs.leverage,
+            slippage: kwargs.slippage,
+            c_rate: kwargs.c_rate,
+            blowup: kwargs.blowup,
+            commission_type: kwargs.commission_type.clone(),
+        }
+    }
+}
+
+/// The account between two rows
+struct FutureRetState {
+    cash: f64,
+    /// signed number of lots
+    lots: f64,
+    last_pos: f64,
+    last_close: Option<f64>,
+    blown: bool,
+}
+
+struct FutureRetEngine<'a> {
+    kwargs: &'a FutureRetStreamKwargs,
+    percent_commission: bool,
+}
+
+impl<'a> FutureRetEngine<'a> {
+    fn new(kwargs: &'a FutureRetStreamKwargs) -> Self {
+        FutureRetEngine {
+            kwargs,
+            percent_commission: matches!(kwargs.commission_type, CommissionType::Percent),
+        }
+    }
+
+    /// cash spent to trade `lots` at `open`, a null spread costs the
+    /// commission twice as the kernel does
+    #[inline]
+    fn cost(&self, lots: f64, slippage: Option<f64>, open: f64) -> f64 {
+        let (m, c) = (self.kwargs.multiplier, self.kwargs.c_rate);
+        match (slippage, self.percent_commission) {
+            (Some(slippage), true) => lots * m * (slippage + open * c),
+            (Some(slippage), false) => lots * (m * slippage + c),
+            (None, true) => lots * m * (open * c + open * c),
+            (None, false) => lots * (c + c),
+        }
+    }
+
+    /// signed lots of the position `pos` opened at `open`
+    #[inline]
+    fn lots(&self, cash: f64, pos: f64, open: f64) -> f64 {
+        let lots =
+            (cash * self.kwargs.leverage * pos.abs() / (open * self.kwargs.multiplier)).floor();
+        if pos < 0. {
+            -lots
+        } else {
+            lots
+        }
+    }
+
+    /// one row, returns the equity
+    fn row(
+        &self,
+        st: &mut FutureRetState,
+        pos: Option<f64>,
+        open: Option<f64>,
+        close: Option<f64>,
+        slippage: Option<f64>,
+        chg: bool,
+    ) -> f64 {
+        if st.blown || (self.kwargs.blowup && st.cash <= 0.) {
+            st.blown = true;
+            return 0.;
+        }
+        let (Some(pos), Some(open), Some(close)) = (pos, open, close) else {
+            return st.cash;
+        };
+        let m = self.kwargs.multiplier;
+        if chg {
+            // the old contract is closed and the new one opened at the open
+            // price, the gap between the contracts is not a profit
+            let lots = self.lots(st.cash, pos, open);
+            st.cash -= 2. * self.cost(lots.abs(), slippage, open);
+            st.lots = lots;
+            st.last_pos = pos;
+        } else if let Some(last_close) = st.last_close {
+            if st.lots != 0. {
+                st.cash += st.lots * (open - last_close) * m;
+            }
+        }
+        if pos != st.last_pos {
+            let lots = self.lots(st.cash, pos, open);
+            st.cash -= self.cost((lots - st.lots).abs(), slippage, open);
+            st.lots = lots;
+            st.last_pos = pos;
+        }
+        if st.lots != 0. {
+            st.cash += st.lots * (close - open) * m;
+        }
+        st.last_close = Some(close);
+        st.cash
+    }
+}
+
+/// Run `calc_future_ret` over pos, open, close, an optional spread and an
+/// optional contract change signal, and call `f` with the position and the
+/// equity of every row. A NaN equity is passed as None, as the kernel shows
+/// it as null.
+///
+/// The position of a row is read `pos_lag` rows before it, and is 0 before
+/// the first one: a signal is passed as it is with a lag of 1, without a
+/// shifted copy.
+#[allow(clippy::too_many_arguments)]
+pub(crate) fn for_each_equity(
+    pos: &Series,
+    open: &Series,
+    close: &Series,
+    spread: Option<&Series>,
+    contract_chg_signal: Option<&BooleanChunked>,
+    kwargs: &FutureRetStreamKwargs,
+    pos_lag: usize,
+    mut f: impl FnMut(Option<f64>, Option<f64>),
+) -> PolarsResult<()> {
+    let engine = FutureRetEngine::new(kwargs);
+    let mut st = FutureRetState {
+        cash: kwargs.init_cash,
+        lots: 0.,
+        last_pos: 0.,
+        last_close: None,
+        blown: false,
+    };
+    // a null contract change signal is no change
+    let mut chg = contract_chg_signal.map(|ca| ca.iter());
+    let mut row =
+        |pos: Option<f64>, open: Option<f64>, close: Option<f64>, slippage: Option<f64>| {
+            let chg = chg
+                .as_mut()
+                .and_then(|c| c.next().flatten())
+                .unwrap_or(false);
+            let equity = engine.row(&mut st, pos, open, close, slippage, chg);
+            f(pos, (!equity.is_nan()).then_some(equity));
+        };
+    match spread {
+        Some(spread) => float_dispatch!((pos, open, close, spread) => {
+            std::iter::repeat(Some(0.))
+                .take(pos_lag)
+                .chain(pos.iter().map(|v| v.map(f64::from)))
+                .zip(open.iter())
+                .zip(close.iter())
+                .zip(spread.iter())
+                .for_each(|(((pos, open), close), spread)| {
+                    row(pos, open.map(Into::into), close.map(Into::into), spread.map(Into::into))
+                })
+        }),
+        None => float_dispatch!((pos, open, close) => {
+            std::iter::repeat(Some(0.))
+                .take(pos_lag)
+                .chain(pos.iter().map(|v| v.map(f64::from)))
+                .zip(open.iter())
+                .zip(close.iter())
+                .for_each(|((pos, open), close)| {
+                    row(pos, open.map(Into::into), close.map(Into::into), Some(kwargs.slippage))
+                })
+        }),
+    }
+    Ok(())
+}
+
+/// summary statistics of `calc_future_ret`, the equity curve is not stored
+pub(crate) fn future_ret_stats(
+    pos: &Series,
+    open: &Series,
+    close: &Series,
+    spread: Option<&Series>,
+    contract_chg_signal: Option<&BooleanChunked>,
+    kwargs: &FutureRetStreamKwargs,
+) -> PolarsResult<Series> {
+    let mut stats = EquityStats::default();
+    for_each_equity(
+        pos,
+        open,
+        close,
+        spread,
+        contract_chg_signal,
+        kwargs,
+        0,
+        |pos, equity| stats.update(pos, equity),
+    )?;
+    stats.into_series(pos.name().clone())
+}
+
+/// The account between two rows
+#[derive(Clone, Copy)]
+pub(crate) struct TickState {
+    /// cash of `calc_tick_future_ret`, init cash plus the profit of the full one
+    cash: f64,
+    realized: f64,
+    pos: f64,
+    /// NaN when flat
+    open_price: f64,
+    last_signal: f64,
+    last_mid: f64,
+    /// the position was closed for a contract change and is opened again at
+    /// the next row, with `pending_lots` sized at `pending_mid`
+    pending: bool,
+    pending_lots: f64,
+    pending_mid: f64,
+    blown: bool,
+}
+
+impl TickState {
+    pub(crate) fn new(init_cash: f64) -> Self {
+        TickState {
+            cash: init_cash,
+            realized: 0.,
+            pos: 0.,
+            open_price: f64::NAN,
+            last_signal: 0.,
+            last_mid: f64::NAN,
+            pending: false,
+            pending_lots: 0.,
+            pending_mid: 0.,
+            blown: false,
+        }
+    }
+}
+
+/// kwargs of `calc_tick_future_ret` and `calc_tick_future_ret_full`
+#[derive(Deserialize)]
+pub(crate) struct TickStreamKwargs {
+    pub(crate) init_cash: f64,
+    multiplier: f64,
+    c_rate: f64,
+    blowup: bool,
+    commission_type: CommissionType,
+    signal_type: String,
+    #[serde(default)]
+    open_price_method: Option<String>,
+}
+
+struct TickEngine {
+    init_cash: f64,
+    multiplier: f64,
+    c_rate: f64,
+    blowup: bool,
+    percent_commission: bool,
+    percent_signal: bool,
+    /// the output of a row is taken before its trade, true with a contract
+    /// change signal or lot signals
+    before_trade: bool,
+    method: OpenPriceMethod,
+}
+
+impl TickEngine {
+    fn new(kwargs: &TickStreamKwargs, has_chg: bool) -> PolarsResult<Self> {
+        let percent_signal = match kwargs.signal_type.to_lowercase().as_str() {
+            "percent" | "pct" => true,
+            "absolute" | "fixed" | "fix" => false,
+            signal_type => {
+                polars_bail!(InvalidOperation: "signal_type {signal_type} not supported, expected percent or absolute")
+            }
+        };
+        let method = match &kwargs.open_price_method {
+            Some(method) => OpenPriceMethod::parse(method)?,
+            None => OpenPriceMethod::Average,
+        };
+        Ok(TickEngine {
+            init_cash: kwargs.init_cash,
+            multiplier: kwargs.multiplier,
+            c_rate: kwargs.c_rate,
+            blowup: kwargs.blowup,
+            percent_commission: matches!(kwargs.commission_type, CommissionType::Percent),
+            percent_signal,
+            before_trade: has_chg || !percent_signal,
+            method,
+        })
+    }
+
+    /// cash spent to trade `lots` at `price`, `slip` away from the mid price
+    #[inline]
+    fn cost(&self, lots: f64, slip: f64, price: f64) -> f64 {
+        if self.percent_commission {
+            lots * self.multiplier * (slip + price * self.c_rate)
+        } else {
+            lots * (self.multiplier * slip + self.c_rate)
+        }
+    }
+
+    #[inline]
+    fn commission(&self, lots: f64, price: f64) -> f64 {
+        if self.percent_commission {
+            lots * price * self.c_rate * self.multiplier
+        } else {
+            lots * self.c_rate
+        }
+    }
+
+    #[inline]
+    fn lots(&self, cash: f64, signal: f64, mid: f64) -> f64 {
+        if self.percent_signal {
+            (cash * signal.abs() / (mid * self.multiplier)).floor()
+        } else {
+            signal.abs()
+        }
+    }
+
+    /// trade of `calc_tick_future_ret` when the signal changes
+    fn ret_trade(&self, st: &mut TickState, signal: f64, bid: f64, ask: f64, mid: f64) {
+        if signal != st.last_signal {
+            let lots = self.lots(st.cash, signal, mid);
+            let target = if signal > 0. { lots } else { -lots };
+            let qty = target - st.pos;
+            if qty != 0. {
+                let price = if qty > 0. { ask } else { bid };
+                st.cash -= self.cost(qty.abs(), (price - mid).abs(), price);
+                st.pos = target;
+            }
+            st.last_signal = signal;
+        }
+    }
+
+    /// one row of `calc_tick_future_ret`, returns the cash
+    fn ret_row(
+        &self,
+        st: &mut TickState,
+        signal: Option<f64>,
+        bid: Option<f64>,
+        ask: Option<f64>,
+        chg: bool,
+    ) -> f64 {
+        let (Some(signal), Some(bid), Some(ask)) = (signal, bid, ask) else {
+            return st.cash;
+        };
+        if st.blown || (self.blowup && st.cash <= 0.) {
+            st.blown = true;
+            return 0.;
+        }
+        let mid = (bid + ask) * 0.5;
+        if !self.before_trade {
+            if st.pos != 0. {
+                st.cash += st.pos * (mid - st.last_mid) * self.multiplier;
+            }
+            self.ret_trade(st, signal, bid, ask, mid);
+            st.last_mid = mid;
+            return st.cash;
+        }
+        if st.pending {
+            st.pending = false;
+            let lots = if self.percent_signal {
+                let lots = (st.pending_lots * st.pending_mid / mid).floor();
+                st.pos = if st.last_signal > 0. { lots } else { -lots };
+                lots
+            } else if st.last_signal != 0. {
+                // the position is kept, but the cost is of the lots of this row
+                signal.abs()
+            } else {
+                0.
+            };
+            if lots != 0. {
+                st.cash -= self.cost(lots, (ask - bid) * 0.5, mid);
+            }
+        } else if st.pos != 0. {
+            st.cash += st.pos * (mid - st.last_mid) * self.multiplier;
+        }
+        let out = st.cash;
+        st.last_mid = mid;
+        if chg {
+            st.pending = true;
+            st.pending_lots = self.lots(st.cash, signal, mid);
+            st.pending_mid = mid;
+            st.last_signal = signal;
+            if st.pos != 0. {
+                st.cash -= self.cost(st.pos.abs(), (ask - bid) * 0.5, mid);
+            }
+            st.pos = if self.percent_signal { 0. } else { signal };
+            return out;
+        }
+        self.ret_trade(st, signal, bid, ask, mid);
+        out
+    }
+
+    fn shown_open_price(&self, st: &TickState) -> f64 {
+        if st.last_signal != 0. {
+            st.open_price
+        } else {
+            f64::NAN
+        }
+    }
+
+    /// one row of `calc_tick_future_ret_full`, returns the unrealized profit,
+    /// the realized profit and the open price
+    fn full_row(
+        &self,
+        st: &mut TickState,
+        signal: Option<f64>,
+        bid: Option<f64>,
+        ask: Option<f64>,
+        chg: bool,
+    ) -> (f64, f64, f64) {
+        let m = self.multiplier;
+        let (Some(signal), Some(bid), Some(ask)) = (signal, bid, ask) else {
+            // the kernel shows the cash rather than the profit on a null row
+            return (st.cash, st.realized, self.shown_open_price(st));
+        };
+        if st.blown || (self.blowup && st.cash < 0.) {
+            st.blown = true;
+            return (0., st.realized, self.shown_open_price(st));
+        }
+        let mid = (bid + ask) * 0.5;
+        if st.pending {
+            st.pending = false;
+            let lots = st.pending_lots;
+            if lots != 0. {
+                let price = if lots > 0. { ask } else { bid };
+                st.cash -= self.cost(lots.abs(), (ask - bid) * 0.5, mid);
+                st.realized -= self.commission(lots.abs(), price);
+                st.pos = lots;
+                st.open_price = price;
+            }
+        } else if st.pos != 0. {
+            st.cash += st.pos * (mid - st.last_mid) * m;
+        }
+        let out = (
+            st.cash - self.init_cash,
+            st.realized,
+            self.shown_open_price(st),
+        );
+        st.last_mid = mid;
+        if chg {
+            let lots = st.pos.abs();
+            let price = if st.pos > 0. { bid } else { ask };
+            st.cash -= self.cost(lots, (ask - bid) * 0.5, mid);
+            st.realized =
+                st.realized + st.pos * (price - st.open_price) * m - self.commission(lots, price);
+            st.pos = 0.;
+            st.open_price = f64::NAN;
+            st.pending = true;
+            st.pending_lots = signal;
+            st.last_signal = signal;
+            return out;
+        }
+        if signal != st.last_signal {
+            st.last_signal = signal;
+            let qty = signal - st.pos;
+            if qty != 0. {
+                let lots = qty.abs();
+                let price = if qty > 0. { ask } else { bid };
+                let commission = self.commission(lots, price);
+                st.cash -= self.cost(lots, (price - mid).abs(), price);
+                if st.pos != 0. && st.pos.signum() != qty.signum() {
+                    if lots < st.pos.abs() {
+                        st.realized = st.realized + lots * (price - st.open_price) * m - commission;
+                    } else {
+                        st.realized =
+                            st.realized + st.pos * (price - st.open_price) * m - commission;
+                        st.open_price = if lots - st.pos.abs() != 0. {
+                            price
+                        } else {
+                            f64::NAN
+                        };
+                    }
+                } else {
+                    st.realized -= commission;
+                    st.open_price = if st.pos == 0. {
+                        price
+                    } else {
+                        match self.method {
+                            OpenPriceMethod::Average => {
+                                (st.open_price * st.pos.abs() + price * lots) / signal.abs()
+                            }
+                            OpenPriceMethod::First => st.open_price,
+                            OpenPriceMethod::Last => price,
+                        }
+                    };
+                }
+                st.pos = signal;
+            }
+        }
+        out
+    }
+}
+
+/// Run `row` over signal, bid, ask and an optional contract change signal.
+fn for_each_tick(
+    inputs: &[Series],
+    mut row: impl FnMut(Option<f64>, Option<f64>, Option<f64>, bool),
+) -> PolarsResult<()> {
+    polars_ensure!(
+        inputs.len() == 3 || inputs.len() == 4,
+        ComputeError: "expected signal, bid, ask and an optional contract_chg_signal"
+    );
+    let (signal, bid, ask) = (&inputs[0], &inputs[1], &inputs[2]);
+    let chg = inputs
+        .get(3)
+        .map(|s| s.cast(&DataType::Boolean))
+        .transpose()?;
+    let mut chg = chg
+        .as_ref()
+        .map(|s| s.bool().map(|ca| ca.iter()))
+        .transpose()?;
+    float_dispatch!((signal, bid, ask) => {
+        for ((signal, bid), ask) in signal.iter().zip(bid.iter()).zip(ask.iter()) {
+            // a null contract change signal is no change
+            let chg = chg.as_mut().and_then(|c| c.next().flatten()).unwrap_or(false);
+            row(
+                signal.and_then(|v| v.to_f64()),
+                bid.and_then(|v| v.to_f64()),
+                ask.and_then(|v| v.to_f64()),
+                chg,
+            );
+        }
+    });
+    Ok(())
+}
+
+/// Summary statistics of `calc_tick_future_ret`, inputs are signal, bid, ask
+/// and an optional contract_chg_signal. The cash of a row goes to the
+/// statistics as soon as it is computed, the equity curve is not stored.
+pub(crate) fn tick_future_ret_stats(
+    inputs: &[Series],
+    kwargs: &TickStreamKwargs,
+) -> PolarsResult<Series> {
+    let engine = TickEngine::new(kwargs, inputs.len() == 4)?;
+    let mut st = TickState::new(kwargs.init_cash);
+    let mut stats = EquityStats::default();
+    for_each_tick(inputs, |signal, bid, ask, chg| {
+        let cash = engine.ret_row(&mut st, signal, bid, ask, chg);
+        stats.update(signal, (!cash.is_nan()).then_some(cash));
+    })?;
+    stats.into_series(inputs[0].name().clone())
+}
+
+/// Run `calc_tick_future_ret` from the account `st` and call `f` with the
+/// cash of every row, `st` is left at the account after the last row.
+pub(crate) fn tick_ret_from(
+    inputs: &[Series],
+    kwargs: &TickStreamKwargs,
+    st: &mut TickState,
+    mut f: impl FnMut(f64),
+) -> PolarsResult<()> {
+    let engine = TickEngine::new(kwargs, inputs.len() == 4)?;
+    for_each_tick(inputs, |signal, bid, ask, chg| {
+        f(engine.ret_row(st, signal, bid, ask, chg))
+    })
+}
+
+/// Run `calc_tick_future_ret_full` from the account `st` and call `f` with
+/// the unrealized profit, the realized profit and the open price of every
+/// row, `st` is left at the account after the last row.
+pub(crate) fn tick_full_from(
+    inputs: &[Series],
+    kwargs: &TickStreamKwargs,
+    st: &mut TickState,
+    mut f: impl FnMut((f64, f64, f64)),
+) -> PolarsResult<()> {
+    let engine = TickEngine::new(kwargs, true)?;
+    for_each_tick(inputs, |signal, bid, ask, chg| {
+        f(engine.full_row(st, signal, bid, ask, chg))
+    })
+}
@@ -1,14 +1,31 @@
 #![allow(clippy::unused_unit)] // needed for pyo3_polars
 
+#[cfg(all(feature = "equity", feature = "strategy"))]
+mod backtest;
 #[cfg(feature = "equity")]
 mod equity;
+#[cfg(feature = "equity")]
+pub(crate) mod equity_stats;
 mod funcs;
+#[cfg(feature = "equity")]
+mod future_ret_stream;
 pub(crate) mod output_func;
+mod profiling;
 #[cfg(feature = "strategy")]
 mod strategy;
+#[cfg(feature = "equity")]
+mod tick_batch;
+#[cfg(feature = "equity")]
+mod tick_engine;
+#[cfg(all(feature = "equity", feature = "strategy"))]
+mod walk_forward;
+
+#[cfg(feature = "bench")]
+#[doc(hidden)]
+pub use funcs::bench;
 
 use pyo3::types::{PyModule, PyModuleMethods};
-use pyo3::{pymodule, Bound, PyResult, Python};
+use pyo3::{pyfunction, pymodule, wrap_pyfunction, Bound, PyResult, Python};
 
 macro_rules! auto_cast {
     // for one expression
@@ -16,6 +33,7 @@ macro_rules! auto_cast {
         if let polars::prelude::DataType::$arm = $se.dtype() {
             &$se
         } else {
+            $crate::profiling::record_cast();
             &$se.cast(&polars::prelude::DataType::$arm)?
         }
     };
@@ -25,6 +43,7 @@ macro_rules! auto_cast {
             if let polars::prelude::DataType::$arm = $se.dtype() {
                 $se
             } else {
+                $crate::profiling::record_cast();
                 &$se.cast(&polars::prelude::DataType::$arm)?
             }
         ),*)
@@ -32,8 +51,154 @@ macro_rules! auto_cast {
 }
 pub(crate) use auto_cast;
 
+/// Wrap a `#[polars_expr]` plugin so that its body runs through
+/// `profiling::profile` under the name of the function:
+///
+/// ```ignore
+/// crate::profiled! {
+/// #[polars_expr(output_type=Float64)]
+/// fn my_plugin(inputs: &[Series], kwargs: MyKwargs) -> PolarsResult<Series> {
+///     ...
+/// }
+/// }
+/// ```
+macro_rules! profiled {
+    (
+        $(#[$($attr: tt)*])*
+        $vis: vis fn $name: ident($inputs: ident: $($params: tt)*) -> PolarsResult<Series> {
+            $($body: tt)*
+        }
+    ) => {
+        $(#[$($attr)*])*
+        $vis fn $name($inputs: $($params)*) -> PolarsResult<Series> {
+            $crate::profiling::profile(stringify!($name), $inputs, || { $($body)* })
+        }
+    };
+}
+pub(crate) use profiled;
+
+/// Float32 has a 24 bit mantissa, integers beyond it are rounded
+const F32_EXACT_INT: i64 = 1 << 24;
+
+/// Whether the inputs of an equity kernel can be read as Float32: at least
+/// one of them is Float32 and the others are Float32 or integers up to 32 bits
+/// (e.g. lot signals). Int32 and UInt32 are only read as Float32 when all of
+/// their values are within 2^24, where Float32 is exact.
+pub(crate) fn read_as_f32(inputs: &[&polars::prelude::Series]) -> bool {
+    use polars::prelude::DataType::*;
+    inputs.iter().any(|s| s.dtype() == &Float32)
+        && inputs.iter().all(|s| match s.dtype() {
+            Float32 | Int8 | Int16 | UInt8 | UInt16 => true,
+            Int32 | UInt32 => match (s.min::<i64>(), s.max::<i64>()) {
+                (Ok(Some(min)), Ok(Some(max))) => -F32_EXACT_INT <= min && max <= F32_EXACT_INT,
+                // all null
+                (Ok(None), Ok(None)) => true,
+                _ => false,
+            },
+            _ => false,
+        })
+}
+
+/// Evaluate `$body` with the inputs bound to Float32Chunked if they can all be
+/// read as Float32, otherwise to Float64Chunked. Inputs already in the chosen
+/// dtype are used in place, only the others are cast.
+macro_rules! float_dispatch {
+    (($($se: ident),*) => $body: expr) => {
+        if $crate::read_as_f32(&[$($se),*]) {
+            let ($($se),*) = $crate::auto_cast!(Float32($($se),*));
+            let ($($se),*) = ($($se.f32()?),*);
+            $body
+        } else {
+            let ($($se),*) = $crate::auto_cast!(Float64($($se),*));
+            let ($($se),*) = ($($se.f64()?),*);
+            $body
+        }
+    };
+}
+pub(crate) use float_dispatch;
+
+#[pyfunction]
+fn _profiling_set_enabled(enabled: bool) {
+    profiling::set_enabled(enabled);
+}
+
+#[pyfunction]
+fn _profiling_reset() {
+    profiling::reset();
+}
+
+/// symbol, calls, rows, nanoseconds, estimated output bytes, casts and copies
+/// of every plugin called since the last reset
+#[pyfunction]
+#[allow(clippy::type_complexity)]
+fn _profiling_stats() -> Vec<(String, u64, u64, u64, u64, u64, u64)> {
+    profiling::snapshot()
+        .into_iter()
+        .map(|(symbol, s)| {
+            let symbol = symbol.to_string();
+            (
+                symbol,
+                s.calls,
+                s.rows,
+                s.nanos,
+                s.est_output_bytes,
+                s.casts,
+                s.copies,
+            )
+        })
+        .collect()
+}
+
+/// A run of `calc_tick_future_ret_batch` / `_full_batch`. The account kept
+/// for the run is dropped by `close`, at the end of a `with` block, or when
+/// the object is freed, whichever comes first.
+#[cfg(feature = "equity")]
+#[pyo3::pyclass(name = "_TickBatchRun")]
+struct TickBatchRun {
+    #[pyo3(get)]
+    id: u64,
+}
+
+#[cfg(feature = "equity")]
+#[pyo3::pymethods]
+impl TickBatchRun {
+    #[new]
+    fn new() -> Self {
+        TickBatchRun {
+            id: tick_batch::open_run(),
+        }
+    }
+
+    fn close(&self) {
+        tick_batch::close_run(self.id);
+    }
+
+    fn __enter__(slf: pyo3::PyRef<'_, Self>) -> pyo3::PyRef<'_, Self> {
+        slf
+    }
+
+    #[pyo3(signature = (*_args))]
+    fn __exit__(&self, _args: &Bound<'_, pyo3::types::PyTuple>) {
+        self.close();
+    }
+}
+
+#[cfg(feature = "equity")]
+impl Drop for TickBatchRun {
+    fn drop(&mut self) {
+        tick_batch::close_run(self.id);
+    }
+}
+
 #[pymodule]
 fn polars_qt(_py: Python, m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add("__version__", env!("CARGO_PKG_VERSION"))?;
+    m.add_function(wrap_pyfunction!(_profiling_set_enabled, m)?)?;
+    m.add_function(wrap_pyfunction!(_profiling_reset, m)?)?;
+    m.add_function(wrap_pyfunction!(_profiling_stats, m)?)?;
+    #[cfg(feature = "equity")]
+    {
+        m.add_class::<TickBatchRun>()?;
+    }
     Ok(())
 }
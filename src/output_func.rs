@@ -1,6 +1,29 @@
 use polars::prelude::*;
+use serde::Deserialize;
 
 pub fn same_output_type(input_fields: &[Field]) -> PolarsResult<Field> {
     let field = &input_fields[1];
     Ok(field.clone())
 }
+
+#[derive(Deserialize)]
+pub struct FloatOutputKwargs {
+    output_dtype: Option<String>,
+}
+
+/// dtype of the `output_dtype` kwarg of the rolling functions, Float64 by default
+pub fn float_output_dtype(output_dtype: Option<&str>) -> PolarsResult<DataType> {
+    match output_dtype {
+        None | Some("float64") => Ok(DataType::Float64),
+        Some("float32") => Ok(DataType::Float32),
+        Some(dtype) => polars_bail!(InvalidOperation: "output_dtype {dtype} not \
+            supported, expected float32 or float64."),
+    }
+}
+
+pub fn float_output_type(input_fields: &[Field], kwargs: FloatOutputKwargs) -> PolarsResult<Field> {
+    Ok(Field::new(
+        input_fields[0].name().clone(),
+        float_output_dtype(kwargs.output_dtype.as_deref())?,
+    ))
+}
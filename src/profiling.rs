@@ -0,0 +1,121 @@
+//! Opt-in instrumentation of the plugin calls, see `polars_qt/profiling.py`.
+//!
+//! Every plugin runs its body through `profile`, the plugins are wrapped with
+//! `crate::profiled!` which does it in one place. When profiling is off this
+//! is a relaxed load of one flag per plugin call, nothing is recorded and the
+//! cast / copy counters are not touched. Profiling starts enabled when the
+//! environment variable `POLARS_QT_PROFILE` is set to anything but "0".
+use polars::prelude::*;
+use std::cell::Cell;
+use std::collections::HashMap;
+use std::sync::atomic::{AtomicU8, Ordering};
+use std::sync::Mutex;
+use std::time::Instant;
+
+const OFF: u8 = 0;
+const ON: u8 = 1;
+const UNSET: u8 = 2;
+
+// the plugins are loaded by polars without importing the python module, so
+// the environment is read on the first plugin call rather than at import
+static ENABLED: AtomicU8 = AtomicU8::new(UNSET);
+static STATS: Mutex<Option<HashMap<&'static str, CallStats>>> = Mutex::new(None);
+
+thread_local! {
+    // casts and copies made by the plugin running on this thread, the work a
+    // plugin hands to the thread pool is not counted
+    static CASTS: Cell<u64> = const { Cell::new(0) };
+    static COPIES: Cell<u64> = const { Cell::new(0) };
+}
+
+#[derive(Default, Clone)]
+pub(crate) struct CallStats {
+    pub calls: u64,
+    pub rows: u64,
+    pub nanos: u64,
+    pub est_output_bytes: u64,
+    pub casts: u64,
+    pub copies: u64,
+}
+
+#[inline]
+pub(crate) fn is_enabled() -> bool {
+    match ENABLED.load(Ordering::Relaxed) {
+        OFF => false,
+        ON => true,
+        _ => init_from_env(),
+    }
+}
+
+#[cold]
+fn init_from_env() -> bool {
+    let enabled = std::env::var("POLARS_QT_PROFILE").is_ok_and(|v| !v.is_empty() && v != "0");
+    // a call to `set_enabled` in between wins
+    let _ = ENABLED.compare_exchange(UNSET, enabled as u8, Ordering::Relaxed, Ordering::Relaxed);
+    ENABLED.load(Ordering::Relaxed) == ON
+}
+
+pub(crate) fn set_enabled(enabled: bool) {
+    ENABLED.store(if enabled { ON } else { OFF }, Ordering::Relaxed);
+}
+
+/// Count a cast of an input made by a plugin.
+#[inline]
+pub(crate) fn record_cast() {
+    if is_enabled() {
+        CASTS.with(|c| c.set(c.get() + 1));
+    }
+}
+
+/// Count a copy of (part of) an input made by a plugin, e.g. a rechunked block.
+#[inline]
+pub(crate) fn record_copy() {
+    if is_enabled() {
+        COPIES.with(|c| c.set(c.get() + 1));
+    }
+}
+
+/// Run the body of the plugin `symbol` and record the call if profiling is on.
+/// The rows are the length of the first input. The output bytes are the
+/// `estimated_size` of the output, not a measure of what the plugin allocated.
+#[inline]
+pub(crate) fn profile<F>(symbol: &'static str, inputs: &[Series], func: F) -> PolarsResult<Series>
+where
+    F: FnOnce() -> PolarsResult<Series>,
+{
+    if !is_enabled() {
+        return func();
+    }
+    let (casts, copies) = (CASTS.with(Cell::get), COPIES.with(Cell::get));
+    let start = Instant::now();
+    let out = func();
+    let nanos = start.elapsed().as_nanos() as u64;
+    let mut stats = STATS.lock().unwrap();
+    let entry = stats
+        .get_or_insert_with(HashMap::new)
+        .entry(symbol)
+        .or_default();
+    entry.calls += 1;
+    entry.rows += inputs.first().map_or(0, |s| s.len()) as u64;
+    entry.nanos += nanos;
+    entry.est_output_bytes += out.as_ref().map_or(0, |s| s.estimated_size()) as u64;
+    entry.casts += CASTS.with(Cell::get) - casts;
+    entry.copies += COPIES.with(Cell::get) - copies;
+    out
+}
+
+/// The stats recorded since the last reset, sorted by symbol.
+pub(crate) fn snapshot() -> Vec<(&'static str, CallStats)> {
+    let stats = STATS.lock().unwrap();
+    let mut out: Vec<_> = stats
+        .iter()
+        .flatten()
+        .map(|(symbol, stats)| (*symbol, stats.clone()))
+        .collect();
+    out.sort_unstable_by_key(|(symbol, _)| *symbol);
+    out
+}
+
+pub(crate) fn reset() {
+    *STATS.lock().unwrap() = None;
+}
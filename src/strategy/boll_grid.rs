@@ -0,0 +1,124 @@
+use super::from_input::{prepare_filters, FromInput};
+use crate::funcs::rolling_zscore_by_time;
+use polars::prelude::*;
+use polars_core::POOL;
+use pyo3_polars::derive::polars_expr;
+use rayon::prelude::*;
+use serde::Deserialize;
+use tea_strategy::tevec::prelude::*;
+use tea_strategy::{BollKwargs, StrategyFilter};
+
+#[derive(Deserialize)]
+struct BollGridKwargs {
+    windows: Vec<usize>,
+    /// time windows in nanoseconds, the last input is then the by column and
+    /// `windows` is ignored
+    periods: Option<Vec<i64>>,
+    min_periods: Option<usize>,
+    zscore: bool,
+    // (field name, index of the window in `windows`, kwargs for the band)
+    combos: Vec<(String, usize, BollKwargs)>,
+}
+
+fn boll_grid_output(input_fields: &[Field], kwargs: BollGridKwargs) -> PolarsResult<Field> {
+    let fields = kwargs
+        .combos
+        .iter()
+        .map(|(name, _, _)| Field::new(name.as_str().into(), DataType::Float64))
+        .collect();
+    Ok(Field::new(
+        input_fields[0].name().clone(),
+        DataType::Struct(fields),
+    ))
+}
+
+/// the rolling part of boll only depends on the window, so it is computed once
+/// for each distinct window and shared by every width using that window
+fn band_factor(
+    fac: &Series,
+    window: usize,
+    min_periods: Option<usize>,
+    zscore: bool,
+) -> PolarsResult<Float64Chunked> {
+    if !zscore {
+        return Ok(fac.cast(&DataType::Float64)?.f64()?.clone());
+    }
+    let out: Float64Chunked = match fac.dtype() {
+        DataType::Int32 => fac.i32()?.ts_vzscore(window, min_periods),
+        DataType::Int64 => fac.i64()?.ts_vzscore(window, min_periods),
+        DataType::Float32 => fac.f32()?.ts_vzscore(window, min_periods),
+        DataType::Float64 => fac.f64()?.ts_vzscore(window, min_periods),
+        dtype => {
+            polars_bail!(InvalidOperation: format!("dtype {} not supported for boll_grid", dtype))
+        }
+    };
+    Ok(out)
+}
+
+fn band_factor_by_time(
+    fac: &Series,
+    by: &Series,
+    period: i64,
+    min_periods: Option<usize>,
+    zscore: bool,
+) -> PolarsResult<Float64Chunked> {
+    if !zscore {
+        return Ok(fac.cast(&DataType::Float64)?.f64()?.clone());
+    }
+    rolling_zscore_by_time(fac, by, period, min_periods)
+}
+
+crate::profiled! {
+#[polars_expr(output_type_func_with_kwargs=boll_grid_output)]
+fn boll_grid(inputs: &[Series], kwargs: BollGridKwargs) -> PolarsResult<Series> {
+    let (inputs, by) = match &kwargs.periods {
+        Some(_) => {
+            let (by, inputs) = inputs.split_last().unwrap();
+            (inputs, Some(by))
+        }
+        None => (inputs, None),
+    };
+    let filter_inputs;
+    let filter = if inputs.len() == 5 {
+        filter_inputs = prepare_filters(inputs, &[1, 2, 3, 4])?;
+        match filter_inputs.as_deref() {
+            Some(inputs) => Some(StrategyFilter::from_inputs(inputs, &[1, 2, 3, 4])?),
+            // the filters filter nothing
+            None => None,
+        }
+    } else if inputs.len() == 1 {
+        None
+    } else {
+        polars_bail!(ComputeError: "wrong length of inputs in function boll_grid")
+    };
+    let fac = &inputs[0];
+    let bands = POOL.install(|| match (&kwargs.periods, by) {
+        (Some(periods), Some(by)) => periods
+            .par_iter()
+            .map(|&period| {
+                band_factor_by_time(fac, by, period, kwargs.min_periods, kwargs.zscore)
+            })
+            .collect::<PolarsResult<Vec<_>>>(),
+        _ => kwargs
+            .windows
+            .par_iter()
+            .map(|&window| band_factor(fac, window, kwargs.min_periods, kwargs.zscore))
+            .collect::<PolarsResult<Vec<_>>>(),
+    })?;
+    let signals = POOL.install(|| {
+        kwargs
+            .combos
+            .par_iter()
+            .map(|(name, window_idx, combo_kwargs)| {
+                let out: Float64Chunked =
+                    tea_strategy::boll(&bands[*window_idx], filter.as_ref(), combo_kwargs);
+                out.with_name(name.as_str().into()).into_series()
+            })
+            .collect::<Vec<_>>()
+    });
+    Ok(
+        StructChunked::from_series(fac.name().clone(), fac.len(), signals.iter())?
+            .into_series(),
+    )
+}
+}
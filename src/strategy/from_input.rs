@@ -1,4 +1,5 @@
 use polars::prelude::*;
+use std::borrow::Cow;
 use tea_strategy::StrategyFilter;
 
 pub trait FromInput<'a> {
@@ -17,3 +18,101 @@ impl<'a> FromInput<'a> for StrategyFilter<&'a BooleanChunked> {
         })
     }
 }
+
+/// Values of long_open, long_stop, short_open and short_stop which filter
+/// nothing: opening is allowed and no stop is forced.
+const NEUTRAL: [bool; 4] = [true, false, true, false];
+
+/// A filter of a strategy: a Boolean column of the length of the factor, or
+/// a scalar (a `True` / `False` filter in python) kept as a constant.
+#[derive(Clone)]
+pub enum Filter {
+    Column(Series),
+    Scalar(Option<bool>),
+}
+
+impl Filter {
+    /// The filter as a column of length `len`, a scalar is broadcast.
+    pub fn to_column(&self, len: usize) -> Series {
+        match self {
+            Filter::Column(s) => s.clone(),
+            Filter::Scalar(Some(value)) => {
+                BooleanChunked::full("".into(), *value, len).into_series()
+            }
+            Filter::Scalar(None) => BooleanChunked::full_null("".into(), len).into_series(),
+        }
+    }
+}
+
+/// Cast the filters `inputs[idxs]` to Boolean, the scalar ones are kept as
+/// constants rather than broadcast to the length of the factor `inputs[0]`.
+///
+/// Returns None when every filter is a neutral scalar, the strategy then
+/// runs its loop without filters rather than reading four constant columns.
+pub fn parse_filters(inputs: &[Series], idxs: &[usize]) -> PolarsResult<Option<Vec<Filter>>> {
+    let len = inputs[0].len();
+    let mut filters = Vec::with_capacity(idxs.len());
+    for &i in idxs {
+        let mut s = inputs[i].clone();
+        if s.dtype() != &DataType::Boolean {
+            crate::profiling::record_cast();
+            s = s.cast(&DataType::Boolean)?;
+        }
+        filters.push(if s.len() == len {
+            Filter::Column(s)
+        } else {
+            polars_ensure!(
+                s.len() == 1,
+                ShapeMismatch: "a filter should be a scalar or have the length of the factor"
+            );
+            Filter::Scalar(s.bool()?.get(0))
+        });
+    }
+    let is_neutral =
+        |(f, neutral): (&Filter, &bool)| matches!(f, Filter::Scalar(Some(v)) if v == neutral);
+    if filters.iter().zip(&NEUTRAL).all(is_neutral) {
+        return Ok(None);
+    }
+    Ok(Some(filters))
+}
+
+/// `parse_filters` with the scalar filters broadcast to the length of the
+/// factor, as the inputs of a strategy kernel. The inputs are borrowed when
+/// every filter is already a Boolean column.
+///
+/// The kernels of tea_strategy take the four filters as one `StrategyFilter`
+/// of a single column type, so a scalar next to a real filter has to become a
+/// column; the filters with the same value share it. The panel strategies
+/// keep the scalars from `parse_filters` and broadcast them per group.
+pub fn prepare_filters<'a>(
+    inputs: &'a [Series],
+    idxs: &[usize],
+) -> PolarsResult<Option<Cow<'a, [Series]>>> {
+    let len = inputs[0].len();
+    let ready = |s: &Series| s.dtype() == &DataType::Boolean && s.len() == len;
+    if idxs.iter().all(|&i| ready(&inputs[i])) {
+        return Ok(Some(Cow::Borrowed(inputs)));
+    }
+    let Some(filters) = parse_filters(inputs, idxs)? else {
+        return Ok(None);
+    };
+    let mut inputs = inputs.to_vec();
+    // broadcast columns of the values true, false and null
+    let mut columns: [Option<Series>; 3] = [None, None, None];
+    for (filter, &i) in filters.into_iter().zip(idxs) {
+        inputs[i] = match filter {
+            Filter::Column(s) => s,
+            Filter::Scalar(value) => {
+                let slot = match value {
+                    Some(true) => 0,
+                    Some(false) => 1,
+                    None => 2,
+                };
+                columns[slot]
+                    .get_or_insert_with(|| Filter::Scalar(value).to_column(len))
+                    .clone()
+            }
+        };
+    }
+    Ok(Some(Cow::Owned(inputs)))
+}
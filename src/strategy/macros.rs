@@ -1,25 +1,90 @@
+#[macro_export]
+macro_rules! strategy_kernel {
+    ($strategy: ident $({$mark: tt})?, $inputs: expr, $kwargs: expr) => {{
+        let inputs: &[Series] = $inputs;
+        let filter_inputs;
+        let filter = if inputs.len() == 5 {
+            filter_inputs = $crate::strategy::from_input::prepare_filters(inputs, &[1, 2, 3, 4])?;
+            match filter_inputs.as_deref() {
+                Some(inputs) => Some(StrategyFilter::from_inputs(inputs, &[1, 2, 3, 4])?),
+                // the filters filter nothing
+                None => None,
+            }
+        } else if inputs.len() == 1 {
+            None
+        } else {
+            polars_bail!(ComputeError: format!("wrong length of inputs in function {}", stringify!($strategy)))
+
+        };
+        let fac = &inputs[0];
+        let out: Float64Chunked = match fac.dtype() {
+            DataType::Int32 => tea_strategy::$strategy(fac.i32()?, filter.as_ref(), $kwargs)$($mark)?,
+            DataType::Int64 => tea_strategy::$strategy(fac.i64()?, filter.as_ref(), $kwargs)$($mark)?,
+            DataType::Float32 => tea_strategy::$strategy(fac.f32()?, filter.as_ref(), $kwargs)$($mark)?,
+            DataType::Float64 => tea_strategy::$strategy(fac.f64()?, filter.as_ref(), $kwargs)$($mark)?,
+            dtype => polars_bail!(InvalidOperation: format!("dtype {} not supported for {}", dtype, stringify!($strategy))),
+        };
+        out
+    }};
+}
+
 #[macro_export]
 macro_rules! define_strategy {
     ($strategy: ident $({$mark: tt})?, $kwargs: ty) => {
+        $crate::profiled! {
         #[polars_expr(output_type=Float64)]
         fn $strategy(inputs: &[Series], kwargs: $kwargs) -> PolarsResult<Series> {
-            let filter = if inputs.len() == 5 {
-                Some(StrategyFilter::from_inputs(inputs, &[1, 2, 3, 4])?)
-            } else if inputs.len() == 1 {
-                None
-            } else {
-                polars_bail!(ComputeError: format!("wrong length of inputs in function {}", stringify!($strategy)))
+            let out = $crate::strategy_kernel!($strategy $({$mark})?, inputs, &kwargs);
+            Ok(out.into_series())
+        }
+        }
+    };
+}
 
+/// Panel version of a strategy, the first input is the group key (e.g. symbol)
+/// and the state machine runs on each group in parallel. Rows of a group keep
+/// their original order and the signals are scattered back to the rows.
+#[macro_export]
+macro_rules! define_panel_strategy {
+    ($panel: ident, $strategy: ident $({$mark: tt})?, $kwargs: ty) => {
+        $crate::profiled! {
+        #[polars_expr(output_type=Float64)]
+        fn $panel(inputs: &[Series], kwargs: $kwargs) -> PolarsResult<Series> {
+            use $crate::strategy::from_input::Filter;
+            let (by, inputs) = inputs.split_first().unwrap();
+            // the filters are cast once and dropped when they filter nothing,
+            // a scalar filter is only broadcast to the length of each group
+            let filters = match inputs.len() {
+                5 => $crate::strategy::from_input::parse_filters(inputs, &[1, 2, 3, 4])?,
+                1 => None,
+                _ => polars_bail!(ComputeError: format!("wrong length of inputs in function {}", stringify!($panel))),
             };
-            let fac = &inputs[0];
-            let out: Float64Chunked = match fac.dtype() {
-                DataType::Int32 => tea_strategy::$strategy(fac.i32()?, filter.as_ref(), &kwargs)$($mark)?,
-                DataType::Int64 => tea_strategy::$strategy(fac.i64()?, filter.as_ref(), &kwargs)$($mark)?,
-                DataType::Float32 => tea_strategy::$strategy(fac.f32()?, filter.as_ref(), &kwargs)$($mark)?,
-                DataType::Float64 => tea_strategy::$strategy(fac.f64()?, filter.as_ref(), &kwargs)$($mark)?,
-                dtype => polars_bail!(InvalidOperation: format!("dtype {} not supported for {}", dtype, stringify!($strategy))),
-            };
+            let groups = by.group_tuples(true, false)?.into_idx();
+            let outs = POOL.install(|| {
+                groups
+                    .all()
+                    .par_iter()
+                    .map(|idx| {
+                        let mut inputs = vec![inputs[0].take_slice(idx)?];
+                        for filter in filters.iter().flatten() {
+                            inputs.push(match filter {
+                                Filter::Column(s) => s.take_slice(idx)?,
+                                Filter::Scalar(_) => filter.to_column(idx.len()),
+                            });
+                        }
+                        Ok($crate::strategy_kernel!($strategy $({$mark})?, &inputs, &kwargs))
+                    })
+                    .collect::<PolarsResult<Vec<_>>>()
+            })?;
+            let mut res = vec![None; by.len()];
+            for (idx, out) in groups.all().iter().zip(outs) {
+                for (&i, v) in idx.iter().zip(out.iter()) {
+                    res[i as usize] = v;
+                }
+            }
+            let out = Float64Chunked::from_iter_options(inputs[0].name().clone(), res.into_iter());
             Ok(out.into_series())
         }
+        }
     };
 }
@@ -1,11 +1,14 @@
-mod from_input;
+mod boll_grid;
+pub(crate) mod from_input;
 #[macro_use]
 mod macros;
 
-use crate::define_strategy;
+use crate::{define_panel_strategy, define_strategy};
 use from_input::FromInput;
 use polars::prelude::*;
+use polars_core::POOL;
 use pyo3_polars::derive::polars_expr;
+use rayon::prelude::*;
 use tea_strategy::*;
 
 define_strategy!(boll, BollKwargs);
@@ -15,3 +18,11 @@ define_strategy!(martingale{?}, MartingaleKwargs);
 define_strategy!(fix_time{?}, FixTimeKwargs);
 define_strategy!(auto_tangqian{?}, AutoTangQiAnKwargs);
 define_strategy!(prob_threshold{?}, ProbThresholdKwargs);
+
+define_panel_strategy!(boll_panel, boll, BollKwargs);
+define_panel_strategy!(auto_boll_panel, auto_boll{?}, AutoBollKwargs);
+define_panel_strategy!(delay_boll_panel, delay_boll{?}, DelayBollKwargs);
+define_panel_strategy!(martingale_panel, martingale{?}, MartingaleKwargs);
+define_panel_strategy!(fix_time_panel, fix_time{?}, FixTimeKwargs);
+define_panel_strategy!(auto_tangqian_panel, auto_tangqian{?}, AutoTangQiAnKwargs);
+define_panel_strategy!(prob_threshold_panel, prob_threshold{?}, ProbThresholdKwargs);
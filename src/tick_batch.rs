@@ -0,0 +1,175 @@
+//! `calc_tick_future_ret` and `calc_tick_future_ret_full` over a batch of
+//! ticks, starting from the account left by the previous batch.
+//!
+//! The rows go through the engine of `future_ret_stream`. The account after
+//! the last row of a batch is kept here under the id of its run and the next
+//! batch of the run starts from it, so every batch is computed once. A run is
+//! owned by a python object, `_TickBatchRun` in `lib.rs`, which drops the
+//! account when it is closed or freed (see `calc_tick_future_ret_batched` in
+//! `polars_qt/equity.py`).
+use crate::future_ret_stream::{tick_full_from, tick_ret_from, TickState, TickStreamKwargs};
+use crate::tick_engine::profit_fields;
+use polars::prelude::*;
+use pyo3_polars::derive::polars_expr;
+use serde::Deserialize;
+use std::collections::HashMap;
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::sync::{Arc, LazyLock, Mutex};
+
+/// The account left by the last batch of a run, None before its first batch.
+/// Every run has its own lock, the lock of `RUNS` is only held to find it.
+type Run = Arc<Mutex<Option<TickState>>>;
+
+/// the open runs
+static RUNS: LazyLock<Mutex<HashMap<u64, Run>>> = LazyLock::new(|| Mutex::new(HashMap::new()));
+static NEXT_RUN: AtomicU64 = AtomicU64::new(0);
+
+/// a new run, its first batch starts from an empty account
+pub(crate) fn open_run() -> u64 {
+    let run_id = NEXT_RUN.fetch_add(1, Ordering::Relaxed);
+    RUNS.lock().unwrap().insert(run_id, Run::default());
+    run_id
+}
+
+/// drop the account of a run, closing it twice is a no-op
+pub(crate) fn close_run(run_id: u64) {
+    RUNS.lock().unwrap().remove(&run_id);
+}
+
+#[derive(Deserialize)]
+struct TickBatchKwargs {
+    /// from `open_run`
+    run_id: u64,
+    equity_kwargs: TickStreamKwargs,
+}
+
+/// Run `f` from the account left by the previous batch of the run and keep
+/// the account it leaves for the next one. The account is only kept when the
+/// batch succeeds.
+fn run_batch(
+    kwargs: &TickBatchKwargs,
+    f: impl FnOnce(&mut TickState) -> PolarsResult<()>,
+) -> PolarsResult<()> {
+    let run = RUNS.lock().unwrap().get(&kwargs.run_id).cloned();
+    let Some(run) = run else {
+        polars_bail!(ComputeError: "the run {} of the tick batches is closed", kwargs.run_id)
+    };
+    let mut state = run.lock().unwrap();
+    let mut st = state.unwrap_or_else(|| TickState::new(kwargs.equity_kwargs.init_cash));
+    f(&mut st)?;
+    *state = Some(st);
+    Ok(())
+}
+
+/// NaN is shown as null, as the kernels do
+fn nan_as_null(name: PlSmallStr, v: Vec<f64>) -> Series {
+    Float64Chunked::from_iter_options(name, v.into_iter().map(|v| (!v.is_nan()).then_some(v)))
+        .into_series()
+}
+
+fn full_batch_output(input_fields: &[Field]) -> PolarsResult<Field> {
+    Ok(Field::new(
+        input_fields[0].name().clone(),
+        DataType::Struct(profit_fields()),
+    ))
+}
+
+crate::profiled! {
+/// `calc_tick_future_ret` over a batch, inputs are signal, bid, ask and an
+/// optional contract_chg_signal.
+#[polars_expr(output_type=Float64)]
+fn calc_tick_future_ret_batch(inputs: &[Series], kwargs: TickBatchKwargs) -> PolarsResult<Series> {
+    let mut cash = Vec::with_capacity(inputs[0].len());
+    run_batch(&kwargs, |st| {
+        tick_ret_from(inputs, &kwargs.equity_kwargs, st, |v| cash.push(v))
+    })?;
+    Ok(nan_as_null(inputs[0].name().clone(), cash))
+}
+}
+
+crate::profiled! {
+/// `calc_tick_future_ret_full` over a batch, inputs are signal, bid, ask and
+/// an optional contract_chg_signal.
+#[polars_expr(output_type_func=full_batch_output)]
+fn calc_tick_future_ret_full_batch(
+    inputs: &[Series],
+    kwargs: TickBatchKwargs,
+) -> PolarsResult<Series> {
+    let len = inputs[0].len();
+    let (mut unrealized, mut realized, mut open_price) = (
+        Vec::with_capacity(len),
+        Vec::with_capacity(len),
+        Vec::with_capacity(len),
+    );
+    run_batch(&kwargs, |st| {
+        tick_full_from(inputs, &kwargs.equity_kwargs, st, |(u, r, o)| {
+            unrealized.push(u);
+            realized.push(r);
+            open_price.push(o);
+        })
+    })?;
+    let fields = [
+        nan_as_null("unrealized_profit".into(), unrealized),
+        nan_as_null("realized_profit".into(), realized),
+        nan_as_null("open_price".into(), open_price),
+    ];
+    Ok(StructChunked::from_series(inputs[0].name().clone(), len, fields.iter())?.into_series())
+}
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use serde_json::json;
+
+    fn batch_kwargs(run_id: u64) -> TickBatchKwargs {
+        serde_json::from_value(json!({
+            "run_id": run_id,
+            "equity_kwargs": {
+                "init_cash": 10_000,
+                "multiplier": 10.,
+                "c_rate": 3e-4,
+                "blowup": false,
+                "commission_type": "percent",
+                "signal_type": "absolute",
+            },
+        }))
+        .unwrap()
+    }
+
+    fn inputs(signal: &[f64], bid: &[f64]) -> Vec<Series> {
+        let ask: Vec<f64> = bid.iter().map(|v| v + 1.).collect();
+        vec![
+            Series::new("signal".into(), signal),
+            Series::new("bid".into(), bid),
+            Series::new("ask".into(), ask),
+        ]
+    }
+
+    #[test]
+    fn test_runs_keep_their_own_account() {
+        let signal = [0., 1., 1., -1., 0., 2., 2., 0.];
+        let bid = [100., 101., 103., 102., 99., 98., 101., 104.];
+        let (whole, a, b) = (open_run(), open_run(), open_run());
+        let expect = calc_tick_future_ret_batch(&inputs(&signal, &bid), batch_kwargs(whole));
+        // the batches of two runs interleaved, b runs the signal reversed
+        let reversed: Vec<f64> = signal.iter().map(|v| -v).collect();
+        let mut out = vec![];
+        for range in [0..3, 3..5, 5..8] {
+            let batch = inputs(&signal[range.clone()], &bid[range.clone()]);
+            out.push(calc_tick_future_ret_batch(&batch, batch_kwargs(a)).unwrap());
+            let batch = inputs(&reversed[range.clone()], &bid[range]);
+            calc_tick_future_ret_batch(&batch, batch_kwargs(b)).unwrap();
+        }
+        let mut res = out[0].clone();
+        res.append(&out[1]).unwrap();
+        res.append(&out[2]).unwrap();
+        assert!(res.equals_missing(&expect.unwrap()));
+        // a closed run is not restarted from an empty account
+        for run_id in [whole, a, b] {
+            close_run(run_id);
+            close_run(run_id);
+        }
+        assert!(calc_tick_future_ret_batch(&inputs(&signal, &bid), batch_kwargs(a)).is_err());
+    }
+}
@@ -0,0 +1,517 @@
+//! Tick backtest on L1-L5 order book snapshots.
+//!
+//! Like `calc_tick_future_ret_full`, the signal is the target lot number, the
+//! output of a tick is the profit before the orders of this tick are sent,
+//! and the unrealized profit (realized profit included) is marked at the mid
+//! price. But market orders walk the visible depth instead of filling the
+//! whole lot at the touch, and limit orders wait in a queue.
+//!
+//! Every snapshot is taken as it is recorded: the depth consumed by own
+//! orders at a tick is not removed from the next snapshot, so lots sent again
+//! at the next tick may fill against volume that was already taken.
+use polars::prelude::*;
+use polars_arrow::bitmap::Bitmap;
+use pyo3_polars::derive::polars_expr;
+use serde::Deserialize;
+use tea_strategy::equity::CommissionType;
+
+/// Lots below it are treated as zero, volumes and signals are floats.
+const LOT_EPS: f64 = 1e-9;
+
+#[derive(Deserialize)]
+struct TickBookKwargs {
+    init_cash: f64,
+    multiplier: f64,
+    c_rate: f64,
+    blowup: bool,
+    commission_type: CommissionType,
+    open_price_method: String,
+    order_type: String,
+    levels: usize,
+}
+
+#[derive(Clone, Copy, PartialEq)]
+pub(crate) enum OpenPriceMethod {
+    Average,
+    First,
+    Last,
+}
+
+impl OpenPriceMethod {
+    pub(crate) fn parse(method: &str) -> PolarsResult<Self> {
+        match method.to_lowercase().as_str() {
+            "average" => Ok(OpenPriceMethod::Average),
+            "first" => Ok(OpenPriceMethod::First),
+            "last" => Ok(OpenPriceMethod::Last),
+            method => {
+                polars_bail!(InvalidOperation: "open_price_method {method} not supported, expected first, last or average")
+            }
+        }
+    }
+}
+
+/// A visible level of one side of the book
+#[derive(Clone, Copy, Default)]
+struct Level {
+    price: f64,
+    volume: f64,
+}
+
+/// The values of a numeric input column, read in place so that Float32
+/// prices and integer volumes are not cast to a Float64 copy.
+enum Values<'a> {
+    F32(&'a [f32]),
+    F64(&'a [f64]),
+    I32(&'a [i32]),
+    I64(&'a [i64]),
+    U32(&'a [u32]),
+    U64(&'a [u64]),
+}
+
+/// A numeric input column of one chunk, read as f64 value by value
+struct Column<'a> {
+    values: Values<'a>,
+    validity: Option<&'a Bitmap>,
+}
+
+impl Column<'_> {
+    #[inline]
+    fn get_f64(&self, i: usize) -> Option<f64> {
+        if let Some(validity) = self.validity {
+            if !validity.get_bit(i) {
+                return None;
+            }
+        }
+        Some(match self.values {
+            Values::F32(v) => v[i] as f64,
+            Values::F64(v) => v[i],
+            Values::I32(v) => v[i] as f64,
+            Values::I64(v) => v[i] as f64,
+            Values::U32(v) => v[i] as f64,
+            Values::U64(v) => v[i] as f64,
+        })
+    }
+}
+
+/// `s` should be rechunked
+fn as_column(s: &Series) -> PolarsResult<Column<'_>> {
+    macro_rules! read {
+        ($ca: expr, $values: ident) => {{
+            let ca = $ca;
+            polars_ensure!(ca.chunks().len() <= 1, ComputeError: "expected a rechunked column");
+            match ca.downcast_iter().next() {
+                Some(arr) => Column {
+                    values: Values::$values(arr.values().as_slice()),
+                    validity: arr.validity(),
+                },
+                None => Column {
+                    values: Values::$values(&[]),
+                    validity: None,
+                },
+            }
+        }};
+    }
+    Ok(match s.dtype() {
+        DataType::Float32 => read!(s.f32()?, F32),
+        DataType::Int32 => read!(s.i32()?, I32),
+        DataType::Int64 => read!(s.i64()?, I64),
+        DataType::UInt32 => read!(s.u32()?, U32),
+        DataType::UInt64 => read!(s.u64()?, U64),
+        _ => read!(s.f64()?, F64),
+    })
+}
+
+struct Book<'a> {
+    bid: Vec<(&'a Column<'a>, &'a Column<'a>)>,
+    ask: Vec<(&'a Column<'a>, &'a Column<'a>)>,
+}
+
+impl Book<'_> {
+    /// levels of one side at tick i, missing levels are skipped
+    fn side(&self, buy: bool, i: usize, out: &mut Vec<Level>) {
+        out.clear();
+        let side = if buy { &self.ask } else { &self.bid };
+        for (price, volume) in side {
+            if let (Some(price), Some(volume)) = (price.get_f64(i), volume.get_f64(i)) {
+                if volume > 0. {
+                    out.push(Level { price, volume });
+                }
+            }
+        }
+    }
+
+    fn best(&self, buy: bool, i: usize) -> Option<Level> {
+        let side = if buy { &self.ask } else { &self.bid };
+        let (price, volume) = side[0];
+        Some(Level {
+            price: price.get_f64(i)?,
+            volume: volume.get_f64(i).unwrap_or(0.),
+        })
+    }
+
+    /// volume resting at `price` on the bid (buy) or ask side at tick i
+    fn volume_at(&self, buy: bool, price: f64, i: usize) -> Option<f64> {
+        let side = if buy { &self.bid } else { &self.ask };
+        side.iter().find_map(|(p, v)| {
+            if p.get_f64(i)? == price {
+                Some(v.get_f64(i).unwrap_or(0.))
+            } else {
+                None
+            }
+        })
+    }
+}
+
+#[derive(Default)]
+struct Account {
+    pos: f64,
+    /// average cost of the position, used for the profit
+    cost: Option<f64>,
+    /// open price shown in the output, depends on the open price method
+    open_price: Option<f64>,
+    realized: f64,
+}
+
+impl Account {
+    /// trade `qty` lots (negative for sell) at `price`
+    fn fill(&mut self, qty: f64, price: f64, kwargs: &TickBookKwargs, method: OpenPriceMethod) {
+        if qty.abs() <= LOT_EPS {
+            return;
+        }
+        self.realized -= match kwargs.commission_type {
+            CommissionType::Percent => qty.abs() * price * kwargs.multiplier * kwargs.c_rate,
+            CommissionType::Absolute => qty.abs() * kwargs.c_rate,
+        };
+        let mut open_qty = qty;
+        if self.pos != 0. && self.pos.signum() != qty.signum() {
+            // close first
+            let close_qty = qty.abs().min(self.pos.abs()) * qty.signum();
+            let cost = self.cost.unwrap_or(price);
+            self.realized += -close_qty * (price - cost) * kwargs.multiplier;
+            self.pos += close_qty;
+            open_qty -= close_qty;
+            if self.pos.abs() <= LOT_EPS {
+                self.pos = 0.;
+                self.cost = None;
+                self.open_price = None;
+            }
+        }
+        if open_qty.abs() > LOT_EPS {
+            let new_pos = self.pos + open_qty;
+            self.cost = Some(match self.cost {
+                Some(cost) => (cost * self.pos + price * open_qty) / new_pos,
+                None => price,
+            });
+            self.open_price = Some(match (self.open_price, method) {
+                (None, _) | (_, OpenPriceMethod::Last) => price,
+                (Some(p), OpenPriceMethod::First) => p,
+                (Some(p), OpenPriceMethod::Average) => (p * self.pos + price * open_qty) / new_pos,
+            });
+            self.pos = new_pos;
+        }
+    }
+
+    fn profit(&self, mid: Option<f64>, multiplier: f64) -> f64 {
+        match (self.cost, mid) {
+            (Some(cost), Some(mid)) if self.pos != 0. => {
+                self.realized + self.pos * (mid - cost) * multiplier
+            }
+            _ => self.realized,
+        }
+    }
+}
+
+/// Fill `need` lots (negative for sell) level by level on `depth`, return the
+/// lots beyond the visible depth.
+fn walk_depth(
+    account: &mut Account,
+    mut need: f64,
+    depth: &[Level],
+    kwargs: &TickBookKwargs,
+    method: OpenPriceMethod,
+) -> f64 {
+    let buy = need > 0.;
+    for level in depth {
+        let qty = need.abs().min(level.volume);
+        let qty = if buy { qty } else { -qty };
+        account.fill(qty, level.price, kwargs, method);
+        need -= qty;
+        if need.abs() <= LOT_EPS {
+            return 0.;
+        }
+    }
+    need
+}
+
+/// A resting limit order at the best price of its own side
+struct LimitOrder {
+    buy: bool,
+    price: f64,
+    qty: f64,
+    /// estimated volume ahead of the order in the queue
+    queue_ahead: f64,
+    /// volume of the level at the last tick
+    level_volume: f64,
+}
+
+impl LimitOrder {
+    fn new(buy: bool, qty: f64, book: &Book, i: usize) -> Option<Self> {
+        // the own side, i.e. the bid for a buy order
+        let best = book.best(!buy, i)?;
+        Some(LimitOrder {
+            buy,
+            price: best.price,
+            qty,
+            queue_ahead: best.volume,
+            level_volume: best.volume,
+        })
+    }
+
+    /// match the order with the book of tick i, return the filled lots
+    fn match_book(&mut self, book: &Book, i: usize) -> f64 {
+        // the opposite best price crossed the order
+        let crossed = match book.best(self.buy, i) {
+            Some(opposite) => {
+                if self.buy {
+                    opposite.price <= self.price
+                } else {
+                    opposite.price >= self.price
+                }
+            }
+            None => false,
+        };
+        let own_best = book.best(!self.buy, i).map(|l| l.price);
+        // the own side moved through the order price, the level was consumed
+        let consumed = match own_best {
+            Some(best) => {
+                if self.buy {
+                    best < self.price
+                } else {
+                    best > self.price
+                }
+            }
+            None => false,
+        };
+        if crossed || consumed {
+            return std::mem::take(&mut self.qty);
+        }
+        // decrease of the level volume is treated as trades ahead of the order
+        let Some(volume) = book.volume_at(self.buy, self.price, i) else {
+            return 0.;
+        };
+        let traded = (self.level_volume - volume).max(0.);
+        self.level_volume = volume;
+        if traded <= self.queue_ahead {
+            self.queue_ahead -= traded;
+            return 0.;
+        }
+        let filled = (traded - self.queue_ahead).min(self.qty);
+        self.queue_ahead = 0.;
+        self.qty -= filled;
+        filled
+    }
+}
+
+fn profit_struct(
+    name: PlSmallStr,
+    unrealized: Vec<f64>,
+    realized: Vec<f64>,
+    open_price: Vec<Option<f64>>,
+) -> PolarsResult<Series> {
+    let len = unrealized.len();
+    let fields = [
+        Float64Chunked::from_vec("unrealized_profit".into(), unrealized).into_series(),
+        Float64Chunked::from_vec("realized_profit".into(), realized).into_series(),
+        Float64Chunked::from_iter_options("open_price".into(), open_price.into_iter())
+            .into_series(),
+    ];
+    Ok(StructChunked::from_series(name, len, fields.iter())?.into_series())
+}
+
+pub(crate) fn profit_fields() -> Vec<Field> {
+    vec![
+        Field::new("unrealized_profit".into(), DataType::Float64),
+        Field::new("realized_profit".into(), DataType::Float64),
+        Field::new("open_price".into(), DataType::Float64),
+    ]
+}
+
+fn profit_output(input_fields: &[Field]) -> PolarsResult<Field> {
+    Ok(Field::new(
+        input_fields[0].name().clone(),
+        DataType::Struct(profit_fields()),
+    ))
+}
+
+crate::profiled! {
+/// inputs: signal, then bid price, bid volume, ask price and ask volume of
+/// every level from level 1, and an optional contract change signal
+#[polars_expr(output_type_func=profit_output)]
+fn calc_tick_future_ret_book(inputs: &[Series], kwargs: TickBookKwargs) -> PolarsResult<Series> {
+    let levels = kwargs.levels;
+    polars_ensure!(
+        levels > 0 && (inputs.len() == 1 + 4 * levels || inputs.len() == 2 + 4 * levels),
+        ComputeError: "calc_tick_future_ret_book expects signal and {} book columns", 4 * levels
+    );
+    let contract_chg_signal = if inputs.len() == 2 + 4 * levels {
+        Some(inputs[1 + 4 * levels].cast(&DataType::Boolean)?)
+    } else {
+        None
+    };
+    let method = OpenPriceMethod::parse(&kwargs.open_price_method)?;
+    let limit = match kwargs.order_type.to_lowercase().as_str() {
+        "market" => false,
+        "limit" => true,
+        order_type => {
+            polars_bail!(InvalidOperation: "order_type {order_type} not supported, expected market or limit")
+        }
+    };
+    let name = inputs[0].name().clone();
+    // the columns are rechunked once and read as slices, only the dtypes
+    // without a native reader are cast
+    let prepared = inputs[..1 + 4 * levels]
+        .iter()
+        .map(|s| {
+            let s = match s.dtype() {
+                DataType::Float64
+                | DataType::Float32
+                | DataType::Int32
+                | DataType::Int64
+                | DataType::UInt32
+                | DataType::UInt64 => s.clone(),
+                _ => {
+                    crate::profiling::record_cast();
+                    s.cast(&DataType::Float64)?
+                }
+            };
+            if s.n_chunks() > 1 {
+                crate::profiling::record_copy();
+            }
+            Ok(s.rechunk())
+        })
+        .collect::<PolarsResult<Vec<_>>>()?;
+    let columns = prepared
+        .iter()
+        .map(as_column)
+        .collect::<PolarsResult<Vec<_>>>()?;
+    let signal = &columns[0];
+    let side = |offset: usize| {
+        (0..levels)
+            .map(|l| {
+                (
+                    &columns[1 + offset * levels + l],
+                    &columns[1 + (offset + 1) * levels + l],
+                )
+            })
+            .collect::<Vec<_>>()
+    };
+    let book = Book {
+        bid: side(0),
+        ask: side(2),
+    };
+
+    let len = inputs[0].len();
+    let mut unrealized = Vec::with_capacity(len);
+    let mut realized = Vec::with_capacity(len);
+    let mut open_price = Vec::with_capacity(len);
+    let mut account = Account::default();
+    let mut order: Option<LimitOrder> = None;
+    let mut target = 0.;
+    let mut blown = false;
+    let mut last_mid = None;
+    let mut depth = Vec::with_capacity(levels);
+    // a null contract change signal is no change
+    let mut chg = contract_chg_signal
+        .as_ref()
+        .map(|s| s.bool().map(|ca| ca.iter()))
+        .transpose()?;
+    for i in 0..len {
+        let chg = chg
+            .as_mut()
+            .and_then(|c| c.next().flatten())
+            .unwrap_or(false);
+        let mid = match (book.best(false, i), book.best(true, i)) {
+            (Some(bid), Some(ask)) => Some(0.5 * (bid.price + ask.price)),
+            _ => None,
+        };
+        // as in calc_tick_future_ret_full, the account is blown once the
+        // equity left by the last tick is negative. It shows no profit and
+        // stops trading from then on, the position and open price are kept.
+        blown = blown
+            || (kwargs.blowup
+                && kwargs.init_cash + account.profit(last_mid, kwargs.multiplier) < 0.);
+        let shown_open_price = if account.pos != 0. {
+            account.open_price
+        } else {
+            None
+        };
+        if blown {
+            unrealized.push(0.);
+            realized.push(account.realized);
+            open_price.push(shown_open_price);
+            continue;
+        }
+        unrealized.push(account.profit(mid, kwargs.multiplier));
+        realized.push(account.realized);
+        open_price.push(shown_open_price);
+        if mid.is_some() {
+            last_mid = mid;
+        }
+
+        if let Some(signal) = signal.get_f64(i) {
+            target = signal;
+        }
+        if chg {
+            // the position of the old contract is closed on this book, the
+            // lots beyond the depth at the deepest visible price. The new
+            // contract is traded from the next tick.
+            order = None;
+            let need = -account.pos;
+            if need.abs() > LOT_EPS {
+                book.side(need > 0., i, &mut depth);
+                let rest = walk_depth(&mut account, need, &depth, &kwargs, method);
+                if rest.abs() > LOT_EPS {
+                    if let Some(price) = depth.last().map(|l| l.price).or(mid) {
+                        account.fill(rest, price, &kwargs, method);
+                    }
+                }
+            }
+            continue;
+        }
+        if limit {
+            // the resting order sent at the last tick meets the new book
+            if let Some(o) = order.as_mut() {
+                let filled = o.match_book(&book, i);
+                let price = o.price;
+                let qty = if o.buy { filled } else { -filled };
+                account.fill(qty, price, &kwargs, method);
+                if o.qty <= LOT_EPS {
+                    order = None;
+                }
+            }
+            let need = target - account.pos;
+            if need.abs() <= LOT_EPS {
+                order = None;
+                continue;
+            }
+            let buy = need > 0.;
+            let own_best = book.best(!buy, i).map(|l| l.price);
+            match order.as_mut() {
+                // keep the queue position if the order is still at the best price
+                Some(o) if o.buy == buy && Some(o.price) == own_best => o.qty = need.abs(),
+                _ => order = LimitOrder::new(buy, need.abs(), &book, i),
+            }
+        } else {
+            // market order walks the visible depth, the rest is sent again at
+            // the next tick if the signal still asks for it
+            let need = target - account.pos;
+            if need.abs() <= LOT_EPS {
+                continue;
+            }
+            book.side(need > 0., i, &mut depth);
+            walk_depth(&mut account, need, &depth, &kwargs, method);
+        }
+    }
+    profit_struct(name, unrealized, realized, open_price)
+}
+}
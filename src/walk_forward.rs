@@ -0,0 +1,287 @@
+use crate::backtest::pos_fits_f32;
+use crate::equity_stats::EquityStats;
+use crate::future_ret_stream::{for_each_equity, FutureRetStreamKwargs};
+use crate::read_as_f32;
+use crate::strategy::from_input::{prepare_filters, FromInput};
+use polars::prelude::*;
+use polars_core::POOL;
+use pyo3_polars::derive::polars_expr;
+use rayon::prelude::*;
+use serde::Deserialize;
+use std::ops::Range;
+use tea_strategy::equity::FutureRetKwargs;
+use tea_strategy::*;
+
+#[derive(Deserialize)]
+struct WalkForwardKwargs<K> {
+    /// strategy kwargs of every combo of the param grid
+    combos: Vec<K>,
+    equity_kwargs: FutureRetKwargs,
+    has_filters: bool,
+    train_len: usize,
+    test_len: usize,
+    /// the train window starts at the first row instead of rolling
+    expanding: bool,
+    metric: String,
+}
+
+fn walk_forward_output(input_fields: &[Field]) -> PolarsResult<Field> {
+    Ok(Field::new(
+        input_fields[0].name().clone(),
+        DataType::Struct(vec![
+            Field::new("signal".into(), DataType::Float64),
+            Field::new("combo".into(), DataType::Int32),
+        ]),
+    ))
+}
+
+struct Fold {
+    train: Range<usize>,
+    test: Range<usize>,
+}
+
+/// The folds of a walk forward, each test window follows its train window
+/// and the next fold starts `test_len` rows later.
+fn folds(
+    len: usize,
+    train_len: usize,
+    test_len: usize,
+    expanding: bool,
+) -> PolarsResult<Vec<Fold>> {
+    polars_ensure!(
+        train_len > 0 && test_len > 0,
+        InvalidOperation: "train_len and test_len of walk_forward should be positive"
+    );
+    let mut folds = Vec::new();
+    let mut start = 0;
+    while start + train_len < len {
+        let test_start = start + train_len;
+        folds.push(Fold {
+            train: if expanding { 0 } else { start }..test_start,
+            test: test_start..(test_start + test_len).min(len),
+        });
+        start += test_len;
+    }
+    Ok(folds)
+}
+
+#[derive(Clone, Copy)]
+enum Metric {
+    Sharpe,
+    TotalRet,
+    MaxDrawdown,
+}
+
+impl Metric {
+    fn parse(metric: &str) -> PolarsResult<Self> {
+        match metric {
+            "sharpe" => Ok(Metric::Sharpe),
+            "total_ret" => Ok(Metric::TotalRet),
+            "max_drawdown" => Ok(Metric::MaxDrawdown),
+            metric => polars_bail!(InvalidOperation: "metric {metric} not supported for \
+            walk_forward, expected sharpe, total_ret or max_drawdown."),
+        }
+    }
+
+    /// score of the statistics of a train window, the higher the better
+    fn score(self, stats: &EquityStats) -> Option<f64> {
+        let score = match self {
+            Metric::Sharpe => stats.sharpe(),
+            Metric::TotalRet => stats.total_ret(),
+            Metric::MaxDrawdown => stats.max_drawdown().map(|v| -v),
+        };
+        score.filter(|v| !v.is_nan())
+    }
+}
+
+/// Run `calc_future_ret` of a signal and score every train window as the
+/// equity is computed, the equity curve is not stored. The train windows
+/// that contain a row are contiguous in `folds`, as their starts and their
+/// ends are both sorted.
+fn score_folds(
+    folds: &[Fold],
+    metric: Metric,
+    signal: &Series,
+    open: &Series,
+    close: &Series,
+    kwargs: &FutureRetStreamKwargs,
+) -> PolarsResult<Vec<Option<f64>>> {
+    let mut stats: Vec<EquityStats> = folds.iter().map(|_| EquityStats::default()).collect();
+    // the rows after the last train window are not scored
+    let len = folds.last().map_or(0, |fold| fold.train.end);
+    let (signal, open, close) = (
+        signal.slice(0, len),
+        open.slice(0, len),
+        close.slice(0, len),
+    );
+    let (mut lo, mut hi, mut row) = (0, 0, 0);
+    // position is the signal of the last bar
+    for_each_equity(
+        &signal,
+        &open,
+        &close,
+        None,
+        None,
+        kwargs,
+        1,
+        |pos, equity| {
+            while hi < folds.len() && folds[hi].train.start <= row {
+                hi += 1;
+            }
+            while lo < hi && folds[lo].train.end <= row {
+                lo += 1;
+            }
+            stats[lo..hi]
+                .iter_mut()
+                .for_each(|stats| stats.update(pos, equity));
+            row += 1;
+        },
+    )?;
+    Ok(stats.iter().map(|stats| metric.score(stats)).collect())
+}
+
+/// The best combo of a fold so far and its signal on the test window
+#[derive(Clone)]
+struct Best {
+    combo: usize,
+    score: f64,
+    test: Vec<Option<f64>>,
+}
+
+impl Best {
+    /// whether `combo` with `score` beats `best`, the lower combo wins a tie
+    fn beats(combo: usize, score: f64, best: Option<&Best>) -> bool {
+        match best {
+            Some(best) => score > best.score || (score == best.score && combo < best.combo),
+            None => true,
+        }
+    }
+
+    fn merge(a: Option<Best>, b: Option<Best>) -> Option<Best> {
+        match (a, b) {
+            (Some(a), Some(b)) => Some(if Best::beats(b.combo, b.score, Some(&a)) {
+                b
+            } else {
+                a
+            }),
+            (a, None) => a,
+            (None, b) => b,
+        }
+    }
+}
+
+/// Stitch the test windows of the combo with the best score of each fold.
+/// A fold where no combo has a score is left null.
+fn walk_forward_result(
+    name: &PlSmallStr,
+    len: usize,
+    folds: &[Fold],
+    best: Vec<Option<Best>>,
+) -> PolarsResult<Series> {
+    let mut signal: Vec<Option<f64>> = vec![None; len];
+    let mut combo: Vec<Option<i32>> = vec![None; len];
+    for (fold, best) in folds.iter().zip(best) {
+        if let Some(best) = best {
+            for (t, v) in fold.test.clone().zip(best.test) {
+                signal[t] = v;
+                combo[t] = Some(best.combo as i32);
+            }
+        }
+    }
+    let fields = [
+        Float64Chunked::from_iter_options("signal".into(), signal.into_iter()).into_series(),
+        Int32Chunked::from_iter_options("combo".into(), combo.into_iter()).into_series(),
+    ];
+    Ok(StructChunked::from_series(name.clone(), len, fields.iter())?.into_series())
+}
+
+/// Walk forward optimization of a strategy, inputs should be
+/// fac, [long_open, long_stop, short_open, short_stop], open, close.
+///
+/// Every combo of the grid runs once over the whole input: the strategy and
+/// `calc_future_ret` are path dependent, so the state carries over from one
+/// fold to the next instead of restarting in every train window. The
+/// combos run in parallel and score the train windows of every fold as
+/// their equity is computed. Only the best combo of each fold so far keeps
+/// its signal on the test window, the full signal of a combo is dropped once
+/// it is scored.
+macro_rules! define_walk_forward {
+    ($name: ident, $strategy: ident $({$mark: tt})?, $kwargs: ty) => {
+        $crate::profiled! {
+        #[polars_expr(output_type_func=walk_forward_output)]
+        fn $name(inputs: &[Series], kwargs: WalkForwardKwargs<$kwargs>) -> PolarsResult<Series> {
+            let offset = if kwargs.has_filters { 5 } else { 1 };
+            polars_ensure!(
+                inputs.len() == offset + 2,
+                ComputeError: format!("wrong length of inputs in function {}", stringify!($name))
+            );
+            polars_ensure!(
+                !kwargs.combos.is_empty(),
+                InvalidOperation: "the param grid of walk_forward is empty"
+            );
+            let metric = Metric::parse(&kwargs.metric)?;
+            let fac = &inputs[0];
+            let folds = folds(fac.len(), kwargs.train_len, kwargs.test_len, kwargs.expanding)?;
+            // filters and prices are prepared once for all the combos
+            let prepared = if kwargs.has_filters {
+                prepare_filters(inputs, &[1, 2, 3, 4])?
+            } else {
+                None
+            };
+            let strategy_inputs = match &prepared {
+                Some(inputs) => &inputs[..5],
+                None => &inputs[..1],
+            };
+            let (open, close) = (&inputs[offset], &inputs[offset + 1]);
+            let (open, close) = if read_as_f32(&[open, close]) {
+                (open.clone(), close.clone())
+            } else {
+                (open.cast(&DataType::Float64)?, close.cast(&DataType::Float64)?)
+            };
+            let equity_kwargs: FutureRetStreamKwargs = (&kwargs.equity_kwargs).into();
+            let best = POOL.install(|| {
+                kwargs
+                    .combos
+                    .par_iter()
+                    .enumerate()
+                    .try_fold(
+                        || vec![None; folds.len()],
+                        |mut best: Vec<Option<Best>>, (c, combo)| -> PolarsResult<Vec<Option<Best>>> {
+                            let signal = $crate::strategy_kernel!($strategy $({$mark})?, strategy_inputs, combo);
+                            // Float32 prices are read in place when the signal is exact in Float32
+                            let pos = if open.dtype() == &DataType::Float32 && pos_fits_f32(&signal) {
+                                signal.cast(&DataType::Float32)?
+                            } else {
+                                signal.clone().into_series()
+                            };
+                            let scores = score_folds(&folds, metric, &pos, &open, &close, &equity_kwargs)?;
+                            for ((fold, best), score) in folds.iter().zip(best.iter_mut()).zip(scores) {
+                                match score {
+                                    Some(score) if Best::beats(c, score, best.as_ref()) => {
+                                        let test = signal.slice(fold.test.start as i64, fold.test.len());
+                                        *best = Some(Best { combo: c, score, test: test.iter().collect() });
+                                    }
+                                    _ => {}
+                                }
+                            }
+                            Ok(best)
+                        },
+                    )
+                    .try_reduce(
+                        || vec![None; folds.len()],
+                        |a, b| Ok(a.into_iter().zip(b).map(|(a, b)| Best::merge(a, b)).collect()),
+                    )
+            })?;
+            walk_forward_result(fac.name(), fac.len(), &folds, best)
+        }
+        }
+    };
+}
+
+define_walk_forward!(walk_forward_boll, boll, BollKwargs);
+define_walk_forward!(walk_forward_auto_boll, auto_boll{?}, AutoBollKwargs);
+define_walk_forward!(walk_forward_delay_boll, delay_boll{?}, DelayBollKwargs);
+define_walk_forward!(walk_forward_martingale, martingale{?}, MartingaleKwargs);
+define_walk_forward!(walk_forward_fix_time, fix_time{?}, FixTimeKwargs);
+define_walk_forward!(walk_forward_auto_tangqian, auto_tangqian{?}, AutoTangQiAnKwargs);
+define_walk_forward!(walk_forward_prob_threshold, prob_threshold{?}, ProbThresholdKwargs);
@@ -1,9 +1,12 @@
 import datetime
 
+import numpy as np
 import polars as pl
-from polars.testing import assert_series_equal
+import pytest
+from polars.testing import assert_frame_equal, assert_series_equal
 
-from polars_qt import calc_future_ret
+import polars_qt as pq
+from polars_qt import calc_future_ret, calc_tick_future_ret_book
 
 
 def test_calc_ret_single():
@@ -48,6 +51,36 @@ def test_calc_ret_single():
     assert_series_equal(out["equity1"], expect, check_names=False)
     assert_series_equal(out["equity2"], expect, check_names=False)
 
+def test_calc_ret_float32_inputs():
+    df = pl.DataFrame(
+        {
+            "signal": [0, 1, 1, -1, -1, 0, 2, 0],
+            "bid": [10.5, 10.25, 11.0, 12.5, 11, 10, 10.75, 9.5],
+            "ask": [11.0, 10.75, 11.5, 13, 11.5, 10.5, 11.25, 10],
+        }
+    )
+    df32 = df.with_columns(pl.col("bid", "ask").cast(pl.Float32))
+    for func in [
+        "calc_future_ret",
+        "calc_tick_future_ret",
+        "calc_tick_future_ret_full",
+    ]:
+        args = ("ask", "bid") if func == "calc_future_ret" else ("bid", "ask")
+        expr = getattr(pl.col("signal").qt, func)(*args, multiplier=10, c_rate=1e-3)
+        expect = df.with_columns(pl.col("signal").cast(pl.Float64)).select(expr)
+        # Int64 signal with Float64 prices, Int64 signal with Float32 prices
+        assert_frame_equal(df.select(expr), expect)
+        assert_frame_equal(df32.select(expr), expect)
+        assert_frame_equal(
+            df32.with_columns(pl.col("signal").cast(pl.Int32)).select(expr), expect
+        )
+    # Int32 lots beyond 2^24 are not exact in Float32
+    big = df32.with_columns(pl.col("signal").cast(pl.Int32) * (2**24 + 1))
+    expr = pl.col("signal").qt.calc_tick_future_ret_full("bid", "ask", multiplier=10)
+    expect = big.with_columns(pl.col("signal").cast(pl.Float64)).select(expr)
+    assert_frame_equal(big.select(expr), expect)
+
+
 def test_calc_tick_ret():
     df = pl.DataFrame(
         {
@@ -70,3 +103,401 @@ def test_calc_tick_ret():
     ])
     df = df.with_columns(cash = pl.col.signal.qt.calc_tick_future_ret(pl.col.bid, pl.col.ask, **kwargs))
     assert_series_equal(df['cash'], expect)
+
+
+def test_calc_tick_ret_batched(tmp_path):
+    df = pl.DataFrame(
+        {
+            "bid": [101, 102, 103, 104, 103, 101, 206, None, 208, 204, 202, 201],
+            "ask": [102, 103, 104, 105, 104, 102, 207, 205, 209, 205, 203, 202],
+            "chg": [0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0],
+            "signal": [0.0, 1, 1, 1, 0.5, 0.5, 1, 0, -1, -1, 1, 1],
+        }
+    )
+    path = tmp_path / "ticks.feather"
+    df.write_ipc(path)
+    kwargs = {"contract_chg_signal": "chg", "init_cash": 10_000, "c_rate": 1e-4}
+    expect = df.select(pq.calc_tick_future_ret("signal", "bid", "ask", **kwargs))
+    full_expect = df.select(pq.calc_tick_future_ret_full("signal", "bid", "ask", **kwargs))
+    for batch_size in [1, 5, 100]:
+        # a path is memory mapped, a DataFrame is sliced as it is
+        for source in [path, df]:
+            batches = list(
+                pq.calc_tick_future_ret_batched(
+                    source, "signal", "bid", "ask", batch_size=batch_size, **kwargs
+                )
+            )
+            assert len(batches) == -(-df.height // batch_size)
+            assert_frame_equal(pl.concat(batches), expect)
+            batches = pq.calc_tick_future_ret_full_batched(
+                source, "signal", "bid", "ask", batch_size=batch_size, **kwargs
+            )
+            assert_frame_equal(pl.concat(batches), full_expect)
+    # a position is the signal of the next row, which may be in the next batch
+    kwargs["is_signal"] = False
+    expect = df.select(pq.calc_tick_future_ret("signal", "bid", "ask", **kwargs))
+    batches = pq.calc_tick_future_ret_batched(
+        path, "signal", "bid", "ask", batch_size=5, **kwargs
+    )
+    assert_frame_equal(pl.concat(batches), expect)
+
+
+def test_backtest():
+    df = pl.DataFrame(
+        {
+            "open": [98, 100, 103, 105, 96, 100, 101, 99, 97, 102, 104, 98],
+            "close": [100, 102, 105, 96, 90, 101, 99, 98, 101, 103, 99, 97],
+        }
+    )
+    strategy_kwargs = {"params": (4, 1.0), "delay_open": False}
+    equity_kwargs = {"init_cash": 1_000_000, "multiplier": 10, "c_rate": 3e-4}
+    expect = df.select(
+        pl.col("close")
+        .qt.boll(**strategy_kwargs)
+        .qt.calc_future_ret("open", "close", **equity_kwargs)
+    ).to_series()
+    out = df.select(
+        equity=pl.col("close").qt.backtest(
+            "open", "close", "boll", strategy_kwargs, equity_kwargs
+        ),
+        final=pl.col("close").qt.backtest(
+            "open", "close", "boll", strategy_kwargs, equity_kwargs, output="final"
+        ),
+        both=pl.col("close").qt.backtest(
+            "open", "close", "boll", strategy_kwargs, equity_kwargs, output="both"
+        ),
+    )
+    assert_series_equal(out["equity"], expect, check_names=False)
+    assert out["final"][0] == expect[-1]
+    assert_series_equal(out["both"].struct.field("equity"), expect, check_names=False)
+    assert_series_equal(
+        out["both"].struct.field("ret"), expect.pct_change(), check_names=False
+    )
+    # every output goes through one equity loop, also with Float32 prices
+    df32 = df.cast(pl.Float32)
+    args = ("open", "close", "boll", strategy_kwargs, equity_kwargs)
+    out = df32.select(
+        equity=pl.col("close").qt.backtest(*args),
+        final=pl.col("close").qt.backtest(*args, output="final"),
+        stats=pl.col("close").qt.backtest(*args, output="stats"),
+    )
+    assert out["final"][0] == out["equity"][-1]
+    assert out["stats"][0]["final_equity"] == out["equity"][-1]
+    # is_signal is not a kwarg of the fused calc_future_ret
+    with pytest.raises(ValueError, match="is_signal"):
+        pq.backtest("close", "open", "close", equity_kwargs={"is_signal": False})
+
+
+def test_calc_ret_summary():
+    df = pl.DataFrame(
+        {
+            "open": [98, 100, 103, 105, 96, 220, 226],
+            "close": [100, 102, 105, 96, 90, 226, 220],
+            "pos": [0.0, 1.0, 1.0, 0.5, -0.5, -0.5, 0.0],
+        }
+    )
+    config = {"is_signal": False, "init_cash": 1_000_000, "multiplier": 10}
+    equity = df.select(
+        pl.col("pos").qt.calc_future_ret("open", "close", **config)
+    ).to_series()
+    stats = df.select(
+        pl.col("pos").qt.calc_future_ret("open", "close", summary=True, **config)
+    ).to_series()
+    assert len(stats) == 1
+    stats = stats[0]
+    ret = equity.pct_change()
+    assert abs(stats["final_equity"] - equity[-1]) < 1e-8
+    assert abs(stats["sharpe"] - ret.mean() / ret.std()) < 1e-8
+    assert abs(stats["max_drawdown"] - (1 - equity / equity.cum_max()).max()) < 1e-8
+    assert abs(stats["turnover"] - 3.0) < 1e-8
+    assert stats["trade_count"] == 4
+
+    # one struct per group, not a list
+    panel = pl.concat([df.with_columns(symbol=pl.lit(s)) for s in ["a", "b"]])
+    out = panel.group_by("symbol", maintain_order=True).agg(
+        stats=pl.col("pos").qt.calc_future_ret("open", "close", summary=True, **config)
+    )
+    assert isinstance(out.schema["stats"], pl.Struct)
+    assert out["stats"].to_list() == [stats, stats]
+
+
+def _equity_stats(equity):
+    """
+    Final equity, max drawdown and sharpe of an equity curve, as
+    calc_future_ret(summary=True) accumulates them.
+    """
+    equity = [e for e in equity if e is not None]
+    peak, drawdown, rets = 0.0, 0.0, []
+    for i, e in enumerate(equity):
+        if i > 0 and equity[i - 1] != 0:
+            rets.append(e / equity[i - 1] - 1)
+        if e > peak:
+            peak = e
+        elif peak > 0:
+            drawdown = max(drawdown, 1 - e / peak)
+    final = equity[-1] if equity else None
+    std = np.std(rets, ddof=1) if len(rets) > 1 else 0.0
+    sharpe = np.mean(rets) / std if std > 1e-7 else None
+    return final, drawdown if equity else None, sharpe
+
+
+def test_calc_ret_summary_random():
+    # summary=True runs its own copy of the calc_future_ret loop, it must give
+    # the same equity on every row: the random lengths check the last row of
+    # many prefixes
+    rng = np.random.default_rng(0)
+    for case in range(300):
+        n = int(rng.integers(1, 80))
+        open = 100 + rng.standard_normal(n).cumsum()
+        df = pl.DataFrame(
+            {
+                "open": open,
+                "close": open + rng.standard_normal(n),
+                "pos": rng.choice([0, 0, 1, -1, 0.5, -0.5, 2], n).astype(float),
+                "spread": rng.integers(0, 3, n) * 0.5,
+                "chg": rng.random(n) < 0.1,
+            }
+        ).with_columns(
+            pos=pl.when(pl.lit(case % 2 == 1) & (pl.int_range(pl.len()) % 7 == 3))
+            .then(None)
+            .otherwise("pos")
+        )
+        slippage = float(rng.choice([0, 0.5]))
+        config = {
+            "is_signal": False,
+            "init_cash": int(rng.choice([1_000, 1_000_000])),
+            "multiplier": int(rng.choice([1, 10])),
+            "c_rate": float(rng.choice([0, 3e-4])),
+            "blowup": case % 5 == 0,
+            "commission_type": str(rng.choice(["percent", "absolute"])),
+            "slippage": pl.col("spread") if case % 4 == 1 else slippage,
+        }
+        if case % 3 == 0:
+            config["contract_chg_signal"] = "chg"
+        equity = df.select(pl.col.pos.qt.calc_future_ret("open", "close", **config))
+        stats = df.select(
+            pl.col.pos.qt.calc_future_ret("open", "close", summary=True, **config)
+        ).item()
+        final, drawdown, sharpe = _equity_stats(equity.to_series().to_list())
+        assert stats["final_equity"] == final
+        assert stats["max_drawdown"] == drawdown
+        if sharpe is None:
+            assert stats["sharpe"] is None
+        else:
+            assert stats["sharpe"] == pytest.approx(sharpe, rel=1e-9)
+
+
+def test_calc_tick_ret_random(tmp_path):
+    # summary=True and the batched runs go through the copy of the tick
+    # kernels in future_ret_stream.rs, they must match the kernels on every row
+    rng = np.random.default_rng(1)
+    for case in range(200):
+        n = int(rng.integers(1, 60))
+        bid = 100 + rng.integers(-3, 4, n).cumsum().astype(float)
+        df = pl.DataFrame(
+            {
+                "bid": bid,
+                "ask": bid + rng.integers(1, 3, n),
+                "signal": rng.choice([0, 0, 1, -1, 0.5, -0.5, 2], n).astype(float),
+                "chg": rng.random(n) < 0.1,
+            }
+        ).with_columns(
+            bid=pl.when(pl.lit(case % 2 == 1) & (pl.int_range(pl.len()) % 7 == 3))
+            .then(None)
+            .otherwise("bid")
+        )
+        path = tmp_path / f"ticks_{case}.feather"
+        df.write_ipc(path)
+        config = {
+            "init_cash": int(rng.choice([1_000, 1_000_000])),
+            "multiplier": int(rng.choice([1, 10])),
+            "c_rate": float(rng.choice([0, 3e-4])),
+            "blowup": case % 5 == 0,
+            "commission_type": str(rng.choice(["percent", "absolute"])),
+        }
+        if case % 3 == 0:
+            config["contract_chg_signal"] = "chg"
+        signal_type = str(rng.choice(["percent", "absolute"]))
+        batch_size = int(rng.integers(1, 20))
+        equity = df.select(
+            pq.calc_tick_future_ret(
+                "signal", "bid", "ask", signal_type=signal_type, **config
+            )
+        )
+        stats = df.select(
+            pq.calc_tick_future_ret(
+                "signal", "bid", "ask", signal_type=signal_type, summary=True, **config
+            )
+        ).item()
+        final, drawdown, sharpe = _equity_stats(equity.to_series().to_list())
+        assert stats["final_equity"] == final
+        assert stats["max_drawdown"] == drawdown
+        if sharpe is None:
+            assert stats["sharpe"] is None
+        else:
+            assert stats["sharpe"] == pytest.approx(sharpe, rel=1e-9)
+        batches = pq.calc_tick_future_ret_batched(
+            path,
+            "signal",
+            "bid",
+            "ask",
+            batch_size=batch_size,
+            signal_type=signal_type,
+            **config,
+        )
+        assert_frame_equal(pl.concat(batches), equity)
+        full = df.select(pq.calc_tick_future_ret_full("signal", "bid", "ask", **config))
+        batches = pq.calc_tick_future_ret_full_batched(
+            path, "signal", "bid", "ask", batch_size=batch_size, **config
+        )
+        assert_frame_equal(pl.concat(batches), full)
+
+def test_calc_ret_panel():
+    df = pl.DataFrame(
+        {
+            "symbol": ["a", "b"] * 7,
+            "open": [98, 50, 100, 51, 103, 49, 105, 48, 96, 50, 100, 52, 104, 53],
+            "close": [100, 51, 102, 50, 105, 48, 96, 49, 90, 52, 104, 53, 103, 51],
+            "pos": [0., 0, 1, -1, 1, -1, 0.5, 0, -0.5, 1, -0.5, 1, 0, 0],
+        },
+    )
+    config = {"is_signal": False, "init_cash": 1_000_000}
+    out = df.with_columns(
+        panel=calc_future_ret(
+            "pos", "open", "close", by="symbol",
+            multiplier={"a": 10, "b": 300}, c_rate={"a": 3e-4, "b": 1e-4},
+            portfolio=True, **config,
+        ),
+    )
+    for symbol, multiplier, c_rate in [("a", 10, 3e-4), ("b", 300, 1e-4)]:
+        part = out.filter(pl.col("symbol") == symbol)
+        expect = part.select(
+            calc_future_ret("pos", "open", "close", multiplier=multiplier, c_rate=c_rate, **config)
+        ).to_series()
+        assert_series_equal(part["panel"].struct.field("equity"), expect, check_names=False)
+    final = out.group_by("symbol").agg(pl.col("panel").struct.field("equity").last())
+    assert abs(out["panel"].struct.field("portfolio")[-1] - final["equity"].sum()) < 1e-6
+    # a per-row multiplier must be constant within each symbol
+    with pytest.raises(pl.exceptions.ComputeError, match="constant within a symbol"):
+        df.with_columns(m=pl.int_range(1, pl.len() + 1)).select(
+            calc_future_ret("pos", "open", "close", by="symbol", multiplier="m", **config)
+        )
+
+
+def test_calc_tick_ret_book():
+    df = pl.DataFrame(
+        {
+            "signal": [0.0, 2, 2, -1, -1, 0, 0, 3, 0],
+            "bid1": [10.0, 10, 11, 12, 11, 10, 10, 9, 10],
+            "ask1": [11.0, 11, 12, 13, 12, 11, 11, 10, 11],
+            "vol": [1e6] * 9,
+        }
+    ).with_columns(bid2=pl.col.bid1 - 1, ask2=pl.col.ask1 + 1)
+    book = {
+        "bid": ["bid1", "bid2"],
+        "bid_vol": ["vol", "vol"],
+        "ask": ["ask1", "ask2"],
+        "ask_vol": ["vol", "vol"],
+        "multiplier": 10,
+        "c_rate": 1e-3,
+    }
+    # enough depth at the touch, same as calc_tick_future_ret_full
+    out = df.select(
+        book=calc_tick_future_ret_book("signal", **book),
+        full=pl.col.signal.qt.calc_tick_future_ret_full(
+            "bid1", "ask1", multiplier=10, c_rate=1e-3
+        ),
+    )
+    for field in ["unrealized_profit", "open_price"]:
+        assert_series_equal(
+            out["book"].struct.field(field), out["full"].struct.field(field)
+        )
+    # only 1 lot at the touch, the second lot is filled at level 2
+    out = df.with_columns(vol=pl.lit(1.0)).select(
+        calc_tick_future_ret_book("signal", **book).struct.field("open_price")
+    )
+    assert out["open_price"][2] == 11.5
+    # chunks are read in place
+    chunked = pl.concat([df.slice(i, 2) for i in range(0, df.height, 2)], rechunk=False)
+    expr = calc_tick_future_ret_book("signal", **book)
+    assert_frame_equal(chunked.select(expr), df.select(expr))
+    # the contract change closes the 2 lots bought at 11 at the bid 11 of tick 2,
+    # they are bought again at the ask 13 of tick 3
+    out = df.with_columns(
+        signal=pl.Series([0.0, 2, 2, 2, 2, 0, 0, 0, 0]),
+        chg=pl.int_range(pl.len()) == 2,
+    ).select(calc_tick_future_ret_book("signal", contract_chg_signal="chg", **book))
+    profit = out["signal"].struct.unnest()
+    assert profit["realized_profit"][3] == pytest.approx(-2 * (2 * 11 * 10 * 1e-3))
+    assert profit["open_price"].to_list()[2:5] == [11, None, 13]
+    # short 2 lots at 10 while the mid rises to 12.5, the equity is negative
+    # after tick 3 and the account stops trading, same as calc_tick_future_ret_full
+    out = df.with_columns(signal=pl.Series([0.0, -2, -2, -2, -2, -2, 0, 0, 0])).select(
+        book=calc_tick_future_ret_book("signal", init_cash=40, blowup=True, **book),
+        full=pl.col.signal.qt.calc_tick_future_ret_full(
+            "bid1", "ask1", init_cash=40, multiplier=10, c_rate=1e-3, blowup=True
+        ),
+    )
+    for field in ["unrealized_profit", "realized_profit", "open_price"]:
+        assert_series_equal(
+            out["book"].struct.field(field), out["full"].struct.field(field)
+        )
+    profit = out["book"].struct.field("unrealized_profit")
+    assert profit[2] == pytest.approx(-2 * 1.5 * 10 - 2 * 10 * 10 * 1e-3)
+    assert profit[3] == pytest.approx(-2 * 2.5 * 10 - 2 * 10 * 10 * 1e-3)
+    assert profit.to_list()[4:] == [0] * (df.height - 4)
+    open_price = out["book"].struct.field("open_price")
+    assert open_price.to_list()[4:] == [10] * (df.height - 4)
+
+
+def test_walk_forward():
+    rng = np.random.default_rng(0)
+    close = 100 + rng.standard_normal(120).cumsum()
+    df = pl.DataFrame({"open": close + rng.standard_normal(120) * 0.1, "close": close})
+    param_grid = {"params": [(5, 0.5), (5, 1.0), (10, 1.0)], "delay_open": [False]}
+    combos = pq.expand_param_grid(param_grid)
+    assert len(combos) == 3
+    equity_kwargs = {"init_cash": 1_000_000, "c_rate": 3e-4}
+    train_len, test_len = 30, 20
+    # brute force: run every combo on the whole input and score the train windows
+    signals = [df.select(pl.col("close").qt.boll(**c)).to_series().to_numpy() for c in combos]
+    equities = [
+        df.select(
+            pl.col("close").qt.boll(**c).qt.calc_future_ret("open", "close", **equity_kwargs)
+        ).to_series().to_numpy()
+        for c in combos
+    ]
+
+    def sharpe(equity):
+        ret = equity[1:] / equity[:-1] - 1
+        if len(ret) < 2 or ret.var(ddof=1) <= 1e-14:
+            return None
+        return ret.mean() / ret.std(ddof=1)
+
+    expect_signal, expect_combo = [None] * df.height, [None] * df.height
+    start = 0
+    while start + train_len < df.height:
+        train = slice(start, start + train_len)
+        scores = [sharpe(e[train]) for e in equities]
+        best = max((s, -c) for c, s in enumerate(scores) if s is not None)
+        best = -best[1]
+        for t in range(start + train_len, min(start + train_len + test_len, df.height)):
+            expect_signal[t], expect_combo[t] = signals[best][t], best
+        start += test_len
+    out = df.select(
+        pl.col("close").qt.walk_forward(
+            "open", "close", "boll", param_grid, train_len, test_len,
+            equity_kwargs=equity_kwargs,
+        )
+    ).to_series()
+    assert out.struct.field("signal").to_list() == expect_signal
+    assert out.struct.field("combo").to_list() == expect_combo
+    # the inputs of the combos are compared by value, a name is parsed again
+    # for every combo
+    by_name = df.select(
+        pq.walk_forward(
+            "close", "open", "close", "boll", param_grid, train_len, test_len,
+            equity_kwargs=equity_kwargs,
+        )
+    ).to_series()
+    assert_series_equal(by_name, out)
@@ -1,7 +1,8 @@
 import numpy as np
 import polars as pl
+import pytest
 from numpy.testing import assert_allclose
-from polars.testing import assert_series_equal
+from polars.testing import assert_frame_equal, assert_series_equal
 
 import polars_qt as pq
 
@@ -68,6 +69,320 @@ def test_rolling_rank():
     )
 
 
+def test_rolling_rank_tree():
+    a = np.random.default_rng(0).integers(0, 20, 1000).astype(float)
+    a[::7] = np.nan
+    df = pl.DataFrame({"a": a}).with_columns(
+        pl.when(pl.int_range(pl.len()) % 11 == 0).then(None).otherwise("a").alias("a")
+    )
+    # windows below and above the rows read ahead by the tree
+    for window, pct, rev in [(50, False, False), (50, True, False), (300, True, True)]:
+        naive = pl.col("a").qt.rolling_rank(window, pct=pct, rev=rev, method="naive")
+        tree = pl.col("a").qt.rolling_rank(window, pct=pct, rev=rev, method="tree")
+        res = df.select(naive.alias("naive"), tree.alias("tree"))
+        assert_series_equal(res["naive"], res["tree"], check_names=False)
+    # min_periods is not clamped to the window, as in tevec's ts_vrank
+    res = df.select(
+        naive=pl.col("a").qt.rolling_rank(5, min_periods=6, method="naive"),
+        tree=pl.col("a").qt.rolling_rank(5, min_periods=6, method="tree"),
+    )
+    assert res["naive"].null_count() == res["tree"].null_count() == df.height
+
+
+def test_rolling_chunked():
+    # many small chunks, as after pl.concat of daily files
+    rng = np.random.default_rng(0)
+    n = 150_000
+    df = pl.DataFrame(
+        {"a": rng.standard_normal(n).cumsum(), "b": rng.integers(0, 2, n)}
+    )
+    df = df.with_columns(
+        pl.when(pl.int_range(pl.len()) % 97 == 0).then(None).otherwise("a").alias("a")
+    )
+    chunked = pl.concat([df.slice(i, 997) for i in range(0, n, 997)], rechunk=False)
+    assert chunked.n_chunks() > 100
+    exprs = [
+        pl.col.a.qt.rolling_zscore(100).alias("zscore"),
+        pl.col.a.qt.rolling_ewm(50).alias("ewm"),
+        pl.col.a.qt.rolling_skew(30).alias("skew"),
+        pl.col.a.qt.rolling_kurt(30).alias("kurt"),
+        pl.col.a.qt.rolling_rank(20, method="naive").alias("rank"),
+        pl.col.a.qt.rolling_rank(30_000, pct=True, method="tree").alias("rank_tree"),
+        pl.col.a.qt.fdiff(0.5, 20).alias("fdiff"),
+        pl.col.b.qt.binary_consecutive_prop(10).alias("prop"),
+        pl.col.b.qt.binary_pattern_vote(lookup_len=40, pattern_len=5).alias("vote"),
+        pl.col.a.diff().qt.compose_by(3).alias("compose"),
+    ]
+    expect = df.select(exprs)
+    res = chunked.select(exprs)
+    for name in expect.columns:
+        assert_series_equal(res[name], expect[name], rtol=1e-6, atol=1e-8)
+
+
+def test_rolling_chunked_near_constant():
+    # the running sums are not restarted at a block boundary, which would change
+    # the low bits and the variance check of a near constant window
+    n = 200_000
+    a = 1e4 + np.random.default_rng(2).integers(0, 2, n) * 1e-7
+    a[100_000:130_000] = 1e4
+    df = pl.DataFrame({"a": a})
+    chunked = pl.concat([df.slice(i, 997) for i in range(0, n, 997)], rechunk=False)
+    exprs = [
+        pl.col.a.qt.rolling_zscore(50).alias("zscore"),
+        pl.col.a.qt.rolling_ewm(50).alias("ewm"),
+        pl.col.a.qt.rolling_skew(50).alias("skew"),
+        pl.col.a.qt.rolling_kurt(50).alias("kurt"),
+    ]
+    expect = df.select(exprs)
+    assert_frame_equal(chunked.select(exprs), expect)
+    # a Float32 output of a single chunk above the block length
+    res = df.select(pl.col.a.qt.rolling_zscore(50, output_dtype=pl.Float32))["a"]
+    assert_series_equal(res, expect["zscore"].cast(pl.Float32), check_names=False)
+
+
+def test_rolling_float32_output():
+    a = np.random.default_rng(1).standard_normal(200_000).cumsum()
+    df = pl.DataFrame({"a": a}).with_columns(b=pl.col.a.cast(pl.Float32))
+    for func in [
+        "rolling_zscore",
+        "rolling_ewm",
+        "rolling_skew",
+        "rolling_kurt",
+        "rolling_rank",
+    ]:
+        for col in ["a", "b"]:
+            expr = getattr(pl.col(col).qt, func)
+            res = df.select(expr(20, output_dtype=pl.Float32))[col]
+            assert res.dtype == pl.Float32
+            expect = df.select(expr(20))[col].cast(pl.Float32)
+            assert_series_equal(res, expect)
+    # the tree rank and the single window moments write Float32 as they go,
+    # they match the same statistics of the multi window struct
+    for col in ["a", "b"]:
+        res = df.select(
+            pl.col(col).qt.rolling_rank(300, output_dtype=pl.Float32).alias("rank"),
+            pl.col(col).qt.rolling_skew(50, output_dtype=pl.Float32).alias("skew"),
+            pl.col(col).qt.rolling_skew([50, 7], output_dtype=pl.Float32).alias("s"),
+        )
+        expect = df.select(pl.col(col).qt.rolling_rank(300))[col].cast(pl.Float32)
+        assert_series_equal(res["rank"], expect, check_names=False)
+        assert_series_equal(
+            res["skew"], res["s"].struct.field("skew_50"), check_names=False
+        )
+
+
+def test_rolling_stats():
+    a = np.random.default_rng(2).standard_normal(1000).cumsum()
+    df = pl.DataFrame({"a": a}).with_columns(
+        pl.when(pl.int_range(pl.len()) % 13 == 0).then(None).otherwise("a").alias("a")
+    )
+    stats = ["mean", "std", "skew", "kurt", "zscore", "ewm", "rank"]
+    res = df.select(pl.col.a.qt.rolling_stats(20, stats=stats)).unnest("a")
+    assert res.columns == stats
+    expect = df.select(
+        mean=pl.col.a.rolling_mean(20, min_periods=10),
+        std=pl.col.a.rolling_std(20, min_periods=10),
+        skew=pl.col.a.qt.rolling_skew(20),
+        kurt=pl.col.a.qt.rolling_kurt(20),
+        zscore=pl.col.a.qt.rolling_zscore(20),
+        ewm=pl.col.a.qt.rolling_ewm(20),
+        rank=pl.col.a.qt.rolling_rank(20),
+    )
+    for name in stats:
+        assert_series_equal(res[name], expect[name], rtol=1e-6)
+    # std on a large mean, where the sum of squares cancels
+    df = pl.DataFrame({"a": 1e9 + np.random.default_rng(4).standard_normal(1000)})
+    res = df.select(pl.col.a.qt.rolling_stats(20, stats=["std"]).struct.field("std"))
+    expect = df.select(pl.col.a.rolling_std(20, min_periods=10))
+    assert_series_equal(res["std"], expect["a"], check_names=False, rtol=1e-6)
+    # zscore keeps the raw sums of rolling_zscore, std does not share them
+    res = df.select(
+        pl.col.a.qt.rolling_stats(20, stats=["std", "zscore"]),
+        single=pl.col.a.qt.rolling_zscore(20),
+    ).unnest("a")
+    assert_series_equal(res["zscore"], res["single"], check_names=False)
+
+
+def test_rolling_stats_baseline():
+    # the fields match the single statistic kernels of polars-qt 0.1.28
+    a = [0.3, None, -1.2, 0.8, 2.5, -0.4]
+    a += [1e8 + 0.25, 1e8 - 0.5, 1e8 + 1.0, 1e8 - 0.75, 1e8 + 0.5]
+    a += [3.0, 3.0, 3.0, 3.0, None, 4.5]
+    df = pl.DataFrame({"a": a}, schema={"a": pl.Float64})
+    stats = ["skew", "kurt", "zscore", "ewm", "rank"]
+    res = df.select(pl.col.a.qt.rolling_stats(5, stats=stats, min_periods=3))
+    # fmt: off
+    expect = pl.DataFrame({
+        "skew": [
+            None, None, None, -1.2933427807333966, 0.18935118230813736,
+            0.6615742543768026, 2.236067977499785, 0.6085806194501844,
+            -0.6085806194501864, -2.236067977499786, 0.0, -2.2360679774997925,
+            -0.6085806194501814, 0.6085806194501866, 2.2360679774997907, 0.0, 0.0,
+        ],
+        "kurt": [
+            None, None, None, None, 0.9945854303330872, -0.5747960133212509,
+            4.9999999999999805, -3.333333333333334, -3.3333333333333286, 5.0,
+            -3.6028797018963976e+16, 5.0, -3.333333333333357, -3.3333333333333393,
+            5.000000000000021, 0.0, 0.0,
+        ],
+        "zscore": [
+            None, None, None, 0.8006407690254358, 1.2456227082195042,
+            -0.5127125463001363, 1.7888543819998313, 1.0954451081638,
+            0.7302967570332853, 0.4472135787294481, 0.2529822165831991,
+            -1.788854381999832, -1.0954451150103326, -0.7302967433402215,
+            -0.44721359549995804, None, None,
+        ],
+        "ewm": [
+            None, None, None, 0.09591836734693887, 1.200735294117647, 0.51875,
+            43372658.27866066, 69396252.66727968, 85010409.88358778, 94378903.39701596,
+            100000000.14503817, 56627343.50329632, 30603749.543546144,
+            14989593.11710617, 5621099.320263702, 2.9999999952612115,
+            3.6893382324508446,
+        ],
+        "rank": [
+            None, None, None, 3.0, 4.0, 2.0, 5.0, 4.0, 5.0, 2.0, 4.0, 1.0, 1.5, 2.0,
+            2.5, None, 4.0,
+        ],
+    }, schema=dict.fromkeys(stats, pl.Float64))
+    # fmt: on
+    assert_frame_equal(res.unnest("a"), expect, rtol=1e-12)
+
+
+def test_rolling_moments_baseline():
+    # outputs of the tevec kernels (polars-qt 0.1.28): nulls, min_periods, a
+    # large mean where the raw sums cancel and a constant run
+    a = [None, 0.3, -1.2, 0.8, None, 2.5, -0.4, 1.1, 0.9, -2.0]
+    a += [1e8 + 0.25, 1e8 - 0.5, 1e8 + 1.0, 1e8 - 0.75, 1e8 + 0.5, 1e8]
+    a += [3.0, 3.0, 3.0, 3.0, 3.0, None, 3.0, 4.5]
+    df = pl.DataFrame({"a": a}, schema={"a": pl.Float64})
+    res = df.select(
+        zscore=pl.col.a.qt.rolling_zscore(4),
+        zscore_6=pl.col.a.qt.rolling_zscore(6, min_periods=6),
+        skew=pl.col.a.qt.rolling_skew(5),
+        skew_5=pl.col.a.qt.rolling_skew(5, min_periods=5),
+        kurt=pl.col.a.qt.rolling_kurt(6),
+        ewm=pl.col.a.qt.rolling_ewm(4, min_periods=0),
+    )
+    # fmt: off
+    expect = pl.DataFrame({
+        "zscore": [
+            None, None, -0.7071067811865476, 0.8006407690254358, None,
+            0.9719086448808699, -0.9378934722869389, 0.022983951313055636,
+            -0.10530011178665792, -1.3280977555166897, 1.4999999999999993,
+            0.866025397289248, 0.5000000149999997, None, None, None, -1.5,
+            -0.8660254037844387, -0.5000000000000001, None, None, None, None, None,
+        ],
+        "zscore_6": [
+            None, None, None, None, None, None, None, None, None, None,
+            2.0412414523193134, 1.2909944414739616, 0.9128709428683406,
+            0.6454972098442151, 0.40824830026182174, None, -2.041241452319315,
+            -1.2909944487358056, -0.912870929175277, -0.6454972243679029,
+            -0.40824829046386313, None, None, None,
+        ],
+        "skew": [
+            None, None, None, -1.2933427807333966, -1.2933427807333966,
+            0.18935118230813736, 0.6615742543768026, 0.24584467961367487,
+            0.1250898075440778, -0.4501817619746014, 2.236067977499785,
+            0.608580619450183, -0.6085806194501857, -2.236067977499786, 0.0, 0.0,
+            -2.23606797749979, -0.608580619450185, 0.6085806194501856,
+            2.236067977499791, 0.0, 0.0, 0.0, 0.0,
+        ],
+        "skew_5": [
+            None, None, None, None, None, None, None, None, None, -0.4501817619746014,
+            2.236067977499785, 0.608580619450183, -0.6085806194501857,
+            -2.236067977499786, 0.0, 0.0, -2.23606797749979, -0.608580619450185,
+            0.6085806194501856, 2.236067977499791, 0.0, None, None, None,
+        ],
+        "kurt": [
+            None, None, None, None, None, 0.9945854303330872, 0.7354035461039778,
+            -0.5305547497283503, 1.8441724074628745, 0.05873828056902634,
+            5.999999999999972, -1.8749999999999987, -3.333333333333333,
+            -1.8750000000000107, 6.000000000000009, 0.0, 6.00000000000009,
+            -1.8749999999999691, -3.3333333333333224, -1.8749999999999887,
+            6.000000000000033, 0.0, 0.0, 0.0,
+        ],
+        "ewm": [
+            None, 0.3, -0.6999999999999998, 0.15714285714285722, 0.15714285714285722,
+            1.4857142857142858, 0.5999999999999999, 0.8714285714285713,
+            0.8866666666666667, -0.7066666666666666, 53333333.126666665,
+            79999999.59333333, 93333333.63333334, 99999999.81666666, 100000000.16666667,
+            100000000.1, 46666668.28333333, 20000002.433333334, 6666669.466666667, 3.0,
+            3.0, 3.0, 3.0, 3.857142857142857,
+        ],
+    }, schema=dict.fromkeys(res.columns, pl.Float64))
+    # fmt: on
+    assert_frame_equal(res, expect, rtol=1e-12)
+
+
+def test_rolling_multi_window():
+    a = np.random.default_rng(3).standard_normal(1000).cumsum()
+    df = pl.DataFrame({"a": a})
+    windows = [5, 20, 60]
+    for name in ["zscore", "skew", "kurt", "ewm", "rank"]:
+        func = getattr(pl.col.a.qt, f"rolling_{name}")
+        res = df.select(func(windows)).unnest("a")
+        assert res.columns == [f"{name}_{w}" for w in windows]
+        for w in windows:
+            expect = df.select(func(w))["a"]
+            assert_series_equal(
+                res[f"{name}_{w}"], expect, check_names=False, rtol=1e-6
+            )
+    # a repeated window is computed once
+    res = df.select(pl.col.a.qt.rolling_zscore([20, 5, 20])).unnest("a")
+    assert res.columns == ["zscore_20", "zscore_5"]
+    with pytest.raises(ValueError, match="empty"):
+        pl.col.a.qt.rolling_zscore([])
+
+
+def test_rolling_by_time():
+    rng = np.random.default_rng(4)
+    n = 300
+    seconds = np.cumsum(rng.integers(0, 40, n))
+    df = pl.DataFrame(
+        {
+            "t": pl.Series(seconds * 1_000_000).cast(pl.Datetime("us")),
+            "a": rng.standard_normal(n),
+        }
+    )
+    res = df.select(
+        zscore=pl.col.a.qt.rolling_zscore("2m", by="t"),
+        rank=pl.col.a.qt.rolling_rank("2m", by="t"),
+    )
+    zscore, rank = [], []
+    for i in range(n):
+        # window (t - 2m, t], equal timestamps are all in the window
+        mask = (seconds > seconds[i] - 120) & (seconds <= seconds[i])
+        window, v = df["a"].to_numpy()[mask], df["a"][i]
+        std = window.std(ddof=1) if len(window) > 1 else np.nan
+        zscore.append((v - window.mean()) / std if std > 0 else None)
+        rank.append(float((window < v).sum() + 0.5 * ((window == v).sum() + 1)))
+    assert_series_equal(
+        res["zscore"], pl.Series("zscore", zscore, pl.Float64), rtol=1e-6
+    )
+    assert_series_equal(res["rank"], pl.Series("rank", rank))
+    with pytest.raises(ValueError, match="invalid duration"):
+        pl.col.a.qt.rolling_zscore("2 minutes", by="t")
+
+
+def test_rolling_by_time_long():
+    # level shifts of 1e5 leave rounding in the Welford state of std, which
+    # is computed again from the window as the series goes on
+    rng = np.random.default_rng(5)
+    n = 50_000
+    seconds = np.cumsum(rng.integers(0, 3, n))
+    level = np.repeat(rng.integers(0, 2, n // 1000) * 1e5, 1000)
+    a = level + rng.standard_normal(n)
+    df = pl.DataFrame(
+        {"t": pl.Series(seconds * 1_000_000).cast(pl.Datetime("us")), "a": a}
+    )
+    res = df.select(pl.col.a.qt.rolling_stats("50s", stats=["std"], by="t"))
+    lo = np.searchsorted(seconds, seconds - 50, side="right")
+    expect = [a[j : i + 1].std(ddof=1) if i > j else None for i, j in enumerate(lo)]
+    assert_series_equal(
+        res.unnest("a")["std"], pl.Series("std", expect, pl.Float64), rtol=1e-5
+    )
+
+
 def test_fdiff():
     df = pl.DataFrame({"a": [7, 4, 2, 5, 1, 2]})
     df = df.with_columns(pl.col.a.qt.fdiff(0.5, 4))
@@ -182,3 +497,14 @@ def test_binary_consecutive_prop():
         pl.Series([0.5, 0, 0.5, 1, 1, 1, 0, 0.5]),
         check_names=False,
     )
+
+
+def test_tick_up_prob():
+    df = pl.DataFrame({"ask": [2.0, 2, 5, 2], "bid": [1.0, 1, 3, 1.5]})
+    res = df.select(
+        pl.col("ask").qt.tick_up_prob("bid").alias("fixed"),
+        pl.col("ask").qt.tick_up_prob("bid", tol=1e-12).alias("adaptive"),
+    )
+    assert res["fixed"][0] == res["fixed"][1]
+    assert abs(res["fixed"][0] - 0.30234727368) < 1e-10
+    assert_allclose(res["adaptive"].to_numpy(), res["fixed"].to_numpy(), atol=1e-9)
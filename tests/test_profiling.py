@@ -0,0 +1,29 @@
+import polars as pl
+
+import polars_qt as pq
+
+
+def test_profiling():
+    df = pl.DataFrame(
+        {
+            "signal": [0, 1, 1, 0, -1, -1, 0, 0],
+            "price": [1.0, 2.0, 3.0, 4.0, 5.0, 4.0, 3.0, 2.0],
+        }
+    )
+    with pq.profiling.profile():
+        df.select(pl.col("price").qt.rolling_zscore(3))
+        df.select(pl.col("price").qt.rolling_zscore(4))
+        df.select(pl.col("signal").qt.calc_future_ret("price", "price"))
+    df.select(pl.col("price").qt.rolling_zscore(3))
+    stats = pq.profiling.stats()
+    assert stats.columns == list(pq.profiling.SCHEMA)
+    assert set(stats["symbol"]) == {"rolling_zscore", "calc_future_ret"}
+    zscore = stats.filter(pl.col("symbol") == "rolling_zscore").row(0, named=True)
+    assert zscore["calls"] == 2
+    assert zscore["rows"] == 16
+    assert zscore["est_output_bytes"] > 0
+    # the Int64 signal is cast to Float64
+    ret = stats.filter(pl.col("symbol") == "calc_future_ret").row(0, named=True)
+    assert ret["casts"] == 1
+    pq.profiling.reset()
+    assert pq.profiling.stats().height == 0
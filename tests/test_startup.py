@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+
+# own import time of polars_qt in microseconds, polars excluded, about 2ms now
+MAX_IMPORT_US = 20_000
+
+
+def import_times(code: str) -> dict[str, int]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(self_us)
+    return times
+
+
+def test_import_time():
+    times = import_times("import polars_qt")
+    submodules = [name for name in times if name.startswith("polars_qt.")]
+    assert submodules == [], "submodules should be imported on first use"
+    assert times["polars_qt"] < MAX_IMPORT_US
+    times = import_times("import polars as pl, polars_qt; pl.col('a').qt")
+    assert "polars_qt.qt" in times
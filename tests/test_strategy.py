@@ -1,7 +1,9 @@
+import numpy as np
 import polars as pl
 from polars.testing import assert_series_equal
 
 import polars_qt
+from polars_qt.utils import _expr_cache
 
 
 def test_boll():
@@ -44,3 +46,114 @@ def test_prob_thres():
     df = df.with_columns(res=pl.col.prob.qt.prob_threshold(**kwargs))
     expect = pl.Series('res', [-1., 1., 2., 2., -1., -2., 0., -1.])
     assert_series_equal(df['res'], expect)
+
+def test_boll_grid():
+    df = pl.DataFrame({
+        'close': [10., 11, 11.9, 10, 11, 12, 10, 11, 12, 13, 14, 10, 7, 5, 4, 3, 4, 4, 3, 2],
+    })
+    windows, open_widths, stop_widths = [3, 4], [0.5, 1.], [0., 0.2]
+    grid = df.select(pl.col('close').qt.boll_grid(windows, open_widths, stop_widths, delay_open=False))['close']
+    assert len(grid.struct.fields) == 8
+    for w in windows:
+        for o in open_widths:
+            for s in stop_widths:
+                expect = df.select(pl.col('close').qt.boll((w, o, s), delay_open=False))['close']
+                assert_series_equal(grid.struct.field(f'{w}_{o}_{s}'), expect, check_names=False)
+    # repeated params are searched once
+    dup = df.select(pl.col('close').qt.boll_grid([3, 4, 3], [0.5, 1., 0.5], stop_widths, delay_open=False))['close']
+    assert_series_equal(dup, grid)
+
+
+def test_boll_time_col():
+    close = [10., 11, 11.9, 10, 11, 12, 10, 11, 12, 13, 14, 10, 7, 5, 4, 3, 4, 4, 3, 2]
+    df = pl.DataFrame({
+        'time': pl.datetime_range(pl.datetime(2024, 1, 1), pl.datetime(2024, 1, 1, 0, 19), '1m', eager=True),
+        'close': close,
+    })
+    # one row per minute, so a window of 4 minutes is a window of 4 rows
+    res = df.select(pl.col('close').qt.boll(('4m', 0.5, 0.2), 2, time_col='time'))['close']
+    expect = df.select(pl.col('close').qt.boll((4, 0.5, 0.2), 2))['close']
+    assert_series_equal(res, expect)
+    grid = df.select(pl.col('close').qt.boll_grid(['3m', '4m'], [0.5, 1.], min_periods=2, time_col='time'))['close']
+    expect = df.select(pl.col('close').qt.boll((3, 1.), 2))['close']
+    assert_series_equal(grid.struct.field('3m_1.0_0.0'), expect, check_names=False)
+    # min_periods counts the rows in the duration window
+    res = df.select(pl.col('close').qt.boll(('4m', 0.5), 4, time_col='time'))['close']
+    expect = df.select(pl.col('close').qt.boll((4, 0.5), 4))['close']
+    assert_series_equal(res, expect)
+    grid = df.select(pl.col('close').qt.boll_grid('4m', 0.5, min_periods=4, time_col='time'))['close']
+    assert_series_equal(grid.struct.field('4m_0.5_0.0'), expect, check_names=False)
+
+
+def test_boll_panel():
+    close = [10., 11, 11.9, 10, 11, 12, 10, 11, 12, 13, 14, 10, 7, 5, 4, 3, 4, 4, 3, 2]
+    df = pl.DataFrame({
+        'symbol': ['a', 'b'] * 20,
+        'close': [v for pair in zip(close, close[::-1]) for v in pair],
+    })
+    df = df.with_columns(pl.col('close').qt.boll((4, 1), by='symbol').alias('panel'))
+    expect = df.select(pl.col('close').qt.boll((4, 1)).over('symbol'))['close']
+    assert_series_equal(df['panel'], expect, check_names=False)
+
+
+def test_expr_cache():
+    e1 = polars_qt.boll('close', (4, 1.), filters=[True, False, 'f', False])
+    e2 = polars_qt.boll('close', (4, 1.), filters=[True, False, 'f', False])
+    assert e1 is e2
+    # kwargs equal in python but of other types
+    assert polars_qt.boll('close', (4, 1)) is not polars_qt.boll('close', (4, 1.))
+    assert polars_qt.boll('close', (4, 1.)) is not polars_qt.boll('close', (5, 1.))
+    # a bare column is keyed by its name
+    assert polars_qt.boll(pl.col('close'), 4) is polars_qt.boll(pl.col('close'), 4)
+    assert polars_qt.boll(pl.col('close'), 4) is polars_qt.boll('close', 4)
+    assert polars_qt.boll(pl.col('open'), 4) is not polars_qt.boll(pl.col('close'), 4)
+    # other expressions are not serialized to a key, they are not cached
+    n = len(_expr_cache)
+    e = pl.col('close') * 2
+    assert polars_qt.boll(e, 4) is not polars_qt.boll(e, 4)
+    polars_qt.boll(pl.lit(pl.Series(np.arange(100_000.))), 4)
+    assert len(_expr_cache) == n
+
+
+def test_boll_panel_scalar_filters():
+    close = [10., 11, 11.9, 10, 11, 12, 10, 11, 12, 13, 14, 10, 7, 5, 4, 3, 4, 4, 3, 2]
+    df = pl.DataFrame({'symbol': ['a', 'b'] * 10, 'close': close})
+    filters = [True, False, False, False]
+    res = df.select(pl.col('close').qt.boll((4, 1), filters=filters, by='symbol'))['close']
+    expect = df.select(pl.col('close').qt.boll((4, 1), filters=filters).over('symbol'))['close']
+    assert_series_equal(res, expect)
+    assert (res >= 0).all()
+
+
+def test_boll_panel_mixed_filters():
+    close = [10., 11, 11.9, 10, 11, 12, 10, 11, 12, 13, 14, 10, 7, 5, 4, 3, 4, 4, 3, 2]
+    df = pl.DataFrame({
+        'symbol': ['a', 'b'] * 10,
+        'close': close,
+        'long_open': [i % 3 != 0 for i in range(20)],
+    })
+    # a column next to scalars, the scalars are broadcast per group
+    for filters in [
+        ['long_open', False, True, False],
+        ['long_open', True, False, True],
+    ]:
+        res = df.select(pl.col('close').qt.boll((4, 1), filters=filters, by='symbol'))['close']
+        expect = df.select(pl.col('close').qt.boll((4, 1), filters=filters).over('symbol'))['close']
+        assert_series_equal(res, expect)
+
+
+def test_boll_scalar_filters():
+    df = pl.DataFrame({
+        'close': [10., 11, 11.9, 10, 11, 12, 10, 11, 12, 13, 14, 10, 7, 5, 4, 3, 4, 4, 3, 2],
+    })
+    base = df.select(pl.col('close').qt.boll((4, 1)))['close']
+    # filters which filter nothing are dropped by the plugin
+    res = df.select(pl.col('close').qt.boll((4, 1), filters=[True, False, True, False]))['close']
+    assert_series_equal(res, base)
+    # the same as a Boolean column of the constant
+    res = df.select(pl.col('close').qt.boll((4, 1), filters=[True, False, False, False]))['close']
+    expect = df.select(pl.col('close').qt.boll((4, 1), filters=[
+        True, False, pl.repeat(False, pl.len()), False
+    ]))['close']
+    assert_series_equal(res, expect)
+    assert (res >= 0).all()
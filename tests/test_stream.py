@@ -0,0 +1,175 @@
+import pickle
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import polars as pl
+from polars.testing import assert_series_equal
+
+import polars_qt
+from polars_qt.stream import (
+    Boll,
+    ProbThreshold,
+    RollingEwm,
+    RollingKurt,
+    RollingRank,
+    RollingSkew,
+    RollingZscore,
+    _SortedList,
+)
+
+
+def test_stream_boll():
+    df = pl.DataFrame(
+        {
+            "close": [
+                10.0,
+                11,
+                11.9,
+                10,
+                11,
+                12,
+                10,
+                None,
+                12,
+                13,
+                14,
+                10,
+                7,
+                5,
+                4,
+                3,
+                4,
+                4,
+                3,
+                2,
+            ],
+            "short_open_filter": [True] * 11 + [False, False] + [True] * 7,
+        }
+    )
+    filters = [True, False, "short_open_filter", False]
+    expect = df.select(pl.col("close").qt.boll((4, 1, 0.3), filters=filters))["close"]
+    strategy = Boll((4, 1, 0.3))
+    fs = [True, False, df["short_open_filter"], False]
+    head = strategy.seed(
+        df["close"][:10], [f if isinstance(f, bool) else f[:10] for f in fs]
+    )
+    # the state survives a pickle round trip
+    strategy = pickle.loads(pickle.dumps(strategy))
+    tail = [
+        strategy.update(
+            df["close"][i], (True, False, df["short_open_filter"][i], False)
+        )
+        for i in range(10, df.height)
+    ]
+    assert head.to_list() + tail == expect.to_list()
+
+
+def test_stream_boll_stop_filters():
+    rng = np.random.default_rng(0)
+    n = 200
+    fac = rng.normal(size=n).round(2)
+    fac[rng.random(n) < 0.05] = np.nan
+    df = pl.DataFrame(
+        {
+            "fac": fac,
+            "long_open": rng.random(n) < 0.8,
+            "long_stop": rng.random(n) < 0.15,
+            "short_open": rng.random(n) < 0.8,
+            "short_stop": rng.random(n) < 0.15,
+        },
+    ).with_columns(pl.col("fac").fill_nan(None))
+    names = ["long_open", "long_stop", "short_open", "short_stop"]
+    for kwargs in [{}, {"delay_open": False}, {"rev": True}, {"zscore": False}]:
+        expect = df.select(
+            pl.col("fac").qt.boll((5, 1.0, 0.2), filters=names, **kwargs)
+        )["fac"]
+        strategy = Boll((5, 1.0, 0.2), **kwargs)
+        out = strategy.update_batch(df["fac"], [df[name] for name in names])
+        assert out.to_list() == expect.to_list(), kwargs
+    # a short stop filter closes a long position as in the batch strategy
+    fac = [0.0] * 8 + [5.0] * 6
+    short_stop = [i == 10 for i in range(len(fac))]
+    df = pl.DataFrame({"fac": fac, "short_stop": short_stop})
+    filters = [True, False, True, "short_stop"]
+    for delay_open in [True, False]:
+        expect = df.select(
+            pl.col("fac").qt.boll(
+                (4, 1.0), filters=filters, zscore=False, delay_open=delay_open
+            )
+        )["fac"]
+        strategy = Boll((4, 1.0), zscore=False, delay_open=delay_open)
+        out = strategy.update_batch(df["fac"], [True, False, True, short_stop])
+        assert out.to_list() == expect.to_list()
+        assert out[10] == 0
+
+
+def test_stream_prob_threshold():
+    s = pl.Series("p", [0.5, 0.7, 0.8, 0.6, 0.3, 0.2, None, 0.55, 0.45, 0.9])
+    expect = s.to_frame().select(
+        pl.col("p").qt.prob_threshold((0.6, 0.5, 0.4, 0.5), 1, 2)
+    )["p"]
+    assert (
+        ProbThreshold((0.6, 0.5, 0.4, 0.5), 1, 2).update_batch(s).to_list()
+        == expect.to_list()
+    )
+
+
+def test_stream_rolling():
+    s = pl.Series("a", [1.0, 3, 2, None, 5, 4, 4, 8, 7, None, 6, 2, 9, 3, 1, 5])
+    df = s.to_frame()
+    for name, state, kwargs in [
+        ("rolling_rank", RollingRank(5, pct=True), {"pct": True}),
+        ("rolling_skew", RollingSkew(5), {}),
+        ("rolling_kurt", RollingKurt(6), {}),
+        ("rolling_zscore", RollingZscore(5), {}),
+        ("rolling_ewm", RollingEwm(5), {}),
+    ]:
+        expect = df.select(getattr(pl.col("a").qt, name)(state.window, **kwargs))["a"]
+        head = state.seed(s[:7])
+        state = pickle.loads(pickle.dumps(state))
+        out = pl.concat(
+            [head, pl.Series("a", [state.update(v) for v in s[7:]], dtype=pl.Float64)]
+        )
+        assert_series_equal(out, expect, check_names=False)
+
+
+def test_stream_min_periods_clamped():
+    s = pl.Series("a", [1.0, 3, 2, 5, 4, 4, 8, 7])
+    # min_periods larger than the window is clamped as in the batch kernels
+    state = RollingZscore(3, min_periods=10)
+    expect = s.to_frame().select(pl.col("a").qt.rolling_zscore(3, min_periods=10))
+    out = state.update_batch(s)
+    assert_series_equal(out, expect["a"], check_names=False)
+    assert out.null_count() == 2
+    # rolling_rank does not clamp it, the output is all null
+    state = RollingRank(3, min_periods=10)
+    expect = s.to_frame().select(pl.col("a").qt.rolling_rank(3, min_periods=10))
+    out = state.update_batch(s)
+    assert_series_equal(out, expect["a"], check_names=False)
+    assert out.null_count() == len(s)
+
+
+def test_stream_sorted_list():
+    # a small load so that buckets are split and merged
+    rng = np.random.default_rng(0)
+    sorted_list, expect = _SortedList(load=4), []
+    for value in rng.integers(0, 20, 2000).astype(float):
+        if expect and rng.random() < 0.5:
+            value = expect[rng.integers(len(expect))]
+            sorted_list.remove(value)
+            expect.remove(value)
+        else:
+            less, equal = sorted_list.add(value)
+            expect.insert(bisect_left(expect, value), value)
+            assert less == bisect_left(expect, value)
+            assert less + equal == bisect_right(expect, value)
+        assert [v for lst in sorted_list.lists for v in lst] == expect
+        assert sorted_list.bisect_right(10.0) == bisect_right(expect, 10.0)
+
+
+def test_stream_ewm_leading_nulls():
+    # min_periods=0 would divide by zero before the first valid value
+    s = pl.Series("a", [None, None, 1.0, 2.0, None, 4.0])
+    expect = s.to_frame().select(pl.col("a").qt.rolling_ewm(1, min_periods=0))["a"]
+    out = RollingEwm(1, min_periods=0).update_batch(s)
+    assert_series_equal(out, expect, check_names=False)